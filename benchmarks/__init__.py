@@ -0,0 +1,20 @@
+"""
+Benchmarks of the ems app on synthetic data. They are scripts, not tests:
+
+    python -m benchmarks.indexes --employees 1000000
+
+Each benchmark works on its own SQLite file, never on db.sqlite3.
+"""
+import os
+
+
+def setup_django(db_path):
+    """ Configure Django with the default database, and its read-only replica, at ``db_path`` """
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'employee.settings')
+    import django
+    from django.conf import settings
+
+    settings.DATABASES['default']['NAME'] = str(db_path)
+    settings.DATABASES['replica']['NAME'] = f'file:{os.path.abspath(db_path)}?mode=ro'
+    settings.DEBUG = False
+    django.setup()
@@ -0,0 +1,400 @@
+"""
+Latency, throughput and query counts of every route of ems/urls.py and the admin.
+
+    python -m benchmarks.datagen large.sqlite3 --scale large
+    python -m benchmarks.api --database large.sqlite3 --json run.json
+    python -m benchmarks.compare baseline.json run.json
+
+Requests go through Django's test client in process, so the numbers are
+the cost of the application and the database without a network or a
+server. Every route is requested ``--iterations`` times with random ids.
+Writes run inside a transaction that is rolled back after each request,
+so the dataset stays the same across routes and runs. With
+``--concurrency N`` the read routes are also run from N threads at once
+to measure throughput. Routes marked slow, which take minutes per
+request, only run with ``--slow``.
+
+The response cache is switched off unless ``--cache`` is given, otherwise
+repeated requests would only measure cache hits.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from benchmarks import datagen, setup_django
+
+ADMIN_USERNAME = 'benchmark-admin'
+# Not counted as queries of a request
+TRANSACTION_SQL = ('BEGIN', 'SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK TO SAVEPOINT')
+
+
+class Route:
+    """
+    One benchmarked request. ``build(ctx, rng)`` returns the path and, for
+    writes, the JSON payload; it runs untimed inside the write transaction,
+    so it may create the rows the request needs.
+    """
+
+    def __init__(self, name, method, build, write=False, admin=False, max_iterations=None, slow=False):
+        self.name = name
+        self.method = method
+        self.build = build
+        self.write = write
+        self.admin = admin
+        self.max_iterations = max_iterations
+        # Only run with --slow
+        self.slow = slow
+
+
+def routes():
+    from django.contrib.auth.models import User
+    from django.urls import reverse
+    from ems import jobs
+    from ems.models import Company, Department, Employee
+
+    def url(name, **kwargs):
+        return lambda ctx, rng: (reverse(name, kwargs=kwargs), None)
+
+    def query(name, params):
+        return lambda ctx, rng: (reverse(name) + '?' + params(ctx, rng), None)
+
+    def detail(name, key):
+        return lambda ctx, rng: (reverse(name, kwargs={'pk': rng.choice(ctx[key])}), None)
+
+    def new_company(ctx, rng):
+        return Company.objects.create(name=f'Benchmark {rng.random()}')
+
+    def new_department(ctx, rng):
+        return Department.objects.create(name=f'Benchmark {rng.random()}', company_id=rng.choice(ctx['companies']))
+
+    def new_user(ctx, rng):
+        return User.objects.create_user(username=f'benchmark{rng.random()}')
+
+    def new_employee(ctx, rng):
+        employee = Employee.objects.create(user=new_user(ctx, rng), designation='Jr')
+        employee.department.add(rng.choice(ctx['departments']))
+        return employee
+
+    def new_job(ctx, rng):
+        return jobs.submit('ems.rebuild_headcount')
+
+    def write(name, payload, obj=None):
+        def build(ctx, rng):
+            kwargs = {'pk': obj(ctx, rng).pk} if obj else {}
+            return reverse(name, kwargs=kwargs), payload(ctx, rng)
+        return build
+
+    def employee_payload(ctx, rng):
+        return {'user': new_user(ctx, rng).pk, 'department': [rng.choice(ctx['departments'])], 'designation': 'Jr'}
+
+    def bulk_employees(ctx, rng):
+        return [
+            {'user': {'username': f'benchmark{rng.random()}'}, 'department': [rng.choice(ctx['departments'])],
+             'designation': 'Jr'}
+            for _ in range(100)
+        ]
+
+    def bulk_update(key, values):
+        return lambda ctx, rng: [{'id': pk, **values} for pk in rng.sample(ctx[key], min(100, len(ctx[key])))]
+
+    def bulk_delete(create):
+        return lambda ctx, rng: [create(ctx, rng).pk for _ in range(100)]
+
+    return [
+        Route('api-root', 'get', url('api-root')),
+        Route('company-list', 'get', url('company-list')),
+        Route('company-list ordered by name', 'get', query('company-list', lambda ctx, rng: 'ordering=name')),
+        Route('company-detail', 'get', detail('company-detail', 'companies')),
+        Route('department-list', 'get', url('department-list')),
+        Route('department-list expanded', 'get', query('department-list', lambda ctx, rng: 'expand=company')),
+        Route('department-detail', 'get', detail('department-detail', 'departments')),
+        Route('employee-list', 'get', url('employee-list')),
+        Route('employee-list expanded', 'get', query('employee-list', lambda ctx, rng: 'expand=company')),
+        Route('employee-list ordered by designation', 'get',
+              query('employee-list', lambda ctx, rng: 'ordering=designation')),
+        Route('employee-list by company', 'get',
+              query('employee-list', lambda ctx, rng: f'company={rng.choice(ctx["companies"])}')),
+        Route('employee-list by department', 'get',
+              query('employee-list', lambda ctx, rng: f'department={rng.choice(ctx["departments"])}')),
+        Route('employee-list by designation', 'get',
+              query('employee-list', lambda ctx, rng: f'designation={rng.choice(ctx["designations"])}')),
+        Route('employee-list search', 'get',
+              query('employee-list', lambda ctx, rng: f'q={rng.choice(datagen.LAST_NAMES)[:3]}')),
+        Route('employee-detail', 'get', detail('employee-detail', 'employees')),
+        Route('employee-export ndjson', 'get', url('employee-export'), max_iterations=3),
+        Route('employee-export csv', 'get', query('employee-export', lambda ctx, rng: 'format=csv'),
+              max_iterations=3),
+        Route('company-tree', 'get', url('company-tree'), max_iterations=3),
+        Route('company-tree ndjson', 'get', query('company-tree', lambda ctx, rng: 'format=ndjson'), max_iterations=3),
+        Route('company-detail-tree', 'get', detail('company-detail-tree', 'companies')),
+        Route('user-list', 'get', url('user-list')),
+        Route('user-detail', 'get', detail('user-detail', 'users')),
+        Route('headcount', 'get', url('headcount')),
+        Route('headcount by company', 'get',
+              query('headcount', lambda ctx, rng: f'company={rng.choice(ctx["companies"])}')),
+        Route('headcount by department', 'get',
+              query('headcount', lambda ctx, rng: f'department={rng.choice(ctx["departments"])}')),
+        Route('job-list', 'get', url('job-list')),
+        Route('job-detail', 'get', write('job-detail', lambda ctx, rng: None, new_job)),
+        Route('cache-stats', 'get', url('cache-stats')),
+        Route('metrics', 'get', url('metrics')),
+
+        Route('company-create', 'post', write('company-list', lambda ctx, rng: {'name': f'Benchmark {rng.random()}'}),
+              write=True),
+        Route('company-update', 'patch', write('company-detail', lambda ctx, rng: {'name': 'Benchmark'}, new_company),
+              write=True),
+        Route('company-delete', 'delete', write('company-detail', lambda ctx, rng: None, new_company), write=True),
+        Route('company-delete async', 'delete', lambda ctx, rng: (
+            reverse('company-detail', kwargs={'pk': new_company(ctx, rng).pk}) + '?async=true', None,
+        ), write=True),
+        Route('department-create', 'post', write('department-list', lambda ctx, rng: {
+            'name': f'Benchmark {rng.random()}', 'company': rng.choice(ctx['companies']),
+        }), write=True),
+        Route('department-update', 'patch',
+              write('department-detail', lambda ctx, rng: {'name': f'Benchmark {rng.random()}'}, new_department),
+              write=True),
+        Route('department-delete', 'delete', write('department-detail', lambda ctx, rng: None, new_department),
+              write=True),
+        Route('employee-create', 'post', write('employee-list', employee_payload), write=True),
+        Route('employee-update', 'patch',
+              write('employee-detail', lambda ctx, rng: {'designation': 'Sr'}, new_employee), write=True),
+        Route('employee-delete', 'delete', write('employee-detail', lambda ctx, rng: None, new_employee), write=True),
+        Route('user-create', 'post', write('user-list', lambda ctx, rng: {'username': f'benchmark{rng.random()}'}),
+              write=True),
+        Route('user-update', 'patch', write('user-detail', lambda ctx, rng: {'first_name': 'Benchmark'}, new_user),
+              write=True),
+        Route('user-delete', 'delete', write('user-detail', lambda ctx, rng: None, new_user), write=True),
+        Route('company-bulk create 100', 'post', write('company-bulk', lambda ctx, rng: [
+            {'name': f'Benchmark {rng.random()}'} for _ in range(100)
+        ]), write=True),
+        Route('company-bulk update 100', 'patch', write('company-bulk', bulk_update('companies', {})), write=True),
+        Route('company-bulk delete 100', 'delete', write('company-bulk', bulk_delete(new_company)), write=True),
+        Route('department-bulk update 100', 'patch',
+              write('department-bulk', bulk_update('departments', {})), write=True),
+        Route('employee-bulk create 100', 'post', write('employee-bulk', bulk_employees), write=True),
+        Route('employee-bulk update 100', 'patch',
+              write('employee-bulk', bulk_update('employees', {'designation': 'Sr'})), write=True),
+        Route('employee-bulk delete 100', 'delete', write('employee-bulk', bulk_delete(new_employee)), write=True),
+
+        Route('admin employee changelist', 'get', url('admin:ems_employee_changelist'), admin=True),
+        Route('admin company changelist', 'get', url('admin:ems_company_changelist'), admin=True),
+        Route('admin user changelist', 'get', url('admin:auth_user_changelist'), admin=True),
+        Route('admin employee change', 'get', lambda ctx, rng: (
+            reverse('admin:ems_employee_change', args=[rng.choice(ctx['employees'])]), None,
+        ), admin=True),
+        Route('admin company change', 'get', lambda ctx, rng: (
+            reverse('admin:ems_company_change', args=[rng.choice(ctx['companies'])]), None,
+        ), admin=True),
+    ]
+
+
+def context():
+    """ Ids the routes pick from """
+    from django.contrib.auth.models import User
+    from ems.models import Company, Department, Employee
+
+    def sample(model):
+        return list(model.objects.order_by('?').values_list('id', flat=True)[:1000])
+
+    return {
+        'companies': sample(Company),
+        'departments': sample(Department),
+        'employees': sample(Employee),
+        'users': sample(User),
+        'designations': [code for code, _ in Employee.DESIGNATIONS],
+    }
+
+
+def make_client(admin):
+    from django.contrib.auth.models import User
+    from django.test import Client
+
+    client = Client()
+    if admin:
+        client.force_login(User.objects.get(username=ADMIN_USERNAME))
+    return client
+
+
+def request(client, route, ctx, rng, queries=None):
+    """
+    Send one request of ``route``, returning (seconds, response, body size).
+    The SQL of the request, not of its setup, is appended to ``queries``.
+    """
+    from django.db import connection, transaction
+    from django.test.utils import CaptureQueriesContext
+
+    with transaction.atomic():
+        path, payload = route.build(ctx, rng)
+        kwargs = {'data': json.dumps(payload), 'content_type': 'application/json'} if payload is not None else {}
+        with CaptureQueriesContext(connection) as captured:
+            started = time.perf_counter()
+            response = getattr(client, route.method)(path, **kwargs)
+            size = len(b''.join(response.streaming_content) if response.streaming else response.content)
+            elapsed = time.perf_counter() - started
+        if queries is not None:
+            queries.extend(q['sql'] for q in captured.captured_queries)
+        # Reads roll back too, they have nothing to keep
+        transaction.set_rollback(True)
+    return elapsed, response, size
+
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def measure(route, ctx, iterations, concurrency, seed):
+    rng = random.Random(f'{seed}-{route.name}')
+    client = make_client(route.admin)
+    iterations = min(iterations, route.max_iterations or iterations)
+
+    # Warm up, and count the queries of one request
+    queries = []
+    request(client, route, ctx, rng, queries)
+    query_count = sum(1 for sql in queries if not sql.startswith(TRANSACTION_SQL))
+
+    timings = []
+    for _ in range(iterations):
+        elapsed, response, size = request(client, route, ctx, rng)
+        timings.append(elapsed * 1000)
+    timings.sort()
+
+    result = {
+        'method': route.method.upper(),
+        'status': response.status_code,
+        'iterations': iterations,
+        'queries': query_count,
+        'bytes': size,
+        'min_ms': timings[0],
+        'mean_ms': statistics.mean(timings),
+        'p50_ms': percentile(timings, 0.5),
+        'p90_ms': percentile(timings, 0.9),
+        'p95_ms': percentile(timings, 0.95),
+        'p99_ms': percentile(timings, 0.99),
+        'max_ms': timings[-1],
+        'throughput_rps': iterations / (sum(timings) / 1000),
+    }
+    if concurrency > 1 and not route.write:
+        result['concurrent_throughput_rps'] = measure_concurrent(route, ctx, iterations, concurrency, seed)
+    return result
+
+
+def measure_concurrent(route, ctx, iterations, concurrency, seed):
+    from django.db import connection
+
+    def worker(index):
+        rng = random.Random(f'{seed}-{route.name}-{index}')
+        client = make_client(route.admin)
+        try:
+            for _ in range(iterations):
+                request(client, route, ctx, rng)
+        finally:
+            connection.close()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(worker, range(concurrency)))
+    return iterations * concurrency / (time.perf_counter() - started)
+
+
+def environment():
+    import django
+    import rest_framework
+
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'djangorestframework': rest_framework.VERSION,
+        'sqlite': sqlite3.sqlite_version,
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--database', metavar='PATH',
+                        help='SQLite file made by benchmarks.datagen; generated here if missing. '
+                             'Defaults to a temporary file.')
+    datagen.add_scale_arguments(parser, default='small')
+    parser.add_argument('--iterations', type=int, default=50, help='Requests per route (default: 50)')
+    parser.add_argument('--concurrency', type=int, default=1, help='Threads for the throughput runs of reads')
+    parser.add_argument('--cache', action='store_true', help='Keep the response cache on')
+    parser.add_argument('--only', metavar='TEXT', help='Only run routes whose name contains TEXT')
+    parser.add_argument('--slow', action='store_true', help='Also run routes that take minutes per request')
+    parser.add_argument('--json', metavar='PATH', help='Write the results as JSON')
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.TemporaryDirectory()
+    database = args.database or os.path.join(workdir.name, 'bench.sqlite3')
+    generate = not os.path.exists(database)
+    setup_django(database)
+
+    from django.conf import settings
+    from django.contrib.auth.models import User
+    from django.core.management import call_command
+    from django.db import connection
+    from ems import cache
+
+    settings.ALLOWED_HOSTS = ['testserver']
+    call_command('migrate', verbosity=0)
+    if generate:
+        datagen.generate(seed=args.seed, **datagen.scale_from_args(args))
+    connection.cursor().execute('ANALYZE')
+    if not User.objects.filter(username=ADMIN_USERNAME).exists():
+        User.objects.create_superuser(ADMIN_USERNAME, '', None)
+    if not args.cache:
+        cache.responses.max_entries = 0
+
+    from ems.models import Company, Department, Employee
+    scale = {
+        'companies': Company.objects.count(),
+        'departments': Department.objects.count(),
+        'employees': Employee.objects.count(),
+    }
+    ctx = context()
+
+    results = {}
+    print(f'{"route":40} {"status":>6} {"queries":>7} {"p50":>9} {"p95":>9} {"p99":>9} {"req/s":>8}')
+    for route in routes():
+        if (args.only and args.only not in route.name) or (route.slow and not args.slow):
+            continue
+        result = results[route.name] = measure(route, ctx, args.iterations, args.concurrency, args.seed)
+        print(f'{route.name:40} {result["status"]:>6} {result["queries"]:>7} {result["p50_ms"]:7.2f}ms '
+              f'{result["p95_ms"]:7.2f}ms {result["p99_ms"]:7.2f}ms {result["throughput_rps"]:8.1f}')
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({
+                'timestamp': datetime.now(timezone.utc).isoformat(),
+                'environment': environment(),
+                'scale': scale,
+                'options': {
+                    'iterations': args.iterations,
+                    'concurrency': args.concurrency,
+                    'cache': args.cache,
+                    'seed': args.seed,
+                },
+                'routes': results,
+            }, f, indent=2)
+    workdir.cleanup()
+
+
+if __name__ == '__main__':
+    main()
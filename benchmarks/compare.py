@@ -0,0 +1,63 @@
+"""
+Compare two result files of benchmarks.api and report regressions.
+
+    python -m benchmarks.compare baseline.json run.json --threshold 0.2
+
+A route regresses when it runs more queries than before, or when its
+median latency grew by more than the threshold (a fraction) and by more
+than ``--min-ms``, which keeps sub-millisecond noise out. The exit status
+is 1 when any route regressed, so the comparison can gate a CI job.
+"""
+import argparse
+import json
+import sys
+
+
+def compare(baseline, current, threshold, min_ms):
+    """ Yield (route, before, after, regressions) for routes present in both runs """
+    for name, after in current['routes'].items():
+        before = baseline['routes'].get(name)
+        if before is None:
+            continue
+        regressions = []
+        if after['queries'] > before['queries']:
+            regressions.append(f'queries {before["queries"]} -> {after["queries"]}')
+        grown = after['p50_ms'] - before['p50_ms']
+        if grown > min_ms and after['p50_ms'] > before['p50_ms'] * (1 + threshold):
+            regressions.append(f'p50 {before["p50_ms"]:.2f}ms -> {after["p50_ms"]:.2f}ms')
+        yield name, before, after, regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('baseline')
+    parser.add_argument('current')
+    parser.add_argument('--threshold', type=float, default=0.2, help='Allowed relative p50 growth (default: 0.2)')
+    parser.add_argument('--min-ms', type=float, default=1.0, help='Ignore p50 growth below this (default: 1.0)')
+    args = parser.parse_args(argv)
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    if baseline.get('scale') != current.get('scale'):
+        print(f'Warning: scales differ, {baseline.get("scale")} vs {current.get("scale")}')
+
+    regressed = 0
+    print(f'{"route":40} {"queries":>9} {"p50 before":>11} {"p50 after":>10} {"change":>8}')
+    for name, before, after, regressions in compare(baseline, current, args.threshold, args.min_ms):
+        change = after['p50_ms'] / before['p50_ms'] - 1 if before['p50_ms'] else 0
+        queries = f'{before["queries"]}->{after["queries"]}' if before['queries'] != after['queries'] else before['queries']
+        print(f'{name:40} {queries:>9} {before["p50_ms"]:9.2f}ms {after["p50_ms"]:8.2f}ms {change:+8.0%}'
+              + ('  REGRESSION: ' + ', '.join(regressions) if regressions else ''))
+        regressed += bool(regressions)
+
+    missing = sorted(set(baseline['routes']) - set(current['routes']))
+    if missing:
+        print('Not in the current run: ' + ', '.join(missing))
+    print(f'{regressed} regressed route(s)')
+    return 1 if regressed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,162 @@
+"""
+Concurrent readers and writers in several processes on one SQLite file,
+with and without the connection profile of ems.sqlite.
+
+    python -m benchmarks.datagen medium.sqlite3 --scale medium
+    python -m benchmarks.contention --database medium.sqlite3 --workers 8 --json contention.json
+
+Each of ``--workers`` processes, as the workers of a gunicorn server, sends
+requests through Django's test client for ``--seconds``. A ``--writes``
+share of them PATCH the designation of a random employee, a transaction
+that also moves headcount counters; the others GET employee details with
+the response cache off. Every mode runs on its own copy of the database:
+
+    default   the rollback journal, no pragmas, writes as before
+    profile   the pragmas of settings.EMS_SQLITE, immediate and retried writes
+
+Reported per mode are the requests per second, the failed requests (a 500
+for "database is locked") and the latency percentiles of reads and writes.
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from benchmarks import datagen, setup_django
+from benchmarks.api import environment, percentile
+
+MODES = {
+    'default': {'journal_mode': 'delete', 'profile': False},
+    'profile': {'journal_mode': 'wal', 'profile': True},
+}
+# Seconds for the workers to set up Django before they all start
+STARTUP = 5
+
+
+def worker(args):
+    """ Send requests until the deadline, returning (kind, ms, status) per request """
+    database, mode, employees, writes, start, seconds, seed = args
+    setup_django(database)
+    from django.conf import settings
+    from django.test import Client
+    from ems import cache, sqlite
+
+    settings.ALLOWED_HOSTS = ['testserver']
+    if not MODES[mode]['profile']:
+        # Write requests as before: deferred transactions, never retried
+        settings.EMS_SQLITE = {'PRAGMAS': {}}
+        sqlite.retry_on_lock = lambda func, *args, using=None, **kwargs: func(*args, **kwargs)
+    cache.responses.max_entries = 0
+    # Failed requests are counted, not logged
+    logging.disable(logging.CRITICAL)
+
+    rng = random.Random(seed)
+    client = Client(raise_request_exception=False)
+    results = []
+    time.sleep(max(0, start - time.time()))
+    while time.time() < start + seconds:
+        url = f'/api/employee/{rng.choice(employees)}/'
+        started = time.perf_counter()
+        if rng.random() < writes:
+            kind = 'write'
+            response = client.patch(url, json.dumps({'designation': rng.choice(['Jr', 'As', 'Sr', 'Mg'])}),
+                                    content_type='application/json')
+        else:
+            kind = 'read'
+            response = client.get(url)
+        results.append((kind, (time.perf_counter() - started) * 1000, response.status_code))
+    return results
+
+
+def summarize(results, seconds):
+    summary = {'throughput_rps': len(results) / seconds}
+    for kind in ['read', 'write']:
+        timings = sorted(ms for k, ms, _ in results if k == kind)
+        failed = sum(1 for k, _, status in results if k == kind and status >= 500)
+        summary[kind] = {
+            'requests': len(timings),
+            'failed': failed,
+            'p50_ms': percentile(timings, 0.5) if timings else None,
+            'p99_ms': percentile(timings, 0.99) if timings else None,
+            'max_ms': timings[-1] if timings else None,
+        }
+    return summary
+
+
+def run(workdir, mode, employees, args):
+    path = os.path.join(workdir, f'{mode}.sqlite3')
+    shutil.copy(args.database_file, path)
+    db = sqlite3.connect(path)
+    db.execute(f'PRAGMA journal_mode = {MODES[mode]["journal_mode"]}')
+    db.close()
+
+    # Fresh interpreters, like separate server workers, all starting at once once set up
+    start = time.time() + STARTUP
+    jobs = [(path, mode, employees, args.writes, start, args.seconds, f'{args.seed}-{index}')
+            for index in range(args.workers)]
+    with multiprocessing.get_context('spawn').Pool(args.workers) as pool:
+        results = [result for chunk in pool.map(worker, jobs) for result in chunk]
+    return summarize(results, args.seconds)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--database', metavar='PATH',
+                        help='SQLite file made by benchmarks.datagen; generated here if missing. '
+                             'Defaults to a temporary file. It is copied, never written.')
+    datagen.add_scale_arguments(parser, default='small')
+    parser.add_argument('--workers', type=int, default=8, help='Processes sending requests (default: 8)')
+    parser.add_argument('--seconds', type=float, default=10, help='Duration of each mode (default: 10)')
+    parser.add_argument('--writes', type=float, default=0.2, help='Share of writes (default: 0.2)')
+    parser.add_argument('--json', metavar='PATH', help='Write the results as JSON')
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.TemporaryDirectory()
+    args.database_file = args.database or os.path.join(workdir.name, 'bench.sqlite3')
+    generate = not os.path.exists(args.database_file)
+    setup_django(args.database_file)
+
+    from django.core.management import call_command
+    from ems.models import Employee
+
+    call_command('migrate', verbosity=0)
+    if generate:
+        datagen.generate(seed=args.seed, **datagen.scale_from_args(args))
+    employees = list(Employee.objects.order_by('?').values_list('id', flat=True)[:1000])
+
+    results = {}
+    print(f'{"mode":8} {"req/s":>8} {"reads":>7} {"failed":>6} {"p50":>9} {"p99":>9} '
+          f'{"writes":>7} {"failed":>6} {"p50":>9} {"p99":>9}')
+    for mode in MODES:
+        result = results[mode] = run(workdir.name, mode, employees, args)
+        line = f'{mode:8} {result["throughput_rps"]:8.1f}'
+        for kind in ['read', 'write']:
+            r = result[kind]
+            line += f' {r["requests"]:>7} {r["failed"]:>6} {r["p50_ms"] or 0:7.2f}ms {r["p99_ms"] or 0:7.2f}ms'
+        print(line)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({
+                'timestamp': datetime.now(timezone.utc).isoformat(),
+                'environment': environment(),
+                'options': {
+                    'workers': args.workers,
+                    'seconds': args.seconds,
+                    'writes': args.writes,
+                    'seed': args.seed,
+                },
+                'modes': results,
+            }, f, indent=2)
+    workdir.cleanup()
+
+
+if __name__ == '__main__':
+    main()
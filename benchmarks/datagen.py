@@ -0,0 +1,130 @@
+"""
+Synthetic organisations for the benchmarks.
+
+    python -m benchmarks.datagen bench.sqlite3 --scale large
+    python -m benchmarks.datagen bench.sqlite3 --companies 20 --employees 5000
+
+Rows are written with executemany() in a single transaction, which loads
+a million employees in about a minute, then counted into the headcount
+counters of ems.headcount. The data is
+deterministic for a given scale and ``--seed``: departments are spread
+evenly over companies, and every employee is a member of one to three
+departments of a single company.
+"""
+import argparse
+import os
+import random
+import time
+from itertools import islice
+
+from benchmarks import setup_django
+
+BATCH_SIZE = 50000
+# companies, departments, employees
+SCALES = {
+    'small': (10, 100, 10000),
+    'medium': (100, 10000, 100000),
+    'large': (100, 10000, 1000000),
+}
+DEPARTMENT_NAMES = [
+    'Engineering', 'Quality Assurance', 'Sales', 'Marketing', 'Finance',
+    'Payroll', 'Support', 'Operations', 'Legal', 'Research',
+]
+FIRST_NAMES = ['Anil', 'Tathya', 'Maria', 'John', 'Wei', 'Fatima', 'Olga', 'Kofi', 'Sara', 'Diego']
+LAST_NAMES = ['Shah', 'Patel', 'Garcia', 'Smith', 'Chen', 'Khan', 'Ivanova', 'Mensah', 'Cohen', 'Lopez']
+
+
+def department_name(index):
+    return f'{DEPARTMENT_NAMES[index % len(DEPARTMENT_NAMES)]} {index // len(DEPARTMENT_NAMES) + 1}'
+
+
+def _insert(cursor, table, columns, rows):
+    sql = 'INSERT INTO {} ({}) VALUES ({})'.format(table, ', '.join(columns), ', '.join(['%s'] * len(columns)))
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, BATCH_SIZE))
+        if not batch:
+            return
+        cursor.executemany(sql, batch)
+
+
+def generate(companies=100, departments=10000, employees=100000, seed=0, log=print, headcount=True):
+    """ Fill the empty ems tables of the default database, and with ``headcount`` its counters """
+    from django.db import connection, transaction
+    from ems import headcount as counters
+    from ems.models import Employee
+
+    rng = random.Random(seed)
+    designations = [code for code, _ in Employee.DESIGNATIONS]
+    # Departments of company c are c, c + companies, c + 2 * companies, ...
+    per_company = [list(range(c, departments, companies)) for c in range(companies)]
+
+    started = time.monotonic()
+    with transaction.atomic(), connection.cursor() as cursor:
+        _insert(cursor, 'ems_company', ['id', 'name'], (
+            (c + 1, f'Company {c + 1}') for c in range(companies)
+        ))
+        _insert(cursor, 'ems_department', ['id', 'name', 'company_id'], (
+            (d + 1, department_name(d // companies), d % companies + 1) for d in range(departments)
+        ))
+        _insert(
+            cursor, 'auth_user',
+            ['id', 'username', 'first_name', 'last_name', 'email', 'password',
+             'is_superuser', 'is_staff', 'is_active', 'date_joined'],
+            (
+                (e + 1, f'user{e + 1}', rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES), '',
+                 '!', False, False, True, '2020-01-01 00:00:00')
+                for e in range(employees)
+            ),
+        )
+        _insert(cursor, 'ems_employee', ['id', 'user_id', 'designation'], (
+            (e + 1, e + 1, rng.choice(designations)) for e in range(employees)
+        ))
+
+        def memberships():
+            for e in range(employees):
+                company = per_company[rng.randrange(companies)]
+                for d in rng.sample(company, min(len(company), rng.randint(1, 3))):
+                    yield e + 1, d + 1
+
+        _insert(cursor, 'ems_employee_department', ['employee_id', 'department_id'], memberships())
+        # The inserts above send no signals to count them as they go
+        if headcount:
+            counters.rebuild()
+    log(f'Generated {companies} companies, {departments} departments and {employees} employees '
+        f'in {time.monotonic() - started:.1f}s')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('database', help='SQLite file to create, must not exist')
+    add_scale_arguments(parser)
+    args = parser.parse_args(argv)
+    if os.path.exists(args.database):
+        parser.error(f'{args.database} already exists')
+
+    setup_django(args.database)
+    from django.core.management import call_command
+    call_command('migrate', verbosity=0)
+    generate(seed=args.seed, **scale_from_args(args))
+
+
+def add_scale_arguments(parser, default='medium'):
+    parser.add_argument('--scale', choices=SCALES, default=default, help=f'Preset sizes (default: {default})')
+    parser.add_argument('--companies', type=int, help='Override the number of companies of the scale')
+    parser.add_argument('--departments', type=int, help='Override the number of departments of the scale')
+    parser.add_argument('--employees', type=int, help='Override the number of employees of the scale')
+    parser.add_argument('--seed', type=int, default=0)
+
+
+def scale_from_args(args):
+    companies, departments, employees = SCALES[args.scale]
+    return {
+        'companies': args.companies or companies,
+        'departments': args.departments or departments,
+        'employees': args.employees or employees,
+    }
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+"""
+Before/after benchmark of migration ems 0002 (indexes and constraints).
+
+    python -m benchmarks.indexes --employees 1000000 --json indexes.json
+
+Builds a synthetic dataset at schema 0001, times the filter and lookup
+queries of the API, applies 0002 and times them again.
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from benchmarks import datagen, setup_django
+
+# The columns of schema 0001, which has no ``version`` yet (0004)
+COMPANY_COLUMNS = ['id', 'name']
+DEPARTMENT_COLUMNS = ['id', 'name', 'company_id']
+EMPLOYEE_COLUMNS = ['id', 'user_id', 'designation']
+
+
+def queries():
+    from django.db.models import Q
+    from ems.models import Company, Department, Employee
+
+    return {
+        'employees of a department': lambda p: list(
+            Employee.objects.filter(department=p['department']).order_by('id').values_list('id', flat=True)[:100]
+        ),
+        'headcount of a department': lambda p: Employee.objects.filter(department=p['department']).count(),
+        'headcount of a company': lambda p: Employee.objects.filter(
+            department__company_id=p['company'],
+        ).values('id').distinct().count(),
+        'departments of a company by name': lambda p: list(
+            Department.objects.filter(company_id=p['company']).order_by('name', 'id').values_list(
+                *DEPARTMENT_COLUMNS
+            )[:100]
+        ),
+        'department by company and name': lambda p: Department.objects.filter(
+            company_id=p['company'], name=p['department_name'],
+        ).values_list(*DEPARTMENT_COLUMNS).first(),
+        'employees by designation': lambda p: list(
+            Employee.objects.filter(designation=p['designation'], id__gt=p['employee']).order_by('id').values_list(
+                *EMPLOYEE_COLUMNS
+            )[:100]
+        ),
+        'employee page ordered by designation': lambda p: list(
+            Employee.objects.filter(
+                Q(designation__gt=p['designation']) | Q(designation=p['designation'], id__gt=p['employee'])
+            ).order_by('designation', 'id').values_list(*EMPLOYEE_COLUMNS)[:100]
+        ),
+        'company by name': lambda p: Company.objects.filter(name=p['company_name']).values_list(
+            *COMPANY_COLUMNS
+        ).first(),
+    }
+
+
+def measure(scale, iterations, seed):
+    from ems.models import Employee
+
+    rng = random.Random(seed)
+    designations = [code for code, _ in Employee.DESIGNATIONS]
+    params = []
+    for _ in range(iterations):
+        company = rng.randrange(scale['companies'])
+        index = rng.randrange(max(scale['departments'] // scale['companies'], 1))
+        params.append({
+            'company': company + 1,
+            'company_name': f'Company {company + 1}',
+            'department': rng.randrange(scale['departments']) + 1,
+            'department_name': datagen.department_name(index),
+            'designation': rng.choice(designations),
+            'employee': rng.randrange(scale['employees']),
+        })
+
+    results = {}
+    for name, query in queries().items():
+        query(params[0])  # warm the page cache
+        timings = []
+        for p in params:
+            started = time.perf_counter()
+            query(p)
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        results[name] = {
+            'median_ms': statistics.median(timings),
+            'p95_ms': timings[int(len(timings) * 0.95) - 1],
+        }
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    datagen.add_scale_arguments(parser)
+    parser.add_argument('--iterations', type=int, default=200, help='Runs per query (default: 200)')
+    parser.add_argument('--json', metavar='PATH', help='Also write the results as JSON')
+    args = parser.parse_args(argv)
+    scale = datagen.scale_from_args(args)
+
+    workdir = tempfile.TemporaryDirectory()
+    setup_django(os.path.join(workdir.name, 'bench.sqlite3'))
+    from django.core.management import call_command
+    from django.db import connection
+
+    call_command('migrate', verbosity=0)
+    call_command('migrate', 'ems', '0001', verbosity=0)
+    # Schema 0001 has no headcount table yet
+    datagen.generate(seed=args.seed, headcount=False, **scale)
+    connection.cursor().execute('ANALYZE')
+    before = measure(scale, args.iterations, args.seed)
+
+    started = time.monotonic()
+    call_command('migrate', 'ems', '0002', verbosity=0)
+    migrate_seconds = time.monotonic() - started
+    connection.cursor().execute('ANALYZE')
+    after = measure(scale, args.iterations, args.seed)
+
+    print(f'Migration 0002 took {migrate_seconds:.1f}s\n')
+    print(f'{"query":40} {"before p50":>11} {"after p50":>10} {"before p95":>11} {"after p95":>10} {"speedup":>8}')
+    for name in before:
+        b, a = before[name], after[name]
+        print(f'{name:40} {b["median_ms"]:9.2f}ms {a["median_ms"]:8.2f}ms '
+              f'{b["p95_ms"]:9.2f}ms {a["p95_ms"]:8.2f}ms {b["median_ms"] / a["median_ms"]:7.1f}x')
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({
+                'scale': scale,
+                'iterations': args.iterations,
+                'migrate_seconds': migrate_seconds,
+                'before': before,
+                'after': after,
+            }, f, indent=2)
+    workdir.cleanup()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,255 @@
+"""
+Throughput of the read endpoints under WSGI and under ASGI at high concurrency.
+
+    python -m benchmarks.datagen medium.sqlite3 --scale medium
+    python -m benchmarks.servers --database medium.sqlite3 --concurrency 64 --json servers.json
+
+Both handlers are driven in process, without a network or a server: WSGI
+requests run on ``--concurrency`` threads, as a threaded WSGI server runs
+them, and ASGI requests as as many tasks on one event loop, as an ASGI
+server runs them. The ASGI handler is ems.asgi's, with ``--threads``
+executor threads. Each workload sends ``--requests`` requests:
+
+    cached list       one employee list page, a response cache hit
+    not modified      conditional GETs of employee details, answered with 304
+    uncached detail   employee details with the response cache off
+    uncached list     employee lists of a company with the response cache off
+    headcount         the stored headcount of a company
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from benchmarks import datagen, setup_django
+from benchmarks.api import environment, percentile
+
+HOST = 'testserver'
+
+
+class Workload:
+    """
+    ``build(ctx, rng)`` returns the path and extra headers of one request.
+    ``cache`` keeps the response cache on while it runs.
+    """
+
+    def __init__(self, name, build, cache=False, expected=200):
+        self.name = name
+        self.build = build
+        self.cache = cache
+        self.expected = expected
+
+
+def workloads():
+    from django.urls import reverse
+
+    def employee_detail(ctx, rng):
+        return reverse('employee-detail', kwargs={'pk': rng.choice(ctx['employees'])}), {}
+
+    def not_modified(ctx, rng):
+        pk = rng.choice(ctx['employees'])
+        return reverse('employee-detail', kwargs={'pk': pk}), {'If-None-Match': ctx['etags'][pk]}
+
+    return [
+        Workload('cached list', lambda ctx, rng: (reverse('employee-list') + '?expand=company', {}), cache=True),
+        Workload('not modified', not_modified, cache=True, expected=304),
+        Workload('uncached detail', employee_detail),
+        Workload('uncached list', lambda ctx, rng: (
+            reverse('employee-list') + f'?company={rng.choice(ctx["companies"])}', {},
+        )),
+        Workload('headcount', lambda ctx, rng: (
+            reverse('headcount') + f'?company={rng.choice(ctx["companies"])}', {},
+        )),
+    ]
+
+
+def context(wsgi):
+    from django.urls import reverse
+    from ems.models import Company, Employee
+
+    employees = list(Employee.objects.order_by('?').values_list('id', flat=True)[:200])
+    etags = {}
+    for pk in employees:
+        _, headers, _ = wsgi_request(wsgi, reverse('employee-detail', kwargs={'pk': pk}), {})
+        etags[pk] = headers['ETag']
+    return {
+        'companies': list(Company.objects.order_by('?').values_list('id', flat=True)[:100]),
+        'employees': employees,
+        'etags': etags,
+    }
+
+
+def wsgi_request(application, url, headers):
+    path, _, query = url.partition('?')
+    environ = {
+        'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': query, 'SERVER_NAME': HOST,
+        'SERVER_PORT': '80', 'SERVER_PROTOCOL': 'HTTP/1.1', 'HTTP_HOST': HOST, 'HTTP_ACCEPT': 'application/json',
+        'wsgi.input': io.BytesIO(), 'wsgi.url_scheme': 'http', 'wsgi.errors': sys.stderr,
+    }
+    environ.update({'HTTP_' + name.upper().replace('-', '_'): value for name, value in headers.items()})
+    started = []
+    body = application(environ, lambda status, response_headers: started.append((status, response_headers)))
+    try:
+        content = b''.join(body)
+    finally:
+        body.close()
+    status, response_headers = started[0]
+    return int(status.split()[0]), dict(response_headers), content
+
+
+async def asgi_request(application, url, headers):
+    path, _, query = url.partition('?')
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+        'path': path, 'raw_path': path.encode(), 'query_string': query.encode(), 'root_path': '',
+        'client': ('127.0.0.1', 1), 'server': (HOST, 80),
+        'headers': [(b'host', HOST.encode()), (b'accept', b'application/json')] + [
+            (name.lower().encode(), value.encode()) for name, value in headers.items()
+        ],
+    }
+    received = False
+    status = None
+    content = []
+
+    async def receive():
+        nonlocal received
+        if not received:
+            received = True
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        await asyncio.sleep(3600)
+
+    async def send(message):
+        nonlocal status
+        if message['type'] == 'http.response.start':
+            status = message['status']
+        else:
+            content.append(message.get('body', b''))
+
+    await application(scope, receive, send)
+    return status, None, b''.join(content)
+
+
+def summary(timings, statuses, workload, elapsed):
+    timings.sort()
+    return {
+        'requests': len(timings),
+        'errors': sum(1 for status in statuses if status != workload.expected),
+        'throughput_rps': len(timings) / elapsed,
+        'mean_ms': statistics.mean(timings),
+        'p50_ms': percentile(timings, 0.5),
+        'p99_ms': percentile(timings, 0.99),
+    }
+
+
+def run_wsgi(application, workload, ctx, requests, concurrency, seed):
+    rng = random.Random(f'{seed}-{workload.name}')
+    calls = [workload.build(ctx, rng) for _ in range(requests)]
+    wsgi_request(application, *calls[0])
+
+    def send(call):
+        started = time.perf_counter()
+        status, _, _ = wsgi_request(application, *call)
+        return (time.perf_counter() - started) * 1000, status
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        results = list(pool.map(send, calls))
+    elapsed = time.perf_counter() - started
+    return summary([ms for ms, _ in results], [status for _, status in results], workload, elapsed)
+
+
+def run_asgi(application, workload, ctx, requests, concurrency, seed):
+    rng = random.Random(f'{seed}-{workload.name}')
+    calls = [workload.build(ctx, rng) for _ in range(requests)]
+
+    async def main():
+        await asgi_request(application, *calls[0])
+        pending = iter(calls)
+        results = []
+
+        async def worker():
+            for call in pending:
+                started = time.perf_counter()
+                status, _, _ = await asgi_request(application, *call)
+                results.append(((time.perf_counter() - started) * 1000, status))
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return results, time.perf_counter() - started
+
+    results, elapsed = asyncio.run(main())
+    return summary([ms for ms, _ in results], [status for _, status in results], workload, elapsed)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--database', metavar='PATH',
+                        help='SQLite file made by benchmarks.datagen; generated here if missing. '
+                             'Defaults to a temporary file.')
+    datagen.add_scale_arguments(parser, default='small')
+    parser.add_argument('--requests', type=int, default=2000, help='Requests per workload (default: 2000)')
+    parser.add_argument('--concurrency', type=int, default=64, help='Requests in flight (default: 64)')
+    parser.add_argument('--threads', type=int, default=8, help='Executor threads of the ASGI handler (default: 8)')
+    parser.add_argument('--only', metavar='TEXT', help='Only run workloads whose name contains TEXT')
+    parser.add_argument('--json', metavar='PATH', help='Write the results as JSON')
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.TemporaryDirectory()
+    database = args.database or os.path.join(workdir.name, 'bench.sqlite3')
+    generate = not os.path.exists(database)
+    setup_django(database)
+
+    from django.conf import settings
+    from django.core.management import call_command
+    from django.core.wsgi import get_wsgi_application
+
+    settings.ALLOWED_HOSTS = [HOST]
+    settings.EMS_ASYNC_THREADS = args.threads
+    call_command('migrate', verbosity=0)
+    if generate:
+        datagen.generate(seed=args.seed, **datagen.scale_from_args(args))
+
+    from ems import asgi, cache
+
+    handlers = {'wsgi': (get_wsgi_application(), run_wsgi), 'asgi': (asgi.ASGIHandler(), run_asgi)}
+    ctx = context(handlers['wsgi'][0])
+    max_entries = cache.responses.max_entries
+
+    results = {}
+    print(f'{"workload":18} {"server":>6} {"req/s":>9} {"p50":>9} {"p99":>9} {"errors":>6}')
+    for workload in workloads():
+        if args.only and args.only not in workload.name:
+            continue
+        cache.responses.max_entries = max_entries if workload.cache else 0
+        for server, (application, run) in handlers.items():
+            result = run(application, workload, ctx, args.requests, args.concurrency, args.seed)
+            results.setdefault(workload.name, {})[server] = result
+            print(f'{workload.name:18} {server:>6} {result["throughput_rps"]:9.1f} {result["p50_ms"]:7.2f}ms '
+                  f'{result["p99_ms"]:7.2f}ms {result["errors"]:>6}')
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({
+                'timestamp': datetime.now(timezone.utc).isoformat(),
+                'environment': environment(),
+                'options': {
+                    'requests': args.requests,
+                    'concurrency': args.concurrency,
+                    'threads': args.threads,
+                    'seed': args.seed,
+                },
+                'workloads': results,
+            }, f, indent=2)
+    workdir.cleanup()
+
+
+if __name__ == '__main__':
+    main()
@@ -2,6 +2,8 @@
 ASGI config for employee project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+The handler comes from ems.asgi, which serves the API views without tying
+up Django's thread for sync code.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/3.1/howto/deployment/asgi/
@@ -9,8 +11,11 @@ https://docs.djangoproject.com/en/3.1/howto/deployment/asgi/
 
 import os
 
-from django.core.asgi import get_asgi_application
+import django
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'employee.settings')
+django.setup(set_prefix=False)
 
-application = get_asgi_application()
+from ems.asgi import ASGIHandler  # noqa: E402
+
+application = ASGIHandler()
@@ -37,12 +37,12 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
-    'ems',
+    'ems.apps.EmsConfig',
     'rest_framework',
-    'nested_admin',
 ]
 
 MIDDLEWARE = [
+    'ems.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -78,9 +78,32 @@ WSGI_APPLICATION = 'employee.wsgi.application'
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        # Django's, with immediate transactions, see ems/sqlite.py
+        'ENGINE': 'ems.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
-    }
+    },
+    # A read-only connection to the same file, see EMS_ROUTER
+    'replica': {
+        'ENGINE': 'ems.backends.sqlite3',
+        'NAME': f'file:{BASE_DIR / "db.sqlite3"}?mode=ro',
+        'TEST': {'MIRROR': 'default'},
+    },
+}
+
+DATABASE_ROUTERS = ['ems.routers.ReadWriteRouter']
+
+
+# Cache
+# https://docs.djangoproject.com/en/3.1/ref/settings/#caches
+#
+# Shared by every process of the host, as the ems model generations must
+# be, see ems/cache.py. Use memcached across several hosts.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / '.cache',
+    },
 }
 
 
@@ -121,3 +144,88 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/3.1/howto/static-files/
 
 STATIC_URL = '/static/'
+
+
+# Django REST framework
+# https://www.django-rest-framework.org/api-guide/settings/
+
+REST_FRAMEWORK = {
+    'DEFAULT_PAGINATION_CLASS': 'ems.pagination.KeysetPagination',
+    'DEFAULT_FILTER_BACKENDS': ['rest_framework.filters.OrderingFilter'],
+    'PAGE_SIZE': 100,
+}
+
+# Response cache of the ems read endpoints, see ems/cache.py
+
+EMS_RESPONSE_CACHE = {
+    'MAX_ENTRIES': 1024,
+    'MAX_BYTES': 64 * 2 ** 20,
+}
+
+# Per-row JSON fragments of the list endpoints, see ems/cache.py
+
+EMS_FRAGMENT_CACHE = {
+    'MAX_ENTRIES': 100000,
+    'MAX_BYTES': 64 * 2 ** 20,
+}
+
+# Threads that serve the ems API reads under ASGI, see ems/asgi.py
+
+EMS_ASYNC_THREADS = 8
+
+# Pragmas of every SQLite connection and retries of locked write
+# transactions, see ems/sqlite.py
+
+EMS_SQLITE = {
+    'PRAGMAS': {
+        'busy_timeout': 5000,
+        'journal_mode': 'wal',
+        'synchronous': 'normal',
+        'mmap_size': 256 * 2 ** 20,
+        'cache_size': -64000,
+        'temp_store': 'memory',
+    },
+    'LOCK_RETRIES': 5,
+    'LOCK_BACKOFF': 0.05,
+}
+
+# Databases serving the reads of the listed ems viewsets, and how long a
+# client keeps reading from the primary after a write, see ems/routers.py
+
+EMS_ROUTER = {
+    'READ_DATABASES': ['replica'],
+    # e.g. ['EmployeeViewSet', 'DepartmentViewSet']
+    'VIEWSETS': [],
+    'STICKY_SECONDS': 5,
+    'REPLICAS_LAG': False,
+}
+
+# Server-Timing headers and the request histograms of /api/metrics/, which
+# only answers INTERNAL_IPS, see ems/metrics.py
+
+INTERNAL_IPS = ['127.0.0.1']
+
+EMS_METRICS = {
+    'SERVER_TIMING': True,
+    'LATENCY_BUCKETS': [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10],
+    'QUERY_BUCKETS': [0, 1, 2, 3, 5, 10, 20, 50, 100, 1000],
+}
+
+# Admin changelists count up to THRESHOLD rows, then estimate and page by
+# primary key, see ems/counts.py
+
+EMS_COUNTS = {
+    'THRESHOLD': 10000,
+}
+
+# Background jobs, queued in the database and run by manage.py run_workers,
+# see ems/jobs.py
+
+EMS_JOBS = {
+    'PROCESSES': 2,
+    'POLL_INTERVAL': 1,
+    'MAX_ATTEMPTS': 3,
+    'RETRY_BACKOFF': 5,
+    'TIMEOUT': 3600,
+    'PROGRESS_INTERVAL': 1,
+}
@@ -1,37 +1,299 @@
+from django import forms
 from django.contrib import admin
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.contrib.admin.views.main import PAGE_VAR, ChangeList
+from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
+from django.contrib.auth.models import User
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.core.paginator import Paginator
+from django.db.models import Count, QuerySet
+from django.forms.models import BaseInlineFormSet
+from django.urls import reverse
+from django.utils.functional import cached_property
+from django.utils.html import format_html
+from django.utils.text import capfirst
+from . import counts, deletion, sqlite
 from .models import Employee, Department, Company
 from django_reverse_admin import ReverseModelAdmin
-from nested_admin import NestedStackedInline, NestedModelAdmin
-from django.contrib.admin import ModelAdmin
 admin.site.site_header = "Employee management Admin"
 
+# The key the rows of a keyset page follow
+AFTER_VAR = 'after'
+
+
+class EstimatedCountPaginator(Paginator):
+    """ Paginator counting with ``counts.count()``: exactly up to the threshold only """
+    count_qualifier = None
+
+    @cached_property
+    def count(self):
+        count, self.count_qualifier = counts.count(self.object_list)
+        return count
+
+
+class EstimatedCountChangeList(ChangeList):
+    """
+    Changelist whose count stops at the threshold of ``ems.counts``. Past it,
+    lists ordered by one unique column, as they are by default by primary
+    key, are paged by that key rather than by offset: each page holds the
+    rows after the last one of the page before, with links to the next and
+    the first page.
+    """
+
+    def get_filters_params(self, params=None):
+        lookup_params = super().get_filters_params(params)
+        lookup_params.pop(AFTER_VAR, None)
+        return lookup_params
+
+    def get_results(self, request):
+        super().get_results(request)
+        self.count_qualifier = self.paginator.count_qualifier
+        self.keyset = self._keyset_field() if self.count_qualifier else None
+        self.after = None
+        if AFTER_VAR not in request.GET:
+            # The first page, or a ?p= page by offset, which Next then leaves by key
+            return
+        if not self.keyset:
+            raise IncorrectLookupParameters
+        field, descending = self.keyset
+        try:
+            self.after = field.to_python(request.GET[AFTER_VAR])
+        except ValidationError:
+            raise IncorrectLookupParameters
+        lookup = f'{field.name}__lt' if descending else f'{field.name}__gt'
+        self.result_list = self.queryset.filter(**{lookup: self.after})[:self.list_per_page]
+
+    def _keyset_field(self):
+        """ (field, descending) of an ordering by one unique column, None for other orderings """
+        # The admin may repeat its ordering, as ('username', 'username')
+        ordering = list(dict.fromkeys(self.queryset.query.order_by))
+        if len(ordering) != 1 or not isinstance(ordering[0], str):
+            return None
+        name = ordering[0].lstrip('-')
+        try:
+            field = self.lookup_opts.pk if name == 'pk' else self.lookup_opts.get_field(name)
+        except FieldDoesNotExist:
+            return None
+        if not field.concrete or not field.unique or field.null:
+            return None
+        return field, ordering[0].startswith('-')
+
+    @property
+    def first_page_url(self):
+        return self.get_query_string(remove=[AFTER_VAR, PAGE_VAR])
+
+    @property
+    def next_page_url(self):
+        # The page itself, which the result list has already read
+        page = list(self.result_list)
+        if len(page) < self.list_per_page:
+            return None
+        return self.get_query_string({AFTER_VAR: getattr(page[-1], self.keyset[0].attname)}, [PAGE_VAR])
+
+
+class EstimatedCountMixin:
+    """ Admin whose changelist counts its rows up to a threshold only, see ``EstimatedCountChangeList`` """
+    change_list_template = 'admin/ems/estimated_change_list.html'
+    paginator = EstimatedCountPaginator
+    # No count of the unfiltered table next to the search results
+    show_full_result_count = False
+
+    def get_changelist(self, request, **kwargs):
+        return EstimatedCountChangeList
+
+
 @admin.register(Employee)
-class EmployeeAdmin(ReverseModelAdmin):
+class EmployeeAdmin(EstimatedCountMixin, ReverseModelAdmin):
     inline_type = 'stacked'
     inline_reverse = [('user', {'fields': ['username', 'first_name', 'last_name']}),
                       ]
+    list_display = ['__str__', 'designation']
+    list_filter = ['designation']
+    # Also for the employee autocomplete of memberships
+    search_fields = ['user__username', 'user__first_name', 'user__last_name']
+    autocomplete_fields = ['department']
+    # The newest first, as the changelist would; the autocomplete pages by offset, so it needs one too
+    ordering = ['-pk']
 
+    def get_queryset(self, request):
+        # __str__ reads the user, of every row of the changelist and the autocomplete
+        return super().get_queryset(request).select_related('user')
 
-class MembershipInline(NestedStackedInline):
-    model = Employee.department.through
+    def formfield_for_manytomany(self, db_field, request, **kwargs):
+        if db_field.name == 'department':
+            # __str__ reads the company of the selected departments
+            kwargs['queryset'] = Department.objects.select_related('company')
+        return super().formfield_for_manytomany(db_field, request, **kwargs)
+
+
+class PaginatedInlineFormSet(BaseInlineFormSet):
+    """
+    The forms of one page of the related objects, ``per_page`` at a time,
+    chosen by the ``<prefix>-page`` query parameter of the change page.
+    """
+    per_page = 20
+    # The query parameters of the change page
+    query = {}
+
+    @property
+    def page_param(self):
+        return f'{self.prefix}-page'
+
+    def get_queryset(self):
+        if not hasattr(self, '_page'):
+            paginator = Paginator(super().get_queryset(), self.per_page)
+            self._page = paginator.get_page(self.query.get(self.page_param))
+            # Sliced, so the forms only hold the page
+            self._queryset = self._page.object_list
+        return self._queryset
+
+    @property
+    def page(self):
+        self.get_queryset()
+        return self._page
+
+    def page_url(self, number):
+        query = self.query.copy()
+        query[self.page_param] = number
+        return f'?{query.urlencode()}'
+
+    @property
+    def previous_page_url(self):
+        return self.page_url(self.page.previous_page_number()) if self.page.has_previous() else None
+
+    @property
+    def next_page_url(self):
+        return self.page_url(self.page.next_page_number()) if self.page.has_next() else None
+
+
+class PaginatedInline:
+    """ Inline admin editing ``per_page`` related objects at a time, with links to the other pages """
+    formset = PaginatedInlineFormSet
+    per_page = 20
+    template = 'admin/ems/edit_inline/paginated_tabular.html'
 
+    def get_formset(self, request, obj=None, **kwargs):
+        formset = super().get_formset(request, obj, **kwargs)
+        formset.per_page = self.per_page
+        formset.query = request.GET
+        return formset
 
-class EmployeeInlineAdmin(NestedStackedInline):
-    # inline_type = 'stacked'
-    # inline_reverse = [('user', {'fields': ['username', 'first_name', 'last_name']}),                   ]
-    model = Employee
 
+class CascadeDeleteMixin:
+    """
+    Admin deleting with ``ems.deletion``. The confirmation page counts the
+    rows below the objects instead of listing each of them.
+    """
 
-# @admin.register(Department)
-class DepartmentAdmin(NestedStackedInline):
+    def get_deleted_objects(self, objs, request):
+        opts = self.model._meta
+        deleted_objects = [f'{capfirst(opts.verbose_name)}: {obj}' for obj in objs]
+        pks = objs.values('pk') if isinstance(objs, QuerySet) else [obj.pk for obj in objs]
+        model_count = {opts.verbose_name_plural: len(deleted_objects)}
+        perms_needed = set()
+        for model, n in deletion.summary(self.model, pks).items():
+            if not n:
+                continue
+            model_count[model._meta.verbose_name_plural] = n
+            # As the collector, which skips the memberships
+            perm = f'{model._meta.app_label}.delete_{model._meta.model_name}'
+            if not model._meta.auto_created and not request.user.has_perm(perm):
+                perms_needed.add(model._meta.verbose_name)
+        return deleted_objects, model_count, perms_needed, []
+
+    def delete_model(self, request, obj):
+        sqlite.retry_on_lock(deletion.DELETERS[self.model], [obj.pk])
+
+    def delete_queryset(self, request, queryset):
+        sqlite.retry_on_lock(deletion.DELETERS[self.model], queryset.values_list('pk', flat=True))
+
+
+class MembershipForm(forms.ModelForm):
+    """ Existing memberships show their own employee, new ones search for one """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.instance.pk is not None:
+            field = self.fields['employee']
+            # Loaded with the page, rather than queried per form
+            field.widget = forms.Select(choices=[(self.instance.employee_id, str(self.instance.employee))])
+            field.disabled = True
+
+
+class MembershipFormSet(PaginatedInlineFormSet):
+    """ Adds and removes memberships through the relation, so m2m_changed keeps caches and counters in step """
+
+    def save_new(self, form, commit=True):
+        membership = super().save_new(form, commit=False)
+        if commit:
+            membership.employee.department.add(membership.department)
+        return membership
+
+    def delete_existing(self, obj, commit=True):
+        if commit:
+            obj.employee.department.remove(obj.department)
+
+
+class MembershipInline(PaginatedInline, admin.TabularInline):
+    model = Employee.department.through
+    verbose_name = 'membership'
+    verbose_name_plural = 'memberships'
+    form = MembershipForm
+    formset = MembershipFormSet
+    autocomplete_fields = ['employee']
+    extra = 1
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('employee__user')
+
+
+class DepartmentInline(PaginatedInline, admin.TabularInline):
+    """ The departments of a company; their memberships are edited on the department's own page """
     model = Department
-    # list_filter = ('company', )
-    # list_display = ('name', 'company')
+    fields = ['name', 'employees']
+    readonly_fields = ['employees']
+    show_change_link = True
     extra = 1
+
+    def get_queryset(self, request):
+        # The company of __str__ and the number of employees come with the page
+        return super().get_queryset(request).select_related('company').annotate(
+            employee_count=Count('employee'),
+        ).order_by('name')
+
+    def employees(self, obj):
+        if obj.pk is None:
+            return '-'
+        url = reverse('admin:ems_department_change', args=[obj.pk])
+        return format_html('<a href="{}">{} employees</a>', url, obj.employee_count)
+
+
+@admin.register(Department)
+class DepartmentAdmin(CascadeDeleteMixin, admin.ModelAdmin):
+    list_display = ['name', 'company']
+    # Also for the department autocomplete of employees
+    search_fields = ['name', 'company__name']
+    autocomplete_fields = ['company']
     inlines = [MembershipInline]
+    # See EmployeeAdmin
+    ordering = ['-pk']
+
+    def get_queryset(self, request):
+        # __str__ reads the company, of every row of the changelist and the autocomplete
+        return super().get_queryset(request).select_related('company')
+
 
-class CompanyAdmin(NestedModelAdmin):
+class CompanyAdmin(CascadeDeleteMixin, EstimatedCountMixin, admin.ModelAdmin):
     model = Company
-    inlines = [DepartmentAdmin]
+    # For the company autocomplete of departments
+    search_fields = ['name']
+    inlines = [DepartmentInline]
 
 admin.site.register(Company, CompanyAdmin)
+
+
+class UserAdmin(EstimatedCountMixin, BaseUserAdmin):
+    pass
+
+admin.site.unregister(User)
+admin.site.register(User, UserAdmin)
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class EmsConfig(AppConfig):
     name = 'ems'
+
+    def ready(self):
+        from ems import metrics, signals, sqlite, tasks  # noqa: F401
@@ -0,0 +1,247 @@
+"""
+ASGI handler that keeps the ems API off Django's thread for sync code.
+
+Under ASGI, Django 3.1 runs every sync view, every sync middleware call and
+the rendering of responses on one shared thread, and goes back and forth
+between it and the event loop around each middleware of an async chain, so
+API requests queue behind each other however many the server accepts at
+once. ``ASGIHandler`` serves reads of DRF views differently:
+
+* A GET of a list or detail of a cached viewset first goes through a
+  trimmed sync middleware chain on the event loop, flagged
+  ``ems_cache_only``. A response cache hit or a 304 is answered there,
+  signals included, without a query and without a thread.
+* Other reads, and the misses, run on ``executor``, a pool of
+  ``settings.EMS_ASYNC_THREADS`` threads, which also bounds the database
+  connections they hold. Each runs there whole, as a WSGI server runs a
+  request: signals, the sync middleware chain, the view and the rendering.
+* Writes, and everything outside DRF, run as Django runs them.
+
+Streamed responses, the export and the org tree, are iterated on the
+executor too; Django 3.1 iterates them on the event loop, where their
+queries are not allowed.
+
+The cache-only dispatch reads the model generations from the shared cache
+of ems.cache on the event loop. Its chain leaves out the middleware of
+``CACHE_ONLY_SKIPPED``, which only deal with the session, the user and
+CSRF, none of which a cached response reads, and the rest must not query.
+"""
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core import signals
+from django.core.exceptions import MiddlewareNotUsed, RequestAborted
+from django.core.handlers.asgi import ASGIHandler as DjangoASGIHandler
+from django.core.handlers.base import BaseHandler
+from django.core.handlers.exception import convert_exception_to_response
+from django.db import close_old_connections
+from django.http import FileResponse, HttpResponse
+from django.urls import Resolver404, get_resolver, set_script_prefix
+from django.utils.module_loading import import_string
+from rest_framework.permissions import AllowAny
+from rest_framework.views import APIView
+from ems.views import CachedResponseMixin, CacheMiss
+
+READ_METHODS = ('GET', 'HEAD', 'OPTIONS')
+# Parts of a streamed response produced ahead of the client
+STREAM_BUFFER = 16
+# Left out of the cache-only chain, see above
+CACHE_ONLY_SKIPPED = {
+    'django.contrib.sessions.middleware.SessionMiddleware',
+    'django.middleware.csrf.CsrfViewMiddleware',
+    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'django.contrib.messages.middleware.MessageMiddleware',
+}
+
+# How ``ASGIHandler`` serves a request
+CACHE, READ = 'cache', 'read'
+
+executor = ThreadPoolExecutor(
+    max_workers=getattr(settings, 'EMS_ASYNC_THREADS', 8), thread_name_prefix='ems-read',
+)
+
+
+def cache_only(view_func):
+    """ Whether requests to ``view_func`` may be answered by a cache-only dispatch """
+    cls = getattr(view_func, 'cls', None)
+    return (
+        cls is not None
+        and issubclass(cls, CachedResponseMixin)
+        and all(permission is AllowAny for permission in cls.permission_classes)
+        and not cls.throttle_classes
+    )
+
+
+def _headers(response):
+    return [
+        (header.encode('ascii'), value.encode('latin1')) for header, value in response.items()
+    ] + [
+        (b'Set-Cookie', cookie.output(header='').encode('ascii').strip())
+        for cookie in response.cookies.values()
+    ]
+
+
+class CacheMissResponse(HttpResponse):
+    """ What the cache-only middleware chain gives for a request it cannot answer """
+    # Measured by the dispatch that answers it instead
+    ems_unobserved = True
+
+
+class CacheOnlyHandler(BaseHandler):
+    """ The sync middleware chain but ``CACHE_ONLY_SKIPPED``, run on the event loop for cache-only dispatches """
+
+    def load_middleware(self):
+        self._view_middleware = []
+        self._template_response_middleware = []
+        self._exception_middleware = []
+
+        handler = convert_exception_to_response(self._get_response)
+        for middleware_path in reversed(settings.MIDDLEWARE):
+            if middleware_path in CACHE_ONLY_SKIPPED:
+                continue
+            try:
+                middleware = import_string(middleware_path)(handler)
+            except MiddlewareNotUsed:
+                continue
+            if hasattr(middleware, 'process_view'):
+                self._view_middleware.insert(0, middleware.process_view)
+            if hasattr(middleware, 'process_template_response'):
+                self._template_response_middleware.append(middleware.process_template_response)
+            if hasattr(middleware, 'process_exception'):
+                self._exception_middleware.append(middleware.process_exception)
+            handler = convert_exception_to_response(middleware)
+        self._middleware_chain = handler
+
+    def _get_response(self, request):
+        try:
+            return super()._get_response(request)
+        except CacheMiss:
+            return CacheMissResponse()
+
+
+class ASGIHandler(DjangoASGIHandler):
+    """ Django's ASGI handler with the reads of DRF views served on the event loop and ``executor`` """
+
+    def load_middleware(self, is_async=False):
+        super().load_middleware(is_async)
+        self.read_handler = BaseHandler()
+        self.read_handler.load_middleware()
+        self.cache_handler = CacheOnlyHandler()
+        self.cache_handler.load_middleware()
+
+    def route(self, request):
+        """ ``CACHE``, ``READ`` or None when Django serves ``request`` """
+        if request.method not in READ_METHODS:
+            return None
+        try:
+            match = get_resolver().resolve(request.path_info)
+        except Resolver404:
+            return None
+        cls = getattr(match.func, 'cls', None)
+        if not (isinstance(cls, type) and issubclass(cls, APIView)):
+            return None
+        # Credentials would be checked by the authentication it skips
+        if request.method in ('GET', 'HEAD') and 'HTTP_AUTHORIZATION' not in request.META and cache_only(match.func):
+            return CACHE
+        return READ
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await super().__call__(scope, receive, send)
+        try:
+            body_file = await self.read_body(receive)
+        except RequestAborted:
+            return
+        set_script_prefix(self.get_script_prefix(scope))
+        request, error_response = self.create_request(scope, body_file)
+        route = None if request is None else self.route(request)
+
+        if route is None:
+            await sync_to_async(signals.request_started.send, thread_sensitive=True)(sender=self.__class__, scope=scope)
+            response = error_response if request is None else await self.get_response_async(request)
+            response._handler_class = self.__class__
+            if isinstance(response, FileResponse):
+                response.block_size = self.chunk_size
+            return await self.send_response(response, send)
+
+        response = self.cached_response(request) if route == CACHE else None
+        if response is None:
+            loop = asyncio.get_running_loop()
+            response = await loop.run_in_executor(executor, self.read, request, route == CACHE)
+        response._handler_class = self.__class__
+        await self.send_read(response, send)
+
+    def cached_response(self, request):
+        """ The response of the cache-only chain to ``request``, closed; None on a miss """
+        # No connection is open on the event loop, for the signals to close
+        signals.request_started.send(sender=self.__class__, scope=request.scope)
+        request.ems_cache_only = True
+        try:
+            response = self.cache_handler.get_response(request)
+        finally:
+            request.ems_cache_only = False
+        if isinstance(response, CacheMissResponse):
+            return None
+        response.close()
+        return response
+
+    def read(self, request, started=False):
+        """ Serve ``request`` on this executor thread; a response that does not stream comes back closed """
+        if started:
+            # request_started went out on the event loop, for its connections
+            close_old_connections()
+        else:
+            signals.request_started.send(sender=self.__class__, scope=request.scope)
+        response = self.read_handler.get_response(request)
+        if response.streaming:
+            # Iterated and closed by another thread, see send_read()
+            close_old_connections()
+        else:
+            response.close()
+        return response
+
+    async def send_read(self, response, send):
+        await send({'type': 'http.response.start', 'status': response.status_code, 'headers': _headers(response)})
+        if not response.streaming:
+            for chunk, last in self.chunk_bytes(response.content):
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': not last})
+            return
+
+        loop = asyncio.get_running_loop()
+        parts = asyncio.Queue(STREAM_BUFFER)
+        stopped = threading.Event()
+
+        def produce():
+            # On one thread throughout, the queries of a stream hold its connection
+            close_old_connections()
+            try:
+                for part in response:
+                    if stopped.is_set():
+                        break
+                    asyncio.run_coroutine_threadsafe(parts.put((part, None)), loop).result()
+                end = (None, None)
+            except Exception as exc:
+                end = (None, exc)
+            finally:
+                response.close()
+            asyncio.run_coroutine_threadsafe(parts.put(end), loop).result()
+
+        loop.run_in_executor(executor, produce)
+        try:
+            while True:
+                part, error = await parts.get()
+                if error is not None:
+                    raise error
+                if part is None:
+                    break
+                for chunk, _ in self.chunk_bytes(part):
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            await send({'type': 'http.response.body'})
+        finally:
+            # Unblock the producer if the response was abandoned
+            stopped.set()
+            while not parts.empty():
+                parts.get_nowait()
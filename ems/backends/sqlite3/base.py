@@ -0,0 +1,15 @@
+"""
+Django's sqlite3 backend, whose transactions may take the write lock at
+BEGIN, see ems.sqlite.immediate(). Set as the ENGINE of the databases:
+
+    'ENGINE': 'ems.backends.sqlite3',
+"""
+from django.db.backends.sqlite3 import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    # Set meanwhile by ems.sqlite.immediate()
+    begin_immediate = False
+
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute('BEGIN IMMEDIATE' if self.begin_immediate else 'BEGIN')
@@ -0,0 +1,160 @@
+"""
+Set-based writes shared by the bulk API endpoints.
+
+The functions take validated serializer data and write it with bulk_create,
+bulk_update and through-table inserts instead of one save() per row. They
+must be called inside ``transaction.atomic()``.
+"""
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import connection
+from ems import cache, headcount
+from ems.models import Employee
+
+# Keeps the number of bound parameters per statement below SQLite's limit
+CHUNK_SIZE = 500
+
+
+def chunked(items, size=CHUNK_SIZE):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def in_bulk(queryset, pks):
+    """ queryset.in_bulk() that stays below the bound parameter limit """
+    found = {}
+    for chunk in chunked(pks):
+        found.update(queryset.in_bulk(chunk))
+    return found
+
+
+def assign_pks(model, objs):
+    """
+    Backfill primary keys after bulk_create on backends that cannot return
+    them (SQLite on Django 3.1). The surrounding transaction holds SQLite's
+    write lock, so the newest len(objs) ids belong to the rows just inserted,
+    in insertion order.
+    """
+    if not objs or objs[0].pk is not None:
+        return objs
+    assert connection.in_atomic_block, 'assign_pks() must run inside transaction.atomic()'
+
+    pks = list(model.objects.order_by('-pk').values_list('pk', flat=True)[:len(objs)])
+    for obj, pk in zip(objs, reversed(pks)):
+        obj.pk = pk
+    return objs
+
+
+def create_objects(model, rows):
+    """ Insert one row per validated dict, many-to-many values included """
+    if model is Employee:
+        rows = _create_users(rows)
+
+    m2m = [field.name for field in model._meta.many_to_many]
+    objs = [model(**{k: v for k, v in row.items() if k not in m2m}) for row in rows]
+    model.objects.bulk_create(objs, batch_size=CHUNK_SIZE)
+    assign_pks(model, objs)
+    cache.changed(model)
+
+    for name in m2m:
+        set_relations(objs, rows, name, clear=False)
+    if model is Employee:
+        headcount.count(employee_ids=[obj.pk for obj in objs])
+    return objs
+
+
+def update_objects(instances, rows):
+    """
+    Apply validated partial dicts to their instances (matched by the ``id``
+    key) with one bulk_update, replacing many-to-many sets that are given.
+    """
+    if not rows:
+        return []
+    model = type(instances[rows[0]['id']])
+    m2m = [field.name for field in model._meta.many_to_many]
+    moved = headcount.moved_by(instances, rows)
+
+    objs, changed = [], set()
+    for row in rows:
+        obj = instances[row['id']]
+        for name, value in row.items():
+            if name != 'id' and name not in m2m:
+                setattr(obj, name, value)
+                changed.add(name)
+        objs.append(obj)
+
+    with headcount.changing(**moved):
+        if changed:
+            version = time.time_ns()
+            for obj in objs:
+                obj.version = version
+            model.objects.bulk_update(objs, sorted(changed | {'version'}), batch_size=CHUNK_SIZE)
+            cache.changed(model)
+        for name in m2m:
+            set_relations(objs, rows, name, clear=True)
+    return objs
+
+
+def delete_objects(model, pks):
+    # For models without a set-based delete in ems.deletion: QuerySet.delete()
+    # sends pre_delete and post_delete, which bump the cache generations
+    deleted = 0
+    for chunk in chunked(pks):
+        deleted += model.objects.filter(pk__in=chunk).delete()[0]
+    return deleted
+
+
+def set_relations(objs, rows, name, clear):
+    """
+    Write the through-table rows of many-to-many field ``name`` for the
+    objects whose row carries that key. With ``clear`` their existing
+    rows are removed first.
+    """
+    pairs = [(obj, row[name]) for obj, row in zip(objs, rows) if name in row]
+    if not pairs:
+        return
+
+    model = type(objs[0])
+    field = model._meta.get_field(name)
+    through = field.remote_field.through
+    source = f'{field.m2m_field_name()}_id'
+    target = f'{field.m2m_reverse_field_name()}_id'
+
+    if clear:
+        # New rows come with a fresh version, existing ones get one here
+        for chunk in chunked(obj.pk for obj, _ in pairs):
+            through.objects.filter(**{f'{source}__in': chunk}).delete()
+            model.touch(pk__in=chunk)
+
+    through.objects.bulk_create(
+        [
+            through(**{source: obj.pk, target: related.pk})
+            for obj, related_objs in pairs
+            for related in {related.pk: related for related in related_objs}.values()
+        ],
+        batch_size=CHUNK_SIZE,
+    )
+
+    cache.changed(model)
+    for obj, _ in pairs:
+        getattr(obj, '_prefetched_objects_cache', {}).pop(name, None)
+
+
+def _create_users(rows):
+    """ Create the users given inline as dicts and put them in their rows """
+    new = [row for row in rows if isinstance(row.get('user'), dict)]
+    # Unusable password marker, it never matches so one per batch is enough
+    password = make_password(None)
+    users = [User(password=password, **row['user']) for row in new]
+    User.objects.bulk_create(users, batch_size=CHUNK_SIZE)
+    assign_pks(User, users)
+    cache.changed(User)
+
+    created = iter(users)
+    return [
+        {**row, 'user': next(created)} if isinstance(row.get('user'), dict) else row
+        for row in rows
+    ]
@@ -0,0 +1,132 @@
+"""
+Versioned response cache for the read endpoints.
+
+Every model the API serves has a generation: the time, in nanoseconds, of
+its last change. Signal handlers (see ``ems.signals``) and the set-based
+write paths bump it with ``changed()``. Cached responses are keyed by the
+request and the generations of every model they were built from. A write
+moves the generation on, so later requests miss and older entries are
+never read again and age out of the LRU.
+
+Generations live in Django's default cache, which must be shared by every
+process serving the API: a local-memory cache would leave the other
+workers serving responses, ETags and 304s of before the write. The
+settings use a file-based cache, shared on one host and read without a
+query; use memcached across hosts. A generation evicted from that cache is
+recreated with the current time, which only costs a miss. Responses are held in a bounded
+in-process LRU, sized by ``settings.EMS_RESPONSE_CACHE``:
+
+    EMS_RESPONSE_CACHE = {'MAX_ENTRIES': 1024, 'MAX_BYTES': 64 * 2 ** 20}
+
+``MAX_ENTRIES = 0`` turns response caching off.
+
+List pages are also assembled from per-row fragments, the JSON bytes each
+row renders to, keyed by the row's ``version`` column (see ``ems.readers``).
+A write then only costs the re-encoding of the rows it touched. Fragments
+are held in a second LRU sized by ``settings.EMS_FRAGMENT_CACHE``.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+DEFAULTS = {'MAX_ENTRIES': 1024, 'MAX_BYTES': 64 * 2 ** 20}
+FRAGMENT_DEFAULTS = {'MAX_ENTRIES': 100000, 'MAX_BYTES': 64 * 2 ** 20}
+
+
+def _generation_key(model):
+    return f'ems:generation:{model._meta.label_lower}'
+
+
+def generations(models):
+    """ Current generation of each model, in the order given """
+    keys = [_generation_key(model) for model in models]
+    found = cache.get_many(keys)
+    for key in keys:
+        if key not in found:
+            cache.add(key, time.time_ns(), None)
+            found[key] = cache.get(key)
+    return tuple(found[key] for key in keys)
+
+
+def bump(*models):
+    now = time.time_ns()
+    cache.set_many({_generation_key(model): now for model in models}, None)
+
+
+def changed(*models):
+    """
+    Record a change to ``models``. Inside a transaction the generations are
+    bumped again on commit, so a response cached from a concurrent read of
+    the old rows in the meantime is not served afterwards.
+    """
+    bump(*models)
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(lambda: bump(*models))
+
+
+class LRUCache:
+    """ Thread-safe mapping bounded by entry count and total size in bytes """
+
+    def __init__(self, max_entries, max_bytes):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.size = 0
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            try:
+                value, size = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, size):
+        if size > self.max_bytes or not self.max_entries:
+            return
+        with self._lock:
+            if key in self._data:
+                self.size -= self._data.pop(key)[1]
+            self._data[key] = (value, size)
+            self.size += size
+            while len(self._data) > self.max_entries or self.size > self.max_bytes:
+                self.size -= self._data.popitem(last=False)[1][1]
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.size = 0
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._data),
+                'bytes': self.size,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_ratio': self.hits / lookups if lookups else None,
+            }
+
+
+def _make_cache(setting, defaults):
+    options = {**defaults, **getattr(settings, setting, {})}
+    return LRUCache(options['MAX_ENTRIES'], options['MAX_BYTES'])
+
+
+responses = _make_cache('EMS_RESPONSE_CACHE', DEFAULTS)
+fragments = _make_cache('EMS_FRAGMENT_CACHE', FRAGMENT_DEFAULTS)
@@ -0,0 +1,69 @@
+"""
+Bounded row counts, for the pages of large tables.
+
+``count(queryset)`` counts exactly up to ``THRESHOLD`` rows only, with a
+LIMIT in the counting subquery, so its cost does not grow with the table.
+Past the threshold, the unfiltered table is estimated: from the planner
+statistics on PostgreSQL, from ``sqlite_stat1`` once SQLite has run
+ANALYZE, and otherwise from the largest integer primary key, one index
+lookup. A filtered queryset past the threshold is only known to hold more
+than ``THRESHOLD`` rows.
+
+    EMS_COUNTS = {'THRESHOLD': 10000}
+"""
+from django.conf import settings
+from django.db import DatabaseError, connections
+from django.db.models import Max
+
+DEFAULTS = {'THRESHOLD': 10000}
+
+# How a count is to be read, None for exact counts
+ABOUT = 'about'
+OVER = 'over'
+
+_INTEGER_KEYS = {'AutoField', 'BigAutoField', 'SmallAutoField'}
+
+
+def get_setting(name):
+    return getattr(settings, 'EMS_COUNTS', {}).get(name, DEFAULTS[name])
+
+
+def estimate(model, using='default'):
+    """ The approximate number of rows of ``model``'s table, None when there is no cheap estimate """
+    connection = connections[using]
+    table = model._meta.db_table
+    try:
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute('SELECT reltuples FROM pg_class WHERE oid = %s::regclass', [table])
+                row = cursor.fetchone()
+                # -1 or 0 until the table is first analyzed
+                if row and row[0] > 0:
+                    return int(row[0])
+            elif connection.vendor == 'sqlite':
+                cursor.execute('SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1', [table])
+                row = cursor.fetchone()
+                if row:
+                    return int(row[0].split()[0])
+    except DatabaseError:
+        # No sqlite_stat1 before the first ANALYZE
+        pass
+    if model._meta.pk.get_internal_type() in _INTEGER_KEYS:
+        return model._base_manager.using(using).aggregate(largest=Max('pk'))['largest'] or 0
+    return None
+
+
+def count(queryset):
+    """
+    The number of rows of ``queryset`` and how to read it: None when exact,
+    ``ABOUT`` for an estimate and ``OVER`` for a lower bound.
+    """
+    threshold = get_setting('THRESHOLD')
+    counted = queryset.order_by()[:threshold + 1].count()
+    if counted <= threshold:
+        return counted, None
+    if not queryset.query.where:
+        estimated = estimate(queryset.model, queryset.db)
+        if estimated is not None:
+            return max(estimated, counted), ABOUT
+    return threshold, OVER
@@ -0,0 +1,123 @@
+"""
+Set-based deletion of companies, departments and employees.
+
+Company.delete() and QuerySet.delete() collect every department,
+membership and headcount row below what they delete as model instances,
+so that each gets its delete signals, whose headcount handler then runs a
+few queries per row. ``delete_companies()``, ``delete_departments()`` and
+``delete_employees()`` run a few ``DELETE ... WHERE ... IN`` statements
+per batch instead, and read nothing but ids. They do in bulk what the
+handlers of ``ems.signals`` would: take the rows out of the headcount,
+touch the employees that lose departments and bump the cache generations.
+
+Inside a transaction they run in it. Outside of one, as the jobs of
+``ems.jobs`` run them for very large trees, every batch is a transaction of
+its own, retried on lock (see ems.sqlite): the write lock is held a batch
+at a time, and a job that fails resumes with the rows left. A company then
+keeps its headcount counters until its last batch. Given ``progress``, they
+call it with the rows deleted so far and the total between batches.
+"""
+from collections import Counter
+
+from django.db.models import Count
+from ems import bulk, cache, headcount, sqlite
+from ems.models import Company, Department, Employee, Headcount
+
+Membership = Employee.department.through
+
+
+def _raw_delete(queryset):
+    # The DELETE the collector runs for rows it does not need to load
+    return queryset._raw_delete(queryset.db)
+
+
+def _delete_departments(dept_ids, uncount=True):
+    deleted = Counter()
+    if uncount:
+        # Their companies keep counting employees of their other departments
+        headcount.uncount(department_ids=dept_ids)
+    Employee.touch(pk__in=Membership.objects.filter(department_id__in=dept_ids).values('employee_id'))
+    deleted[Membership._meta.label] += _raw_delete(Membership.objects.filter(department_id__in=dept_ids))
+    deleted[Headcount._meta.label] += _raw_delete(Headcount.objects.filter(department_id__in=dept_ids))
+    deleted[Department._meta.label] += _raw_delete(Department.objects.filter(pk__in=dept_ids))
+    cache.changed(Department, Employee)
+    return deleted
+
+
+def _delete_companies(pks):
+    deleted = Counter()
+    deleted[Headcount._meta.label] += _raw_delete(Headcount.objects.filter(company_id__in=pks))
+    deleted[Company._meta.label] += _raw_delete(Company.objects.filter(pk__in=pks))
+    cache.changed(Company)
+    return deleted
+
+
+def _delete_employees(pks):
+    deleted = Counter()
+    headcount.uncount(employee_ids=pks)
+    deleted[Membership._meta.label] += _raw_delete(Membership.objects.filter(employee_id__in=pks))
+    deleted[Employee._meta.label] += _raw_delete(Employee.objects.filter(pk__in=pks))
+    cache.changed(Employee)
+    return deleted
+
+
+def _in_batches(func, pks, progress, **kwargs):
+    """ ``func`` on every chunk of ``pks``, each in a transaction of its own outside of one; the rows deleted """
+    deleted = Counter()
+    done = 0
+    for chunk in bulk.chunked(pks):
+        deleted.update(sqlite.retry_on_lock(func, chunk, **kwargs))
+        done += len(chunk)
+        if progress is not None:
+            progress(done, len(pks))
+    return deleted
+
+
+def _result(deleted):
+    deleted = {label: n for label, n in deleted.items() if n}
+    return sum(deleted.values()), deleted
+
+
+def delete_departments(pks, progress=None):
+    """ Delete departments ``pks`` and their memberships; returns what QuerySet.delete() does """
+    return _result(_in_batches(_delete_departments, list(pks), progress))
+
+
+def delete_companies(pks, progress=None):
+    """ Delete companies ``pks`` with their departments and memberships; returns what QuerySet.delete() does """
+    pks = list(pks)
+    dept_ids = []
+    for chunk in bulk.chunked(pks):
+        dept_ids.extend(Department.objects.filter(company_id__in=chunk).values_list('pk', flat=True))
+
+    # The counters of the companies go with them in the last batches, the overall ones do not change
+    deleted = _in_batches(_delete_departments, dept_ids, progress, uncount=False)
+    deleted.update(_in_batches(_delete_companies, pks, None))
+    return _result(deleted)
+
+
+def delete_employees(pks, progress=None):
+    """ Delete employees ``pks`` and their memberships; returns what QuerySet.delete() does """
+    return _result(_in_batches(_delete_employees, list(pks), progress))
+
+
+DELETERS = {Company: delete_companies, Department: delete_departments, Employee: delete_employees}
+
+
+def delete_objects(model, pks):
+    """ Delete rows ``pks`` of ``model``, set-based for the ems models; returns the number deleted """
+    if model in DELETERS:
+        return DELETERS[model](pks)[0]
+    return bulk.delete_objects(model, pks)
+
+
+def summary(model, pks):
+    """ The number of rows below ``pks``, ids or a queryset of them, that deleting them would delete, by model """
+    if model is Company:
+        departments = Department.objects.filter(company_id__in=pks).aggregate(
+            departments=Count('pk', distinct=True), memberships=Count('employee'),
+        )
+        return {Department: departments['departments'], Membership: departments['memberships']}
+    if model is Department:
+        return {Membership: Membership.objects.filter(department_id__in=pks).count()}
+    return {}
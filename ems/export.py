@@ -0,0 +1,110 @@
+"""
+Streaming export of the employee directory.
+
+Employees are read in primary key order, one keyset chunk at a time
+(``WHERE id > last_id LIMIT chunk_size``), with their user joined in and
+their departments and companies fetched by one query per chunk. Only one
+chunk is held in memory, and every row is written out as soon as its chunk
+is read. Chunks are separate queries, so rows changed while an export runs
+may show either version; no long read transaction blocks writers.
+"""
+import csv
+import json
+from itertools import groupby
+
+from rest_framework.renderers import BaseRenderer
+from ems.models import Employee
+
+Membership = Employee.department.through
+
+CHUNK_SIZE = 2000
+
+CSV_HEADER = [
+    'id', 'user', 'username', 'first_name', 'last_name', 'designation',
+    'department_ids', 'departments', 'company_ids', 'companies',
+]
+
+
+class NDJSONRenderer(BaseRenderer):
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = 'utf-8'
+
+
+class CSVRenderer(BaseRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+    charset = 'utf-8'
+
+
+def iter_employees(chunk_size=None):
+    """ Yield every employee as a dict with its departments and companies nested """
+    chunk_size = chunk_size or CHUNK_SIZE
+    last_id = 0
+    while True:
+        rows = list(
+            Employee.objects.filter(pk__gt=last_id).order_by('pk').values_list(
+                'id', 'user_id', 'user__username', 'user__first_name', 'user__last_name', 'designation',
+            )[:chunk_size]
+        )
+        if not rows:
+            return
+        last_id = rows[-1][0]
+
+        memberships = Membership.objects.filter(
+            employee_id__gte=rows[0][0], employee_id__lte=last_id,
+        ).order_by('employee_id', 'department_id').values_list(
+            'employee_id', 'department_id', 'department__name',
+            'department__company_id', 'department__company__name',
+        )
+        departments = {
+            employee_id: [
+                {'id': dept_id, 'name': name, 'company': {'id': company_id, 'name': company}}
+                for _, dept_id, name, company_id, company in group
+            ]
+            for employee_id, group in groupby(memberships, key=lambda row: row[0])
+        }
+
+        for emp_id, user_id, username, first_name, last_name, designation in rows:
+            yield {
+                'id': emp_id,
+                'user': user_id,
+                'username': username,
+                'first_name': first_name,
+                'last_name': last_name,
+                'designation': designation,
+                'department': departments.get(emp_id, []),
+            }
+
+
+def ndjson_lines(employees):
+    encoder = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+    for employee in employees:
+        yield encoder.encode(employee) + '\n'
+
+
+class _Line:
+    """ File-like target that hands back what csv.writer wrote """
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(employees):
+    writer = csv.writer(_Line())
+    yield writer.writerow(CSV_HEADER)
+    for employee in employees:
+        departments = employee['department']
+        companies = {dept['company']['id']: dept['company']['name'] for dept in departments}
+        yield writer.writerow([
+            employee['id'],
+            employee['user'],
+            employee['username'],
+            employee['first_name'],
+            employee['last_name'],
+            employee['designation'],
+            '|'.join(str(dept['id']) for dept in departments),
+            '|'.join(dept['name'] for dept in departments),
+            '|'.join(str(company_id) for company_id in companies),
+            '|'.join(companies.values()),
+        ])
@@ -0,0 +1,99 @@
+"""
+Query parameter filters of the employee list.
+
+    /api/employee/?company=1&department=3,4&designation=Sr,Mg&user=7&q=ann sh
+
+``company``, ``department`` and ``user`` take one or more ids, and
+``designation`` one or more codes, comma separated. Different parameters
+are combined with AND, the values of one parameter with OR.
+
+``q`` searches the usernames, first and last names of the employees'
+users. Every word must match the start of a word in one of them, so
+``ann sh`` finds "Anna Shah". On SQLite it is answered by the FTS5 index
+``ems_user_fts`` (migration 0003), elsewhere by LIKE queries.
+"""
+import re
+from functools import reduce
+from operator import and_
+
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
+from ems.models import Employee
+
+Membership = Employee.department.through
+
+WORD_RE = re.compile(r'\w+')
+# The largest integer SQLite stores; larger ids fail in the query rather than match nothing
+MAX_ID = 2 ** 63 - 1
+
+
+def _values(request, name, parse):
+    raw = request.query_params.get(name, '')
+    values = [value.strip() for value in raw.split(',') if value.strip()]
+    try:
+        return [parse(value) for value in values]
+    except ValueError as exc:
+        raise ValidationError({name: [str(exc)]})
+
+
+def _id(value):
+    if not value.isdigit() or int(value) > MAX_ID:
+        raise ValueError(f'"{value}" is not a valid id.')
+    return int(value)
+
+
+def _designation(value):
+    if value not in dict(Employee.DESIGNATIONS):
+        raise ValueError(f'"{value}" is not a valid choice.')
+    return value
+
+
+def search_words(q):
+    return WORD_RE.findall(q.lower())
+
+
+def user_search(words):
+    """ Q object matching users whose names start with every word """
+    if connection.vendor == 'sqlite':
+        # Every word as a quoted prefix query, implicitly ANDed
+        match = ' '.join(f'"{word}"*' for word in words)
+        return Q(user_id__in=RawSQL('SELECT rowid FROM ems_user_fts WHERE ems_user_fts MATCH %s', [match]))
+    return reduce(and_, [
+        Q(user__username__istartswith=word)
+        | Q(user__first_name__istartswith=word)
+        | Q(user__last_name__istartswith=word)
+        for word in words
+    ])
+
+
+class EmployeeFilterBackend(BaseFilterBackend):
+    """ Filters the employee queryset by the query parameters above """
+
+    def filter_queryset(self, request, queryset, view):
+        companies = _values(request, 'company', _id)
+        if companies:
+            queryset = queryset.filter(id__in=Membership.objects.filter(
+                department__company_id__in=companies,
+            ).values('employee_id'))
+
+        departments = _values(request, 'department', _id)
+        if departments:
+            queryset = queryset.filter(id__in=Membership.objects.filter(
+                department_id__in=departments,
+            ).values('employee_id'))
+
+        designations = _values(request, 'designation', _designation)
+        if designations:
+            queryset = queryset.filter(designation__in=designations)
+
+        users = _values(request, 'user', _id)
+        if users:
+            queryset = queryset.filter(user_id__in=users)
+
+        words = search_words(request.query_params.get('q', ''))
+        if words:
+            queryset = queryset.filter(user_search(words))
+        return queryset
@@ -0,0 +1,249 @@
+"""
+Headcount per designation, overall, per company and per department.
+
+Counting with GROUP BY over the membership table scans the whole scope on
+every request. ``Headcount`` keeps the counts instead, one row per scope
+and designation, so reading a scope is a lookup of at most one row per
+designation however many employees it has.
+
+The counters are updated by deltas. ``uncount()`` takes employees or
+departments out of the counters just before a change and ``count()`` puts
+them back as they are afterwards; ``count_memberships()`` handles single
+memberships. The signal handlers in ``ems.signals`` call them for save(),
+delete() and m2m changes, and the set-based write paths call them
+directly. ``manage.py headcount`` checks the counters against a count from
+scratch, and rebuilds them with ``--rebuild``.
+
+A company counts an employee once, however many of its departments they
+are in, and an employee without departments only counts overall.
+"""
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+from django.db.models import Count, F
+from ems import bulk
+from ems.models import Department, Employee, Headcount
+
+Membership = Employee.department.through
+
+OVERALL = 'overall'
+SCOPES = {'company': 'company_id', 'department': 'department_id'}
+
+
+def _scope_filter(scope, ids):
+    if scope == OVERALL:
+        return {'company': None, 'department': None}
+    return {f'{SCOPES[scope]}__in': ids}
+
+
+def apply(deltas):
+    """ Add ``deltas``, a mapping of (scope, scope id, designation) to counts, to the counters """
+    deltas = {key: delta for key, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    Headcount.objects.bulk_create(
+        [
+            Headcount(designation=designation, **({} if scope == OVERALL else {SCOPES[scope]: scope_id}))
+            for scope, scope_id, designation in deltas
+        ],
+        batch_size=bulk.CHUNK_SIZE,
+        ignore_conflicts=True,
+    )
+
+    grouped = defaultdict(list)
+    for (scope, scope_id, designation), delta in deltas.items():
+        grouped[scope, designation, delta].append(scope_id)
+    for (scope, designation, delta), ids in grouped.items():
+        for chunk in bulk.chunked(ids):
+            Headcount.objects.filter(designation=designation, **_scope_filter(scope, chunk)).update(
+                count=F('count') + delta,
+            )
+
+
+def _designations(employee_ids):
+    found = {}
+    for chunk in bulk.chunked(employee_ids):
+        found.update(Employee.objects.filter(pk__in=chunk).values_list('pk', 'designation'))
+    return found
+
+
+def _memberships(**filters):
+    """ (employee id, department id, company id) of the memberships matching ``filters`` """
+    return set(
+        Membership.objects.filter(**filters).values_list('employee_id', 'department_id', 'department__company_id')
+    )
+
+
+def memberships_of(employee_ids=(), department_ids=()):
+    """ The (employee id, department id) memberships of some employees and departments """
+    pairs = set()
+    for employee_id, dept_id, _ in _memberships_of(employee_ids, department_ids):
+        pairs.add((employee_id, dept_id))
+    return pairs
+
+
+def _memberships_of(employee_ids, department_ids):
+    memberships = set()
+    for chunk in bulk.chunked(employee_ids):
+        memberships |= _memberships(employee_id__in=chunk)
+    for chunk in bulk.chunked(department_ids):
+        memberships |= _memberships(department_id__in=chunk)
+    return memberships
+
+
+def _deltas(memberships, others, designations, sign):
+    """
+    Counter changes for ``memberships`` that were just added (``sign`` 1)
+    or are about to be removed (-1). A company count only moves for an
+    employee with no other membership in that company, ``others`` holds
+    the (employee id, company id) pairs reached through the rest.
+    """
+    deltas = Counter()
+    for employee_id, dept_id, _ in memberships:
+        deltas['department', dept_id, designations[employee_id]] += sign
+    for employee_id, company_id in {(employee_id, company_id) for employee_id, _, company_id in memberships}:
+        if (employee_id, company_id) not in others:
+            deltas['company', company_id, designations[employee_id]] += sign
+    return deltas
+
+
+def _other_companies(memberships):
+    """ Companies the employees of ``memberships`` reach through memberships outside of it """
+    pairs = {(employee_id, dept_id) for employee_id, dept_id, _ in memberships}
+    company_ids = {company_id for _, _, company_id in memberships}
+    others = set()
+    for chunk in bulk.chunked({employee_id for employee_id, _ in pairs}):
+        for employee_id, dept_id, company_id in _memberships(employee_id__in=chunk, department__company_id__in=company_ids):
+            if (employee_id, dept_id) not in pairs:
+                others.add((employee_id, company_id))
+    return others
+
+
+def count_memberships(pairs, sign=1):
+    """ Count memberships just added, or with ``sign=-1`` uncount memberships about to be removed """
+    pairs = set(pairs)
+    if not pairs:
+        return
+    # They are in the table either way, the lookup also drops pairs that are not
+    employee_ids = {employee_id for employee_id, _ in pairs}
+    company_ids = Department.objects.filter(pk__in={dept_id for _, dept_id in pairs}).values('company_id')
+    memberships, others = set(), set()
+    for chunk in bulk.chunked(employee_ids):
+        for employee_id, dept_id, company_id in _memberships(employee_id__in=chunk, department__company_id__in=company_ids):
+            if (employee_id, dept_id) in pairs:
+                memberships.add((employee_id, dept_id, company_id))
+            else:
+                others.add((employee_id, company_id))
+    designations = _designations({employee_id for employee_id, _, _ in memberships})
+    apply(_deltas(memberships, others, designations, sign))
+
+
+def _count(employee_ids, department_ids, sign):
+    employee_ids = set(employee_ids)
+    memberships = _memberships_of(employee_ids, department_ids)
+    # All memberships of the employees are included, only those reached
+    # through the departments can have others
+    others = _other_companies({m for m in memberships if m[0] not in employee_ids}) if department_ids else set()
+    designations = _designations({employee_id for employee_id, _, _ in memberships} | employee_ids)
+
+    deltas = _deltas(memberships, others, designations, sign)
+    for employee_id in employee_ids:
+        if employee_id in designations:
+            deltas[OVERALL, None, designations[employee_id]] += sign
+    apply(deltas)
+
+
+def count(employee_ids=(), department_ids=()):
+    """ Count employees, with their memberships, and the memberships of departments as they are now """
+    _count(employee_ids, department_ids, 1)
+
+
+def uncount(employee_ids=(), department_ids=()):
+    """ Take what ``count()`` would count out of the counters, ahead of a change to it """
+    _count(employee_ids, department_ids, -1)
+
+
+def moved_by(instances, rows):
+    """
+    The employees and departments that partial updates ``rows`` (matched
+    to ``instances`` by ``id``) move between counters, as arguments of
+    ``changing()``.
+    """
+    moved = {'employee_ids': [], 'department_ids': []}
+    for row in rows:
+        obj = instances[row['id']]
+        if isinstance(obj, Employee) and ('department' in row or row.get('designation', obj.designation) != obj.designation):
+            moved['employee_ids'].append(obj.pk)
+        elif isinstance(obj, Department) and 'company' in row and row['company'].pk != obj.company_id:
+            moved['department_ids'].append(obj.pk)
+    return moved
+
+
+@contextmanager
+def changing(employee_ids=(), department_ids=()):
+    """ Recount employees and departments around a change that moves them between counters """
+    uncount(employee_ids, department_ids)
+    yield
+    count(employee_ids, department_ids)
+
+
+def read(company_id=None, department_id=None):
+    """ Employees per designation of a company, a department or everyone, and their total """
+    if department_id is not None:
+        scope, scope_id = 'department', department_id
+    elif company_id is not None:
+        scope, scope_id = 'company', company_id
+    else:
+        scope, scope_id = OVERALL, None
+
+    counts = dict(
+        Headcount.objects.filter(**_scope_filter(scope, [scope_id])).values_list('designation', 'count')
+    )
+    designations = {code: counts.get(code, 0) for code, _ in Employee.DESIGNATIONS}
+    return {'total': sum(designations.values()), 'designations': designations}
+
+
+def compute():
+    """ Count every scope from scratch, as a mapping of (scope, scope id, designation) to counts """
+    counts = Counter()
+    for designation, n in Employee.objects.values_list('designation').annotate(n=Count('id')).order_by():
+        counts[OVERALL, None, designation] = n
+    for dept_id, designation, n in (
+        Membership.objects.values_list('department_id', 'employee__designation').annotate(n=Count('id')).order_by()
+    ):
+        counts['department', dept_id, designation] = n
+    for company_id, designation, n in (
+        Membership.objects.values_list('department__company_id', 'employee__designation')
+        .annotate(n=Count('employee_id', distinct=True)).order_by()
+    ):
+        counts['company', company_id, designation] = n
+    return counts
+
+
+def stored():
+    """ The counters as they are, in the shape of ``compute()`` """
+    counts = Counter()
+    for company_id, dept_id, designation, n in Headcount.objects.values_list(
+        'company_id', 'department_id', 'designation', 'count',
+    ).iterator():
+        if dept_id is not None:
+            counts['department', dept_id, designation] = n
+        elif company_id is not None:
+            counts['company', company_id, designation] = n
+        else:
+            counts[OVERALL, None, designation] = n
+    return counts
+
+
+def rebuild():
+    """ Replace the counters with a count from scratch; run it inside a transaction """
+    counts = compute()
+    Headcount.objects.all().delete()
+    Headcount.objects.bulk_create(
+        [
+            Headcount(designation=designation, count=n, **({} if scope == OVERALL else {SCOPES[scope]: scope_id}))
+            for (scope, scope_id, designation), n in counts.items()
+        ],
+        batch_size=bulk.CHUNK_SIZE,
+    )
+    return counts
@@ -0,0 +1,174 @@
+"""
+Background jobs, queued in the ``Job`` table and run by ``manage.py
+run_workers`` (see ems.tasks for the tasks).
+
+Tasks are functions registered under a name with ``@task()``. ``submit()``
+queues a run of one with JSON arguments, in the current transaction, so
+the job of a write that rolls back never runs. Workers claim the ready job
+of highest priority, oldest first, in a write transaction: BEGIN IMMEDIATE
+on SQLite (see ems.sqlite), SELECT ... FOR UPDATE SKIP LOCKED where the
+database has it. No two workers run the same job and no broker is needed.
+
+A task runs in one transaction, retried on lock, unless it is registered
+with ``atomic=False`` and commits by itself. It is given a ``progress(done,
+total)`` callback, which saves them on the job's row, at most every
+``PROGRESS_INTERVAL`` seconds. Only tasks that commit as they go show it
+before they end: the row is written in the transaction of the others.
+
+A task that raises runs again after ``RETRY_BACKOFF`` seconds, doubled on
+every attempt, until its job's ``max_attempts``. A job left running for
+``TIMEOUT`` seconds, by a worker that died, is claimed again. The settings
+are in ``settings.EMS_JOBS``:
+
+    EMS_JOBS = {
+        'PROCESSES': 2, 'POLL_INTERVAL': 1, 'MAX_ATTEMPTS': 3, 'RETRY_BACKOFF': 5, 'TIMEOUT': 3600,
+        'PROGRESS_INTERVAL': 1,
+    }
+"""
+import logging
+import os
+import socket
+import time
+import traceback
+from collections import namedtuple
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+from ems import sqlite
+from ems.models import Job
+
+DEFAULTS = {
+    'PROCESSES': 2,
+    # Seconds between looks at an empty queue
+    'POLL_INTERVAL': 1,
+    'MAX_ATTEMPTS': 3,
+    # Seconds before the first retry
+    'RETRY_BACKOFF': 5,
+    'TIMEOUT': 3600,
+    # Seconds between saves of the progress of a job
+    'PROGRESS_INTERVAL': 1,
+}
+
+logger = logging.getLogger(__name__)
+
+Task = namedtuple('Task', ['func', 'priority', 'max_attempts', 'atomic'])
+TASKS = {}
+
+
+def get_setting(name):
+    return getattr(settings, 'EMS_JOBS', {}).get(name, DEFAULTS[name])
+
+
+def task(name, priority=0, max_attempts=None, atomic=True):
+    """ Register the decorated function as task ``name``, with the defaults of its jobs """
+    def register(func):
+        TASKS[name] = Task(func, priority, max_attempts, atomic)
+        return func
+    return register
+
+
+def submit(name, *args, priority=None, **kwargs):
+    """ Queue a run of task ``name`` with JSON ``args`` and ``kwargs`` """
+    if name not in TASKS:
+        raise ValueError(f'Unknown task {name!r}')
+    registered = TASKS[name]
+    return Job.objects.create(
+        task=name,
+        args=list(args),
+        kwargs=kwargs,
+        priority=registered.priority if priority is None else priority,
+        max_attempts=registered.max_attempts or get_setting('MAX_ATTEMPTS'),
+    )
+
+
+def claim(worker):
+    """ Take the next ready job for ``worker`` and mark it running; None when there is none """
+    return sqlite.retry_on_lock(_claim, worker)
+
+
+def _claim(worker):
+    now = timezone.now()
+    abandoned = now - timedelta(seconds=get_setting('TIMEOUT'))
+    ready = Job.objects.filter(
+        Q(status=Job.QUEUED, run_after__lte=now) | Q(status=Job.RUNNING, started__lt=abandoned),
+    ).order_by('-priority', 'run_after', 'id')
+    if connection.features.has_select_for_update_skip_locked:
+        ready = ready.select_for_update(skip_locked=True)
+
+    for job in ready[:10]:
+        if job.status == Job.RUNNING and job.attempts >= job.max_attempts:
+            # The task took its worker down every time
+            _finish(job, Job.FAILED, error=f'{job.worker} stopped running it after {get_setting("TIMEOUT")} s')
+            continue
+        job.status, job.worker, job.started = Job.RUNNING, worker, now
+        job.attempts += 1
+        job.save(update_fields=['status', 'worker', 'started', 'attempts'])
+        return job
+    return None
+
+
+def _finish(job, status, **fields):
+    job.status = status
+    job.finished = timezone.now()
+    for name, value in fields.items():
+        setattr(job, name, value)
+    job.save()
+
+
+def run(job):
+    """ Run a claimed job, then mark it done, queue it for a retry or mark it failed """
+    saved = None
+
+    def report(done, total):
+        nonlocal saved
+        job.done, job.total = done, total
+        if saved is not None and done < (total or 0) and time.monotonic() - saved < get_setting('PROGRESS_INTERVAL'):
+            return
+        sqlite.retry_on_lock(Job.objects.filter(pk=job.pk).update, done=done, total=total)
+        saved = time.monotonic()
+
+    started = time.monotonic()
+    try:
+        registered = TASKS[job.task]
+        if registered.atomic:
+            # A savepoint of its own, should the worker run inside a transaction
+            result = sqlite.retry_on_lock(transaction.atomic(registered.func), *job.args, progress=report, **job.kwargs)
+        else:
+            result = registered.func(*job.args, progress=report, **job.kwargs)
+    except Exception:
+        job.error = traceback.format_exc()
+        if job.attempts < job.max_attempts:
+            delay = get_setting('RETRY_BACKOFF') * 2 ** (job.attempts - 1)
+            job.status = Job.QUEUED
+            job.run_after = timezone.now() + timedelta(seconds=delay)
+            sqlite.retry_on_lock(job.save)
+            logger.warning('%s failed, retrying in %s s:\n%s', job, delay, job.error)
+        else:
+            sqlite.retry_on_lock(_finish, job, Job.FAILED)
+            logger.error('%s failed:\n%s', job, job.error)
+    else:
+        sqlite.retry_on_lock(_finish, job, Job.DONE, result=result, error='')
+        logger.info('%s done in %.1f s', job, time.monotonic() - started)
+    return job
+
+
+def work(worker=None, burst=False, stop=None):
+    """
+    Claim and run jobs until ``stop()`` is true, or with ``burst`` until
+    none is ready; returns the number of jobs run.
+    """
+    worker = worker or f'{socket.gethostname()}:{os.getpid()}'
+    ran = 0
+    while stop is None or not stop():
+        job = claim(worker)
+        if job is None:
+            if burst:
+                break
+            time.sleep(get_setting('POLL_INTERVAL'))
+            continue
+        run(job)
+        ran += 1
+    return ran
@@ -0,0 +1,51 @@
+"""
+Check the headcount counters against a count from scratch.
+
+    python manage.py headcount            # report counters that are off
+    python manage.py headcount --rebuild  # replace them with a fresh count
+    python manage.py headcount --rebuild --background  # queue the rebuild as a job
+
+Counters drift when rows are written around the paths that keep them, raw
+SQL or a QuerySet.update() of designations for instance. The check exits
+with an error when any counter is off.
+"""
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from ems import headcount, jobs
+
+# Differences printed, the rest are only counted
+MAX_REPORTED = 20
+
+
+class Command(BaseCommand):
+    help = 'Check the headcount counters, or rebuild them with --rebuild'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true', help='Replace the counters with a count from scratch')
+        parser.add_argument('--background', action='store_true', help='Queue the rebuild for manage.py run_workers')
+
+    def handle(self, *args, **options):
+        if options['background']:
+            if not options['rebuild']:
+                raise CommandError('--background only applies to --rebuild')
+            job = jobs.submit('ems.rebuild_headcount')
+            self.stdout.write(self.style.SUCCESS(f'Queued {job}'))
+            return
+        if options['rebuild']:
+            with transaction.atomic():
+                counts = headcount.rebuild()
+            self.stdout.write(self.style.SUCCESS(f'Rebuilt {len(counts)} counters'))
+            return
+
+        expected, found = headcount.compute(), headcount.stored()
+        wrong = sorted(
+            (key for key in expected.keys() | found.keys() if expected[key] != found[key]),
+            key=lambda key: (key[0], key[1] or 0, key[2]),
+        )
+        for scope, scope_id, designation in wrong[:MAX_REPORTED]:
+            key = scope, scope_id, designation
+            where = scope if scope_id is None else f'{scope} {scope_id}'
+            self.stderr.write(f'{where} {designation}: stored {found[key]}, counted {expected[key]}')
+        if wrong:
+            raise CommandError(f'{len(wrong)} counters are off, run with --rebuild to fix them')
+        self.stdout.write(self.style.SUCCESS(f'All {len(expected)} counters are right'))
@@ -0,0 +1,322 @@
+"""
+Load companies, departments, users and employees from CSV or NDJSON files.
+
+    python manage.py import_org --companies companies.csv \\
+        --departments departments.csv --employees employees.ndjson \\
+        --checkpoint import.checkpoint.json
+
+Files ending in ``.csv`` are read as CSV with a header row, anything else as
+NDJSON (one JSON object per line). The columns, or keys, of each file are:
+
+    companies    name
+    departments  company, name
+    users        username, first_name, last_name, email
+    employees    username, designation, company, departments,
+                 and optionally first_name, last_name, email
+
+An employee's ``departments`` are names of departments of its ``company``,
+joined by ``|`` in CSV or given as a list in NDJSON. Companies are matched
+by name, departments by company and name, users by username and employees
+by user. Rows that already exist are kept as they are, which makes running
+an import twice harmless.
+
+Each batch is committed in its own transaction, retried when another
+writer holds the database (see ems.sqlite). With ``--checkpoint`` the
+number of committed rows per file is recorded after every batch, and a
+rerun with the same checkpoint continues after the last committed batch.
+``--background`` queues the import as a job for ``manage.py run_workers``
+instead, which a checkpoint lets resume when the job is retried; with
+``--restart`` the checkpoint is cleared once, before the job is queued.
+"""
+import csv
+import json
+import os
+import time
+from itertools import islice
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from ems import bulk, cache, headcount, jobs, sqlite
+from ems.models import Company, Department, Employee
+
+Membership = Employee.department.through
+
+STAGES = ['companies', 'departments', 'users', 'employees']
+
+# Models written by each stage, whose cache generations it bumps
+STAGE_MODELS = {
+    'companies': [Company],
+    'departments': [Department],
+    'users': [User],
+    'employees': [User, Employee],
+}
+
+# Errors printed per file, the rest are only counted
+MAX_REPORTED_ERRORS = 20
+
+
+def read_rows(path):
+    if path.endswith('.csv'):
+        with open(path, newline='', encoding='utf-8') as f:
+            yield from csv.DictReader(f)
+    else:
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def batched(rows, size):
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+
+def _text(row, key):
+    return str(row.get(key) or '').strip()
+
+
+class RowError(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Bulk import companies, departments, users and employees from CSV or NDJSON files'
+
+    def add_arguments(self, parser):
+        for stage in STAGES:
+            parser.add_argument(f'--{stage}', metavar='PATH', help=f'CSV or NDJSON file of {stage}')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows per transaction (default: 5000)')
+        parser.add_argument('--checkpoint', metavar='PATH', help='File recording progress, to resume after a crash')
+        parser.add_argument('--restart', action='store_true', help='Ignore an existing checkpoint and start over')
+        parser.add_argument('--background', action='store_true', help='Queue the import for manage.py run_workers')
+
+    def handle(self, *args, **options):
+        if not any(options[stage] for stage in STAGES):
+            raise CommandError('Nothing to import, give at least one of: ' + ', '.join(f'--{s}' for s in STAGES))
+        if options['background']:
+            # The worker may run in another directory
+            paths = {name: os.path.abspath(options[name]) for name in [*STAGES, 'checkpoint'] if options[name]}
+            if options['restart'] and options['checkpoint'] and os.path.exists(options['checkpoint']):
+                # Once, here: the retries of the job resume from the checkpoint it writes
+                os.remove(options['checkpoint'])
+            job = jobs.submit('ems.import_org', {**paths, 'batch_size': options['batch_size']})
+            self.stdout.write(self.style.SUCCESS(f'Queued {job}'))
+            return
+
+        self.batch_size = options['batch_size']
+        self.verbosity = options['verbosity']
+        self.checkpoint_path = options['checkpoint']
+        self.checkpoint = {} if options['restart'] else self.load_checkpoint()
+
+        self.password = make_password(None)
+        # Small tables are resolved from memory, users and employees per batch
+        self.companies = {}
+        for name, pk in Company.objects.order_by('-pk').values_list('name', 'pk').iterator():
+            self.companies[name] = pk
+        self.departments = {}
+        for company_id, name, pk in Department.objects.order_by('-pk').values_list('company_id', 'name', 'pk').iterator():
+            self.departments[company_id, name] = pk
+        self.designations = {}
+        for code, label in Employee.DESIGNATIONS:
+            self.designations[code] = self.designations[label] = code
+
+        for stage in STAGES:
+            if options[stage]:
+                self.import_file(stage, options[stage])
+
+    def load_checkpoint(self):
+        if not self.checkpoint_path or not os.path.exists(self.checkpoint_path):
+            return {}
+        with open(self.checkpoint_path, encoding='utf-8') as f:
+            return json.load(f)
+
+    def save_checkpoint(self, stage, path, rows, done=False):
+        if not self.checkpoint_path:
+            return
+        self.checkpoint[stage] = {'path': path, 'rows': rows, 'done': done}
+        tmp = f'{self.checkpoint_path}.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self.checkpoint, f)
+        os.replace(tmp, self.checkpoint_path)
+
+    def import_file(self, stage, path):
+        state = self.checkpoint.get(stage, {})
+        if state and state['path'] != path:
+            raise CommandError(
+                f'The checkpoint for {stage} was written for {state["path"]}, not {path}. '
+                'Use --restart to start over.'
+            )
+        if state.get('done'):
+            self.log(f'{stage}: already imported, skipping')
+            return
+
+        done = state.get('rows', 0)
+        if done:
+            self.log(f'{stage}: resuming after row {done}')
+
+        handler = getattr(self, f'import_{stage}')
+        started = time.monotonic()
+        count, errors = done, 0
+        for batch in batched(islice(read_rows(path), done, None), self.batch_size):
+            batch_errors = sqlite.retry_on_lock(self.import_batch, stage, handler, batch)
+            for index, message in batch_errors:
+                errors += 1
+                if errors <= MAX_REPORTED_ERRORS:
+                    self.stderr.write(f'{stage}: row {count + index + 1}: {message}')
+            count += len(batch)
+            self.save_checkpoint(stage, path, count)
+
+            rate = (count - done) / max(time.monotonic() - started, 1e-6)
+            self.log(f'{stage}: {count} rows ({rate:.0f} rows/s)')
+
+        self.save_checkpoint(stage, path, count, done=True)
+        message = f'{stage}: imported {count - done - errors} rows'
+        if errors:
+            message += f', skipped {errors} rows with errors'
+        if self.verbosity:
+            self.stdout.write(self.style.SUCCESS(message))
+
+    def import_batch(self, stage, handler, batch):
+        # A batch that rolls back leaves the maps as they were, for its retry
+        maps = dict(self.companies), dict(self.departments)
+        try:
+            errors = handler(batch)
+            cache.changed(*STAGE_MODELS[stage])
+            return errors
+        except Exception:
+            self.companies, self.departments = maps
+            raise
+
+    def log(self, message):
+        if self.verbosity >= 1:
+            self.stdout.write(message)
+
+    def rows(self, batch, parse):
+        """ Parse every row of a batch, collecting (index, message) errors """
+        parsed, errors = [], []
+        for index, row in enumerate(batch):
+            try:
+                parsed.append(parse(row))
+            except RowError as exc:
+                errors.append((index, str(exc)))
+        return parsed, errors
+
+    def company_id(self, row):
+        name = _text(row, 'company')
+        if name not in self.companies:
+            raise RowError(f'unknown company {name!r}')
+        return self.companies[name]
+
+    def import_companies(self, batch):
+        def parse(row):
+            name = _text(row, 'name')
+            if not name:
+                raise RowError('name is required')
+            return name
+
+        names, errors = self.rows(batch, parse)
+        new = {name: Company(name=name) for name in names if name not in self.companies}
+        Company.objects.bulk_create(new.values(), batch_size=bulk.CHUNK_SIZE)
+        bulk.assign_pks(Company, list(new.values()))
+        self.companies.update((company.name, company.pk) for company in new.values())
+        return errors
+
+    def import_departments(self, batch):
+        def parse(row):
+            name = _text(row, 'name')
+            if not name:
+                raise RowError('name is required')
+            return self.company_id(row), name
+
+        keys, errors = self.rows(batch, parse)
+        new = {
+            key: Department(company_id=key[0], name=key[1])
+            for key in keys if key not in self.departments
+        }
+        Department.objects.bulk_create(new.values(), batch_size=bulk.CHUNK_SIZE)
+        bulk.assign_pks(Department, list(new.values()))
+        self.departments.update(((dept.company_id, dept.name), dept.pk) for dept in new.values())
+        return errors
+
+    def new_user(self, row):
+        username = _text(row, 'username')
+        if not username:
+            raise RowError('username is required')
+        return User(
+            username=username,
+            first_name=_text(row, 'first_name'),
+            last_name=_text(row, 'last_name'),
+            email=_text(row, 'email'),
+            password=self.password,
+        )
+
+    def import_users(self, batch):
+        users, errors = self.rows(batch, self.new_user)
+        User.objects.bulk_create(users, batch_size=bulk.CHUNK_SIZE, ignore_conflicts=True)
+        return errors
+
+    def import_employees(self, batch):
+        def parse(row):
+            designation = self.designations.get(_text(row, 'designation'))
+            if designation is None:
+                raise RowError(f'unknown designation {_text(row, "designation")!r}')
+
+            company_id = self.company_id(row)
+            names = row.get('departments') or []
+            if isinstance(names, str):
+                names = names.split('|')
+            department_ids = []
+            for name in (name.strip() for name in names):
+                if (company_id, name) not in self.departments:
+                    raise RowError(f'unknown department {name!r} of company {_text(row, "company")!r}')
+                department_ids.append(self.departments[company_id, name])
+            if not department_ids:
+                raise RowError('at least one department is required')
+
+            return self.new_user(row), designation, department_ids
+
+        parsed, errors = self.rows(batch, parse)
+        User.objects.bulk_create([user for user, _, _ in parsed], batch_size=bulk.CHUNK_SIZE, ignore_conflicts=True)
+
+        user_ids = {}
+        for chunk in bulk.chunked(user.username for user, _, _ in parsed):
+            user_ids.update(User.objects.filter(username__in=chunk).values_list('username', 'pk'))
+
+        # Only what this batch inserts is added to the headcount
+        existing = set()
+        for chunk in bulk.chunked(user_ids.values()):
+            existing.update(Employee.objects.filter(user_id__in=chunk).values_list('pk', flat=True))
+        existing_pairs = headcount.memberships_of(employee_ids=existing)
+
+        Employee.objects.bulk_create(
+            [Employee(user_id=user_ids[user.username], designation=designation) for user, designation, _ in parsed],
+            batch_size=bulk.CHUNK_SIZE,
+            ignore_conflicts=True,
+        )
+
+        employee_ids = {}
+        for chunk in bulk.chunked(user_ids.values()):
+            employee_ids.update(Employee.objects.filter(user_id__in=chunk).values_list('user_id', 'pk'))
+
+        pairs = {
+            (employee_ids[user_ids[user.username]], department_id)
+            for user, _, department_ids in parsed
+            for department_id in department_ids
+        }
+        Membership.objects.bulk_create(
+            [Membership(employee_id=employee_id, department_id=department_id) for employee_id, department_id in pairs],
+            batch_size=bulk.CHUNK_SIZE,
+            ignore_conflicts=True,
+        )
+        # Employees that existed already may have gained departments
+        for chunk in bulk.chunked(existing):
+            Employee.touch(pk__in=chunk)
+
+        headcount.count(employee_ids=set(employee_ids.values()) - existing)
+        headcount.count_memberships({pair for pair in pairs if pair[0] in existing} - existing_pairs)
+        return errors
@@ -0,0 +1,103 @@
+"""
+Run the background jobs of the ems queue.
+
+    python manage.py run_workers                # EMS_JOBS['PROCESSES'] workers until stopped
+    python manage.py run_workers --processes 4
+    python manage.py run_workers --burst        # until no job is ready, e.g. from cron
+
+Every worker is a process of its own, forked from this one, that claims
+and runs one job at a time (see ems.jobs). SIGTERM or Ctrl-C stops the
+workers once their current jobs end; a worker that dies otherwise is
+started again. With ``--processes 1`` the jobs run in this process.
+"""
+import multiprocessing
+import signal
+import time
+from multiprocessing.connection import wait
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from ems import jobs
+
+
+class Stop:
+    """ True once SIGTERM or SIGINT arrived while entered """
+    SIGNALS = [signal.SIGTERM, signal.SIGINT]
+
+    def __init__(self):
+        self.stopping = False
+
+    def __enter__(self):
+        self._previous = {signum: signal.signal(signum, self.handle) for signum in self.SIGNALS}
+        return self
+
+    def __exit__(self, *exc_info):
+        for signum, handler in self._previous.items():
+            signal.signal(signum, handler)
+
+    def handle(self, signum, frame):
+        self.stopping = True
+
+    def __call__(self):
+        return self.stopping
+
+
+def run_worker(burst):
+    with Stop() as stop:
+        jobs.work(burst=burst, stop=stop)
+
+
+class Command(BaseCommand):
+    help = 'Run the background jobs of the ems queue in a pool of worker processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--processes', type=int, default=None,
+            help=f'Worker processes (default: EMS_JOBS["PROCESSES"], {jobs.DEFAULTS["PROCESSES"]} unless set)',
+        )
+        parser.add_argument('--burst', action='store_true', help='Stop once no job is ready')
+
+    def handle(self, *args, **options):
+        processes = jobs.get_setting('PROCESSES') if options['processes'] is None else options['processes']
+        if processes < 1:
+            raise CommandError('--processes must be at least 1')
+        with Stop() as stop:
+            if processes == 1:
+                ran = jobs.work(burst=options['burst'], stop=stop)
+                self.stdout.write(self.style.SUCCESS(f'Ran {ran} jobs'))
+            else:
+                self.supervise(processes, options['burst'], stop)
+
+    def supervise(self, processes, burst, stop):
+        """ Run ``processes`` workers, and start those that die again, until ``stop()`` or with ``burst`` the end """
+        # Children must not share the connections of this process
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        workers = {}
+
+        def start(index):
+            workers[index] = context.Process(target=run_worker, args=(burst,), name=f'ems-worker-{index}')
+            workers[index].start()
+
+        for index in range(processes):
+            start(index)
+        self.stdout.write(f'Started {processes} workers')
+
+        forwarded = False
+        while workers:
+            wait([worker.sentinel for worker in workers.values()], timeout=1)
+            if stop() and not forwarded:
+                # Ctrl-C reaches the workers by itself, SIGTERM does not
+                for worker in workers.values():
+                    if worker.is_alive():
+                        worker.terminate()
+                forwarded = True
+            for index, worker in list(workers.items()):
+                if worker.is_alive():
+                    continue
+                del workers[index]
+                if not stop() and not (burst and worker.exitcode == 0):
+                    self.stderr.write(f'{worker.name} exited with {worker.exitcode}, starting it again')
+                    time.sleep(jobs.get_setting('POLL_INTERVAL'))
+                    start(index)
+        self.stdout.write(self.style.SUCCESS('Workers stopped'))
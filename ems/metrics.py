@@ -0,0 +1,204 @@
+"""
+Per-request SQL and latency metrics, cheap enough to leave on.
+
+``MetricsMiddleware`` times every request and, through a wrapper that
+``connection_created`` installs on every database connection, the queries
+it runs. Spans timed with ``timed('serialize')`` add up the time spent
+turning rows into JSON: the readers and the rendering of responses, minus
+the queries run meanwhile. The middleware reports a request as
+
+    Server-Timing: db;dur=3.1;desc="4 queries", serialize;dur=1.2, total;dur=6.0
+
+and adds it to the histograms of its route, the URL name of its view. The
+``metrics`` view serves them in the Prometheus text exposition format.
+They are kept per process, like the caches, so every worker is scraped on
+its own.
+
+The body of a streamed response is sent after the middleware returns, its
+queries are not counted.
+"""
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+DEFAULTS = {
+    'SERVER_TIMING': True,
+    # Upper bounds in seconds of the latency buckets
+    'LATENCY_BUCKETS': [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10],
+    'QUERY_BUCKETS': [0, 1, 2, 3, 5, 10, 20, 50, 100, 1000],
+}
+UNMATCHED = 'unmatched'
+# Other methods share one label, so that clients cannot add series at will
+METHODS = {'GET', 'HEAD', 'OPTIONS', 'POST', 'PUT', 'PATCH', 'DELETE'}
+OTHER_METHOD = 'other'
+
+# The metrics of the current request, None outside of requests
+_current = contextvars.ContextVar('ems_metrics', default=None)
+
+
+def get_setting(name):
+    return getattr(settings, 'EMS_METRICS', {}).get(name, DEFAULTS[name])
+
+
+class RequestMetrics:
+    """ Queries, database time and timed spans of one request """
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.spans = {}
+        self._open = set()
+
+    def add(self, name, seconds):
+        self.spans[name] = self.spans.get(name, 0.0) + seconds
+
+    def server_timing(self, total):
+        timings = [f'db;dur={self.db_time * 1000:.1f};desc="{self.queries} queries"']
+        timings += [f'{name};dur={seconds * 1000:.1f}' for name, seconds in self.spans.items()]
+        timings.append(f'total;dur={total * 1000:.1f}')
+        return ', '.join(timings)
+
+
+@contextmanager
+def timed(name):
+    """ Add the time spent meanwhile, less its queries, to the ``name`` span of the request """
+    metrics = _current.get()
+    # Nested spans of the same name are counted once
+    if metrics is None or name in metrics._open:
+        yield
+        return
+    metrics._open.add(name)
+    started, db_time = time.perf_counter(), metrics.db_time
+    try:
+        yield
+    finally:
+        metrics._open.discard(name)
+        metrics.add(name, time.perf_counter() - started - (metrics.db_time - db_time))
+
+
+def record_query(execute, sql, params, many, context):
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.db_time += time.perf_counter() - started
+        metrics.queries += 1
+
+
+@receiver(connection_created)
+def instrument_connection(sender, connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class Histogram:
+    """ Cumulative counts of observations per label set, under fixed bucket bounds """
+
+    def __init__(self, name, help, buckets):
+        self.name = name
+        self.help = help
+        self.buckets = list(buckets)
+        # labels -> [count per bucket, plus one above the last, sum]
+        self.series = {}
+
+    def observe(self, labels, value):
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series.setdefault(labels, [[0] * (len(self.buckets) + 1), 0.0])
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def expose(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        for labels, (counts, total) in sorted(self.series.items()):
+            label_text = ','.join(f'{key}="{_escape(value)}"' for key, value in labels)
+            cumulative = 0
+            for bound, count in zip(self.buckets + ['+Inf'], counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{label_text},le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{{label_text}}} {total}')
+            lines.append(f'{self.name}_count{{{label_text}}} {cumulative}')
+        return lines
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Registry:
+    """ The histograms of this process """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        latency = get_setting('LATENCY_BUCKETS')
+        with self._lock:
+            self.histograms = {
+                'total': Histogram('ems_request_duration_seconds', 'Latency of requests.', latency),
+                'db': Histogram('ems_request_db_duration_seconds', 'Time of the queries of requests.', latency),
+                'serialize': Histogram(
+                    'ems_request_serialize_duration_seconds', 'Time spent encoding responses.', latency,
+                ),
+                'queries': Histogram('ems_request_queries', 'Queries per request.', get_setting('QUERY_BUCKETS')),
+            }
+
+    def observe(self, labels, metrics, total):
+        with self._lock:
+            self.histograms['total'].observe(labels, total)
+            self.histograms['db'].observe(labels, metrics.db_time)
+            self.histograms['serialize'].observe(labels, metrics.spans.get('serialize', 0.0))
+            self.histograms['queries'].observe(labels, metrics.queries)
+
+    def expose(self):
+        with self._lock:
+            lines = [line for histogram in self.histograms.values() for line in histogram.expose()]
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+class MetricsMiddleware:
+    """ Measures each request, reports it in ``Server-Timing`` and adds it to ``registry`` """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        if getattr(response, 'ems_unobserved', False):
+            # A pass that does not answer the request, which the next one does (see ems.asgi)
+            return response
+        total = time.perf_counter() - started
+
+        match = request.resolver_match
+        route = (match.view_name or UNMATCHED) if match is not None else UNMATCHED
+        method = request.method if request.method in METHODS else OTHER_METHOD
+        labels = (('route', route), ('method', method), ('status', str(response.status_code)))
+        registry.observe(labels, metrics, total)
+        if get_setting('SERVER_TIMING'):
+            response['Server-Timing'] = metrics.server_timing(total)
+        return response
+
+    def process_template_response(self, request, response):
+        # Rendered here rather than by the handler, to time it
+        with timed('serialize'):
+            response.render()
+        return response
@@ -0,0 +1,52 @@
+# Generated by Django 3.1.2 on 2026-10-18 15:24
+
+from django.db import migrations, models
+
+
+def check_duplicate_departments(apps, schema_editor):
+    Department = apps.get_model('ems', 'Department')
+    duplicates = list(
+        Department.objects.values('company_id', 'name')
+        .annotate(count=models.Count('id')).filter(count__gt=1)[:10]
+    )
+    if duplicates:
+        raise RuntimeError(
+            'Department names must be unique within their company before this migration. '
+            'Rename or merge these first: '
+            + ', '.join(f"{row['name']!r} of company {row['company_id']}" for row in duplicates)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ems', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='company',
+            options={'verbose_name_plural': 'companies'},
+        ),
+        migrations.RunPython(check_duplicate_departments, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='department',
+            unique_together={('company', 'name')},
+        ),
+        migrations.AddIndex(
+            model_name='company',
+            index=models.Index(fields=['name', 'id'], name='ems_company_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='employee',
+            index=models.Index(fields=['designation', 'id'], name='ems_employee_designation_idx'),
+        ),
+        # The through table's unique (employee_id, department_id) index serves
+        # the departments of an employee; this one covers the employees of a
+        # department without reading the table.
+        migrations.RunSQL(
+            'CREATE INDEX "ems_employee_department_dept_emp_idx" '
+            'ON "ems_employee_department" ("department_id", "employee_id");',
+            'DROP INDEX "ems_employee_department_dept_emp_idx";',
+        ),
+    ]
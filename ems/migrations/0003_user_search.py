@@ -0,0 +1,62 @@
+from django.db import migrations
+
+# External content FTS5 index over the names of auth_user, kept in sync by
+# triggers. Prefix indexes make 2 and 3 character prefix queries cheap.
+CREATE_SQL = [
+    """
+    CREATE VIRTUAL TABLE ems_user_fts USING fts5(
+        username, first_name, last_name,
+        content='auth_user', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER ems_user_fts_insert AFTER INSERT ON auth_user BEGIN
+        INSERT INTO ems_user_fts (rowid, username, first_name, last_name)
+        VALUES (new.id, new.username, new.first_name, new.last_name);
+    END
+    """,
+    """
+    CREATE TRIGGER ems_user_fts_delete AFTER DELETE ON auth_user BEGIN
+        INSERT INTO ems_user_fts (ems_user_fts, rowid, username, first_name, last_name)
+        VALUES ('delete', old.id, old.username, old.first_name, old.last_name);
+    END
+    """,
+    """
+    CREATE TRIGGER ems_user_fts_update AFTER UPDATE OF username, first_name, last_name ON auth_user BEGIN
+        INSERT INTO ems_user_fts (ems_user_fts, rowid, username, first_name, last_name)
+        VALUES ('delete', old.id, old.username, old.first_name, old.last_name);
+        INSERT INTO ems_user_fts (rowid, username, first_name, last_name)
+        VALUES (new.id, new.username, new.first_name, new.last_name);
+    END
+    """,
+    "INSERT INTO ems_user_fts (ems_user_fts) VALUES ('rebuild')",
+]
+
+DROP_SQL = [
+    'DROP TRIGGER ems_user_fts_update',
+    'DROP TRIGGER ems_user_fts_delete',
+    'DROP TRIGGER ems_user_fts_insert',
+    'DROP TABLE ems_user_fts',
+]
+
+
+def run(statements):
+    def operation(apps, schema_editor):
+        # Other databases fall back to LIKE queries, see ems.filters
+        if schema_editor.connection.vendor == 'sqlite':
+            for sql in statements:
+                schema_editor.execute(sql)
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('ems', '0002_indexes_and_constraints'),
+    ]
+
+    operations = [
+        migrations.RunPython(run(CREATE_SQL), run(DROP_SQL)),
+    ]
@@ -0,0 +1,34 @@
+import time
+
+from django.db import migrations, models
+
+TABLES = ['ems_company', 'ems_department', 'ems_employee']
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ems', '0003_user_search'),
+    ]
+
+    # AddField rebuilds the whole table on SQLite. A plain ADD COLUMN with a
+    # constant default is instant; existing rows all start at version 0.
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL(
+                    f'ALTER TABLE "{table}" ADD COLUMN "version" bigint DEFAULT 0 NOT NULL;',
+                    f'ALTER TABLE "{table}" DROP COLUMN "version";',
+                )
+                for table in TABLES
+            ],
+            state_operations=[
+                migrations.AddField(
+                    model_name=model_name,
+                    name='version',
+                    field=models.BigIntegerField(default=time.time_ns, editable=False),
+                )
+                for model_name in ['company', 'department', 'employee']
+            ],
+        ),
+    ]
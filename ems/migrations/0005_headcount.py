@@ -0,0 +1,62 @@
+# Generated by Django 3.1.2 on 2026-10-18 16:13
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def count_existing(apps, schema_editor):
+    Employee = apps.get_model('ems', 'Employee')
+    Headcount = apps.get_model('ems', 'Headcount')
+    Membership = Employee.department.through
+    rows = [
+        Headcount(designation=designation, count=n)
+        for designation, n in Employee.objects.values_list('designation').annotate(n=models.Count('id')).order_by()
+    ]
+    rows += [
+        Headcount(department_id=dept_id, designation=designation, count=n)
+        for dept_id, designation, n in Membership.objects.values_list('department_id', 'employee__designation')
+        .annotate(n=models.Count('id')).order_by()
+    ]
+    rows += [
+        Headcount(company_id=company_id, designation=designation, count=n)
+        for company_id, designation, n in Membership.objects.values_list('department__company_id', 'employee__designation')
+        .annotate(n=models.Count('employee_id', distinct=True)).order_by()
+    ]
+    Headcount.objects.bulk_create(rows, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ems', '0004_versions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Headcount',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('designation', models.CharField(choices=[('Jr', 'Junior'), ('As', 'Associate'), ('Sr', 'Senior'), ('Mg', 'Manager')], max_length=2)),
+                ('count', models.IntegerField(default=0)),
+                ('company', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='ems.company')),
+                ('department', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='ems.department')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='headcount',
+            constraint=models.CheckConstraint(check=models.Q(('company', None), ('department', None), _connector='OR'), name='ems_headcount_one_scope'),
+        ),
+        migrations.AddConstraint(
+            model_name='headcount',
+            constraint=models.UniqueConstraint(condition=models.Q(('company', None), ('department', None)), fields=('designation',), name='ems_headcount_overall_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='headcount',
+            constraint=models.UniqueConstraint(condition=models.Q(company__isnull=False), fields=('company', 'designation'), name='ems_headcount_company_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='headcount',
+            constraint=models.UniqueConstraint(condition=models.Q(department__isnull=False), fields=('department', 'designation'), name='ems_headcount_department_uniq'),
+        ),
+        migrations.RunPython(count_existing, migrations.RunPython.noop),
+    ]
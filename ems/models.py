@@ -1,7 +1,34 @@
+import time
+
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth.models import User
 
-class Company(models.Model):
+
+class VersionedModel(models.Model):
+    """
+    ``version`` changes with every save(), so the API's cached JSON of a row
+    can be checked against the row itself. Writes that bypass save(), and
+    changes to what a row shows from other tables, call ``touch()``.
+    """
+    version = models.BigIntegerField(default=time.time_ns, editable=False)
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        self.version = time.time_ns()
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'version'}
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def touch(cls, **filters):
+        """ Give the rows matching ``filters`` a new version """
+        return cls.objects.filter(**filters).update(version=time.time_ns())
+
+
+class Company(VersionedModel):
     name = models.CharField(max_length=100, blank=False)
 
     def __str__(self):
@@ -9,16 +36,23 @@ class Company(models.Model):
 
     class Meta:
         verbose_name_plural = "companies"    
+        # Lookups by name, and keyset pages ordered by name
+        indexes = [models.Index(fields=['name', 'id'], name='ems_company_name_idx')]
 
 
-class Department(models.Model):
+class Department(VersionedModel):
     name = models.CharField(max_length=100, blank=False)
     company = models.ForeignKey(Company, on_delete=models.CASCADE)
 
     def __str__(self):
         return f"{self.name} ({self.company.name})" 
 
-class Employee(models.Model):
+    class Meta:
+        # Also the index for a company's departments by name
+        unique_together = [['company', 'name']]
+
+
+class Employee(VersionedModel):
     DESIGNATIONS = [
         ('Jr', 'Junior'),
         ('As', 'Associate'),
@@ -32,3 +66,84 @@ class Employee(models.Model):
 
     def __str__(self):
         return f"{self.user.first_name} {self.user.last_name}"
+
+    class Meta:
+        # Filters by designation, and keyset pages ordered by designation
+        indexes = [models.Index(fields=['designation', 'id'], name='ems_employee_designation_idx')]
+
+
+class Headcount(models.Model):
+    """
+    Number of employees of one designation in a company, in a department,
+    or overall when neither is set. Maintained by ems.headcount.
+    """
+    company = models.ForeignKey(Company, null=True, on_delete=models.CASCADE)
+    department = models.ForeignKey(Department, null=True, on_delete=models.CASCADE)
+    designation = models.CharField(choices=Employee.DESIGNATIONS, max_length=2)
+    count = models.IntegerField(default=0)
+
+    def __str__(self):
+        scope = self.department or self.company or 'Everyone'
+        return f"{scope}: {self.count} {self.get_designation_display()}"
+
+    class Meta:
+        constraints = [
+            models.CheckConstraint(
+                check=models.Q(company=None) | models.Q(department=None), name='ems_headcount_one_scope',
+            ),
+            models.UniqueConstraint(
+                fields=['designation'], condition=models.Q(company=None, department=None),
+                name='ems_headcount_overall_uniq',
+            ),
+            models.UniqueConstraint(
+                fields=['company', 'designation'], condition=models.Q(company__isnull=False),
+                name='ems_headcount_company_uniq',
+            ),
+            models.UniqueConstraint(
+                fields=['department', 'designation'], condition=models.Q(department__isnull=False),
+                name='ems_headcount_department_uniq',
+            ),
+        ]
+
+
+class Job(models.Model):
+    """
+    A run of a task of ems.jobs in the background, queued until a worker
+    of ``manage.py run_workers`` claims it.
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    task = models.CharField(max_length=100)
+    args = models.JSONField(default=list)
+    kwargs = models.JSONField(default=dict)
+    # Higher runs first
+    priority = models.IntegerField(default=0)
+    status = models.CharField(choices=STATUSES, max_length=10, default=QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    # Not claimed before, the backoff of retries
+    run_after = models.DateTimeField(default=timezone.now)
+    worker = models.CharField(max_length=100, blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    started = models.DateTimeField(null=True, blank=True)
+    finished = models.DateTimeField(null=True, blank=True)
+    done = models.PositiveIntegerField(default=0)
+    total = models.PositiveIntegerField(null=True, blank=True)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+
+    def __str__(self):
+        return f"{self.task} #{self.pk} ({self.status})"
+
+    class Meta:
+        # The next job to claim
+        indexes = [models.Index(fields=['status', '-priority', 'run_after'], name='ems_job_queue_idx')]
@@ -0,0 +1,84 @@
+"""
+Org chart of companies, their departments and each department's employees.
+
+The tree is read with three queries whatever its size: the companies, their
+departments ordered by company, and the memberships with their employee and
+user joined in, ordered by company and department. ``iter_tree()`` walks the
+three ordered results side by side and yields one company at a time, so a
+streamed tree only holds the company being written. An employee appears
+under every department they belong to.
+"""
+from itertools import groupby
+from operator import itemgetter
+
+from ems.models import Company, Department, Employee
+
+Membership = Employee.department.through
+
+
+def _groups_by(rows, key):
+    """
+    Return a function giving the rows of one key, for keys asked in the
+    same ascending order as ``rows``. Keys without rows give [].
+    """
+    groups = groupby(rows, key=key)
+    current = next(groups, None)
+
+    def rows_of(wanted):
+        nonlocal current
+        while current is not None and current[0] < wanted:
+            current = next(groups, None)
+        if current is None or current[0] != wanted:
+            return []
+        found = list(current[1])
+        current = next(groups, None)
+        return found
+
+    return rows_of
+
+
+def iter_tree(company_ids=None):
+    """ Yield each company, or those of ``company_ids``, with its departments and employees nested """
+    companies = Company.objects.order_by('id')
+    departments = Department.objects.order_by('company_id', 'id')
+    memberships = Membership.objects.order_by('department__company_id', 'department_id', 'employee_id')
+    if company_ids is not None:
+        companies = companies.filter(pk__in=company_ids)
+        departments = departments.filter(company_id__in=company_ids)
+        memberships = memberships.filter(department__company_id__in=company_ids)
+
+    departments_of = _groups_by(
+        departments.values_list('company_id', 'id', 'name').iterator(),
+        key=itemgetter(0),
+    )
+    employees_of = _groups_by(
+        memberships.values_list(
+            'department__company_id', 'department_id', 'employee_id', 'employee__user_id',
+            'employee__user__first_name', 'employee__user__last_name', 'employee__designation',
+        ).iterator(),
+        key=itemgetter(0, 1),
+    )
+
+    for company_id, name in companies.values_list('id', 'name').iterator():
+        yield {
+            'id': company_id,
+            'name': name,
+            'departments': [
+                {
+                    'id': dept_id,
+                    'name': dept_name,
+                    'employees': [
+                        {
+                            'id': emp_id,
+                            'user': user_id,
+                            'emp_first_name': first_name,
+                            'emp_last_name': last_name,
+                            'designation': designation,
+                        }
+                        for _, _, emp_id, user_id, first_name, last_name, designation
+                        in employees_of((company_id, dept_id))
+                    ],
+                }
+                for _, dept_id, dept_name in departments_of(company_id)
+            ],
+        }
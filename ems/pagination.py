@@ -0,0 +1,151 @@
+"""
+Keyset pagination for the ems API.
+
+Pages are selected with ``WHERE (sort key, id) > (last seen row)`` instead of
+OFFSET, so the cost of a page does not depend on how deep it is. The id is
+always appended to the ordering as a tie-breaker, which makes every position
+unique and lets any allowed sort key be paginated without offsets.
+
+The ``cursor`` query parameter is URL-safe base64 of a JSON object:
+
+    {"o": ["name", "id"], "p": ["Acme", 42], "r": 1}
+
+``o`` is the ordering the cursor was issued for, ``p`` the sort key values of
+the boundary row and ``r`` (optional) marks a cursor that walks backwards.
+A cursor issued for a different ordering is rejected as invalid.
+"""
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as BinasciiError
+from functools import reduce
+from operator import or_
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import Cursor, CursorPagination, _reverse_ordering
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(CursorPagination):
+    ordering = 'id'
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
+    def paginate_queryset(self, queryset, request, view=None):
+        # Viewsets may declare their own `page_size` and `max_page_size`
+        self.page_size = getattr(view, 'page_size', self.page_size)
+        self.max_page_size = getattr(view, 'max_page_size', self.max_page_size)
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+
+        position = self.cursor.position if self.cursor else None
+        reverse = bool(self.cursor and self.cursor.reverse)
+        ordering = _reverse_ordering(self.ordering) if reverse else self.ordering
+
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            queryset = queryset.filter(self._keyset_filter(ordering, position))
+
+        # Fetch one extra row to find out whether there is a following page
+        results = list(queryset[:self.page_size + 1])
+        self.page = results[:self.page_size]
+        has_following = len(results) > self.page_size
+
+        if reverse:
+            self.page.reverse()
+            self.has_next = True
+            self.has_previous = has_following
+        else:
+            self.has_next = has_following
+            self.has_previous = position is not None
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+
+        return self.page
+
+    def get_ordering(self, request, queryset, view):
+        ordering = list(super().get_ordering(request, queryset, view))
+        for field in ordering:
+            if '__' in field:
+                raise NotFound('Ordering on related fields is not supported.')
+        if not {'id', '-id', 'pk', '-pk'} & set(ordering):
+            ordering.append('-id' if ordering[-1].startswith('-') else 'id')
+        return tuple(ordering)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        if self.page:
+            position = self._get_position_from_instance(self.page[-1], self.ordering)
+        else:
+            position = self.cursor.position
+        return self.encode_cursor(Cursor(offset=0, reverse=False, position=position))
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if self.page:
+            position = self._get_position_from_instance(self.page[0], self.ordering)
+        else:
+            position = self.cursor.position
+        return self.encode_cursor(Cursor(offset=0, reverse=True, position=position))
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+
+        try:
+            tokens = json.loads(urlsafe_b64decode(encoded.encode('ascii')))
+            ordering = tuple(tokens['o'])
+            position = list(tokens['p'])
+            reverse = bool(tokens.get('r', 0))
+        except (BinasciiError, KeyError, TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+        if ordering != self.ordering or len(position) != len(ordering):
+            raise NotFound(self.invalid_cursor_message)
+
+        return Cursor(offset=0, reverse=reverse, position=position)
+
+    def encode_cursor(self, cursor):
+        tokens = {'o': self.ordering, 'p': cursor.position}
+        if cursor.reverse:
+            tokens['r'] = 1
+        encoded = urlsafe_b64encode(
+            json.dumps(tokens, cls=DjangoJSONEncoder, separators=(',', ':')).encode('ascii')
+        ).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def _get_position_from_instance(self, instance, ordering):
+        position = []
+        for field in ordering:
+            name = field.lstrip('-')
+            if isinstance(instance, dict):
+                position.append(instance[name])
+            else:
+                position.append(getattr(instance, name))
+        return json.loads(json.dumps(position, cls=DjangoJSONEncoder))
+
+    @staticmethod
+    def _keyset_filter(ordering, position):
+        """
+        Expand ``(a, b, c) > (x, y, z)`` into
+        ``a > x OR (a = x AND b > y) OR (a = x AND b = y AND c > z)``
+        honouring the direction of each ordering field.
+        """
+        clauses = []
+        equal = {}
+        for field, value in zip(ordering, position):
+            name = field.lstrip('-')
+            lookup = '__lt' if field.startswith('-') else '__gt'
+            clauses.append(Q(**equal, **{name + lookup: value}))
+            equal[name] = value
+        return reduce(or_, clauses)
@@ -0,0 +1,229 @@
+"""
+Read path for GET list and retrieve that skips ModelSerializer.
+
+A ModelSerializer builds a tree of field objects for every request and
+walks it for every row, calling a field's get_attribute() and
+to_representation() per value. Readers produce the same dicts, key for
+key, from values() rows: each output key has an accessor compiled once per
+request, either a column getter or a function of the row for nested data.
+Many-to-many values are loaded with one query per page. The serializers
+stay the definition of the output shape, and ems/tests/test_readers.py
+checks that both paths render identical bytes.
+
+List pages go one step further with ``render()``: every row is encoded to
+JSON on its own and kept in ``ems.cache.fragments`` under the row's
+``version`` column, and ``FragmentResponse`` joins the fragments into the
+page. Only rows that changed since they were last encoded are built and
+encoded again; the related data of the others is not even loaded.
+"""
+import json
+from collections import defaultdict
+from operator import itemgetter
+
+from django.contrib.auth.models import User
+from rest_framework.response import Response
+from ems import bulk, cache, metrics
+from ems.models import Company, Department, Employee
+
+Membership = Employee.department.through
+
+
+class Reader:
+    """
+    ``get_fields()`` returns (key, accessor) pairs in output order, where an
+    accessor is a values() column name or a function of the row. Columns
+    only used by functions are listed in ``get_extra_columns()``.
+    """
+
+    model = None
+    # Whether list pages are assembled from cached row fragments
+    cache_fragments = True
+
+    def __init__(self, expand=frozenset(), fields=None):
+        self.expand = expand
+        # The ``?fields=`` selection, None for all fields
+        self.requested = fields
+        self.fields = [(key, accessor) for key, accessor in self.get_fields() if self.wants(key)]
+
+    def wants(self, key):
+        return self.requested is None or key in self.requested
+
+    def get_fields(self):
+        raise NotImplementedError
+
+    def get_extra_columns(self):
+        return []
+
+    def get_dependencies(self):
+        """
+        Other models whose changes alter rows without a new row version.
+        Any change to them encodes all fragments again.
+        """
+        return []
+
+    def queryset(self, queryset, columns=()):
+        """ values() of ``queryset`` with the columns this reader needs, plus ``columns`` """
+        needed = ['id'] + [accessor for _, accessor in self.fields if isinstance(accessor, str)]
+        needed += self.get_extra_columns() + list(columns)
+        if self.cache_fragments:
+            needed.append('version')
+        return queryset.prefetch_related(None).values(*dict.fromkeys(needed))
+
+    def prepare(self, rows):
+        """ Load the related data of a page of rows """
+
+    def read(self, rows):
+        with metrics.timed('serialize'):
+            rows = list(rows)
+            self.prepare(rows)
+            getters = [
+                (key, itemgetter(accessor) if isinstance(accessor, str) else accessor)
+                for key, accessor in self.fields
+            ]
+            return [{key: get(row) for key, get in getters} for row in rows]
+
+    def render(self, rows, encode):
+        """
+        The JSON bytes of each row, from the fragment cache or ``encode()``.
+        Versions come with the rows and are bumped in the transaction of a
+        change, so a fragment is never stored under a version newer than
+        its data.
+        """
+        with metrics.timed('serialize'):
+            rows = list(rows)
+            shape = (
+                self.model._meta.label_lower,
+                tuple(sorted(self.expand)),
+                tuple(key for key, _ in self.fields),
+                cache.generations(self.get_dependencies()),
+            )
+            keys = [(shape, row['id'], row['version']) for row in rows]
+
+            fragments = [cache.fragments.get(key) for key in keys]
+            missing = [index for index, fragment in enumerate(fragments) if fragment is None]
+            if missing:
+                for index, data in zip(missing, self.read([rows[index] for index in missing])):
+                    fragments[index] = encode(data)
+                    cache.fragments.set(keys[index], fragments[index], len(fragments[index]))
+            return fragments
+
+
+class FragmentResponse(Response):
+    """
+    A page whose ``results`` are JSON fragments from ``Reader.render()``.
+    ``data`` is the page with empty results, which the accepted JSON
+    renderer renders as usual before the fragments are spliced in, or
+    with the decoded fragments if the results do not close the page. Once
+    rendered, ``data`` is the decoded content.
+    """
+
+    def __init__(self, data, fragments, **kwargs):
+        self.fragments = fragments
+        super().__init__(data, **kwargs)
+
+    @property
+    def data(self):
+        if self.is_rendered:
+            return json.loads(self.content)
+        return self._data
+
+    @data.setter
+    def data(self, value):
+        self._data = value
+
+    @property
+    def rendered_content(self):
+        content = super().rendered_content
+        # The empty results list closes the page
+        if content.endswith(b'[]}'):
+            return content[:-2] + b','.join(self.fragments) + b']}'
+        # Laid out otherwise, the page is rendered again with the results decoded
+        self._data = {**self._data, 'results': [json.loads(fragment) for fragment in self.fragments]}
+        return super().rendered_content
+
+
+def _company(row, prefix=''):
+    return {'id': row[f'{prefix}company_id'], 'name': row[f'{prefix}company__name']}
+
+
+class CompanyReader(Reader):
+    model = Company
+
+    def get_fields(self):
+        return [('id', 'id'), ('name', 'name')]
+
+
+class UserReader(Reader):
+    model = User
+    cache_fragments = False
+
+    def get_fields(self):
+        return [('id', 'id'), ('username', 'username'), ('first_name', 'first_name'), ('last_name', 'last_name')]
+
+
+class DepartmentReader(Reader):
+    model = Department
+
+    def get_fields(self):
+        company = _company if 'company' in self.expand else 'company_id'
+        return [('id', 'id'), ('name', 'name'), ('company', company)]
+
+    def get_extra_columns(self):
+        return ['company_id', 'company__name'] if self.expands_company() else []
+
+    def get_dependencies(self):
+        return [Company] if self.expands_company() else []
+
+    def expands_company(self):
+        return 'company' in self.expand and self.wants('company')
+
+
+class EmployeeReader(Reader):
+    model = Employee
+
+    def get_fields(self):
+        return [
+            ('id', 'id'),
+            ('user', 'user_id'),
+            ('emp_first_name', 'user__first_name'),
+            ('emp_last_name', 'user__last_name'),
+            ('department', self.departments_of),
+            ('designation', 'designation'),
+        ]
+
+    def get_dependencies(self):
+        if not self.wants('department'):
+            return []
+        # Deleting a department drops its memberships without m2m_changed
+        return [Department, Company] if 'company' in self.expand else [Department]
+
+    def prepare(self, rows):
+        self.departments = defaultdict(list)
+        if not self.wants('department'):
+            return
+        columns = ['employee_id', 'department_id']
+        if 'department' in self.expand:
+            columns += ['department__name', 'department__company_id']
+            if 'company' in self.expand:
+                columns.append('department__company__name')
+
+        for chunk in bulk.chunked(row['id'] for row in rows):
+            memberships = Membership.objects.filter(employee_id__in=chunk).order_by('employee_id', 'department_id')
+            if 'department' not in self.expand:
+                for employee_id, department_id in memberships.values_list(*columns):
+                    self.departments[employee_id].append(department_id)
+                continue
+
+            expand_company = 'company' in self.expand
+            for membership in memberships.values(*columns):
+                self.departments[membership['employee_id']].append({
+                    'id': membership['department_id'],
+                    'name': membership['department__name'],
+                    'company': (
+                        _company(membership, 'department__') if expand_company
+                        else membership['department__company_id']
+                    ),
+                })
+
+    def departments_of(self, row):
+        return self.departments.get(row['id'], [])
@@ -0,0 +1,120 @@
+"""
+Database router sending the reads of chosen viewsets to read-only databases.
+
+``settings.EMS_ROUTER['READ_DATABASES']`` names the aliases of ``DATABASES``
+that serve reads: read-only SQLite URIs of the primary file
+(``file:/path/db.sqlite3?mode=ro``) or copies kept by a replication tool.
+Safe requests to the viewsets listed in ``VIEWSETS`` read the ``ems`` and
+``auth`` models from one of them; everything else, and every write, uses
+``default``, the primary.
+
+Reads stay on the primary where a replica could miss a write:
+
+* for the rest of a request once it wrote,
+* for ``STICKY_SECONDS`` after a client's write request to one of the
+  ``VIEWSETS``, through the ``ems_primary`` cookie that request sets.
+
+With ``REPLICAS_LAG``, responses read from a replica are neither stored in
+the response cache nor given validators, since they may predate the
+generations they would be cached under.
+"""
+import contextvars
+import random
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+DEFAULTS = {
+    'READ_DATABASES': [],
+    # Names of the viewset classes whose reads go to READ_DATABASES
+    'VIEWSETS': [],
+    'STICKY_SECONDS': 5,
+    'REPLICAS_LAG': False,
+}
+STICKY_COOKIE = 'ems_primary'
+ROUTED_APPS = {'ems', 'auth'}
+
+# The read database of the current request, None for the primary
+_read_database = contextvars.ContextVar('ems_read_database', default=None)
+
+
+def get_setting(name):
+    return getattr(settings, 'EMS_ROUTER', {}).get(name, DEFAULTS[name])
+
+
+def routed(viewset):
+    """ Whether the reads of ``viewset`` may go to READ_DATABASES """
+    return bool(get_setting('READ_DATABASES')) and type(viewset).__name__ in get_setting('VIEWSETS')
+
+
+def read_database(viewset, request):
+    """ The database the reads of ``request`` to ``viewset`` go to, None for the primary """
+    if (
+        not routed(viewset)
+        or request.method not in ('GET', 'HEAD', 'OPTIONS')
+        or STICKY_COOKIE in request.COOKIES
+    ):
+        return None
+    return random.choice(get_setting('READ_DATABASES'))
+
+
+@contextmanager
+def reading_from(database):
+    """ Route the reads made meanwhile to ``database`` """
+    token = _read_database.set(database)
+    try:
+        yield
+    finally:
+        _read_database.reset(token)
+
+
+def iterate_from(database, iterator):
+    """ ``iterator``, advanced with its reads routed to ``database`` """
+    iterator = iter(iterator)
+    while True:
+        with reading_from(database):
+            try:
+                part = next(iterator)
+            except StopIteration:
+                return
+        yield part
+
+
+def stick(viewset, response):
+    """ Keep the next reads of the client of ``response``, a write to ``viewset``, on the primary """
+    # Clients of viewsets read from the primary anyway need no cookie
+    if routed(viewset):
+        response.set_cookie(STICKY_COOKIE, '1', max_age=get_setting('STICKY_SECONDS'), httponly=True, samesite='Lax')
+
+
+def lagging_read():
+    """ Whether the current request reads from a replica that may lag behind """
+    return get_setting('REPLICAS_LAG') and _read_database.get() is not None
+
+
+class ReadWriteRouter:
+    """ Reads of the ``ems`` and ``auth`` models from the request's read database, writes to the primary """
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label in ROUTED_APPS:
+            return _read_database.get() or DEFAULT_DB_ALIAS
+        return None
+
+    def db_for_write(self, model, **hints):
+        if model._meta.app_label in ROUTED_APPS:
+            # Read your writes for the rest of the request
+            _read_database.set(None)
+            return DEFAULT_DB_ALIAS
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *get_setting('READ_DATABASES')}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in get_setting('READ_DATABASES'):
+            return False
+        return None
@@ -1,32 +1,348 @@
+from collections import defaultdict
+from django.contrib.auth.validators import UnicodeUsernameValidator
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import Q
+from django.utils.text import capfirst
 from rest_framework import serializers
-from ems.models import Employee, Department, Company
+from rest_framework.validators import UniqueTogetherValidator, UniqueValidator
+from ems import bulk
+from ems.models import Employee, Department, Company, Job
 from django.contrib.auth.models import User
 
 
-class UserSerializer(serializers.ModelSerializer):
+class ExpandableFieldsMixin:
+    """
+    Swaps primary key fields for nested serializers when their name is in
+    the ``expand`` set of the serializer context, e.g. ``?expand=company``.
+    Nested serializers share the root context, so expansion cascades.
+    """
+    expandable_fields = {}
+
+    def get_fields(self):
+        fields = super().get_fields()
+        expand = self.context.get('expand', ())
+        for name, (serializer_class, kwargs) in self.expandable_fields.items():
+            if name in expand:
+                fields[name] = serializer_class(read_only=True, **kwargs)
+        return fields
+
+
+class SparseFieldsMixin:
+    """
+    Keeps only the fields named in the ``fields`` set of the serializer
+    context, e.g. ``?fields=id,designation``; None keeps them all. Only the
+    top-level serializer is pruned, expanded objects stay whole.
+    """
+
+    def get_fields(self):
+        fields = super().get_fields()
+        names = self.context.get('fields')
+        parent = self.parent.parent if isinstance(self.parent, serializers.ListSerializer) else self.parent
+        if names is not None and parent is None:
+            fields = {name: field for name, field in fields.items() if name in names}
+        return fields
+
+
+class UserSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ['id', 'username', 'first_name', 'last_name']
 
 
-class CompanySerializer(serializers.ModelSerializer):
+class CompanySerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Company
         fields = ['id', 'name']        
 
 
-class DepartmentSerializer(serializers.ModelSerializer):
+class DepartmentSerializer(SparseFieldsMixin, ExpandableFieldsMixin, serializers.ModelSerializer):
+    expandable_fields = {'company': (CompanySerializer, {})}
+
     class Meta:
         model = Department
         fields = ['id', 'name', 'company']
 
 
-class EmployeeSerializer(serializers.ModelSerializer):
+class EmployeeSerializer(SparseFieldsMixin, ExpandableFieldsMixin, serializers.ModelSerializer):
     emp_first_name = serializers.ReadOnlyField(source='user.first_name')
     emp_last_name = serializers.ReadOnlyField(source='user.last_name')
     # dept_name = serializers.ReadOnlyField(source='department.name',many=True)
-    # department = DepartmentSerializer(many=True)
+    expandable_fields = {'department': (DepartmentSerializer, {'many': True})}
 
     class Meta:
         model = Employee
         fields = ['id', 'user', 'emp_first_name', 'emp_last_name', 'department','designation']
+
+
+class CachedPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+    Resolves primary keys from the objects BulkListSerializer preloaded for
+    the whole batch, so validating N items does not run N queries.
+    """
+
+    def to_internal_value(self, data):
+        model = self.get_queryset().model
+        cache = self.context.get('pk_cache', {}).get(model)
+        if cache is None:
+            return super().to_internal_value(data)
+        try:
+            return cache[model._meta.pk.to_python(data)]
+        except KeyError:
+            self.fail('does_not_exist', pk_value=data)
+        except (TypeError, DjangoValidationError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+
+
+class BulkListSerializer(serializers.ListSerializer):
+    """
+    List serializer behind the ``bulk`` endpoints.
+
+    Related primary keys of the whole batch are loaded with one query per
+    chunk before any item is validated, and unique fields are checked for the
+    batch at once instead of per item. Errors are reported per item, in
+    payload order. Pass a queryset as ``instance`` to update: every item then
+    needs the ``id`` of the row it changes.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Replaced by the batch-wide check in validate_unique()
+        for field in getattr(self.child, 'fields', {}).values():
+            field.validators = [v for v in field.validators if not isinstance(v, UniqueValidator)]
+        if isinstance(self.child, serializers.Serializer):
+            self.child.validators = [
+                v for v in self.child.validators if not isinstance(v, UniqueTogetherValidator)
+            ]
+
+    def to_internal_value(self, data):
+        if not isinstance(data, list):
+            return super().to_internal_value(data)
+
+        self.context['pk_cache'] = self.preload_related(data)
+        errors = [{} for _ in data]
+
+        instances = {}
+        if self.instance is not None:
+            instances = self.preload_instances(data, errors)
+
+        ret = []
+        for index, item in enumerate(data):
+            try:
+                validated = self.child.run_validation(item)
+            except serializers.ValidationError as exc:
+                errors[index] = {**exc.detail, **errors[index]} if isinstance(exc.detail, dict) else exc.detail
+                validated = None
+            else:
+                if self.instance is not None and 'id' in errors[index]:
+                    # Without a row of its own, the item is left out of the batch checks
+                    validated = None
+                elif self.instance is not None:
+                    validated['id'] = item.get('id')
+            ret.append(validated)
+
+        if isinstance(self.child, serializers.ModelSerializer):
+            self.validate_unique(ret, instances, errors)
+            validate_batch = getattr(self.child, 'validate_batch', None)
+            if validate_batch is not None:
+                validate_batch(ret, errors)
+
+        if any(errors):
+            raise serializers.ValidationError(errors)
+        self.instances = instances
+        return ret
+
+    def preload_related(self, data):
+        relations = {'': self.child} if isinstance(self.child, serializers.RelatedField) else {
+            name: getattr(field, 'child_relation', field)
+            for name, field in self.child.fields.items()
+            if not field.read_only
+        }
+        relations = {
+            name: relation for name, relation in relations.items()
+            if isinstance(relation, CachedPrimaryKeyRelatedField)
+        }
+
+        wanted = defaultdict(set)
+        for item in data:
+            for name, relation in relations.items():
+                value = item.get(name) if name and isinstance(item, dict) else item
+                model = relation.get_queryset().model
+                for pk in value if isinstance(value, list) else [value]:
+                    try:
+                        pk = model._meta.pk.to_python(pk)
+                    except (TypeError, DjangoValidationError):
+                        continue
+                    if pk is not None:
+                        wanted[model].add(pk)
+
+        return {
+            relation.get_queryset().model: bulk.in_bulk(
+                relation.get_queryset(), wanted[relation.get_queryset().model]
+            )
+            for relation in relations.values()
+        }
+
+    def preload_instances(self, data, errors):
+        model = self.child.Meta.model
+        pks = {}
+        for index, item in enumerate(data):
+            try:
+                pks[index] = model._meta.pk.to_python(item.get('id') if isinstance(item, dict) else None)
+            except DjangoValidationError:
+                pks[index] = None
+        instances = bulk.in_bulk(self.instance, {pk for pk in pks.values() if pk is not None})
+
+        seen = set()
+        for index, pk in pks.items():
+            if pk is None:
+                errors[index] = {'id': ['This field is required.']}
+            elif pk not in instances:
+                errors[index] = {'id': ['Not found.']}
+            elif pk in seen:
+                errors[index] = {'id': ['Duplicate id in this batch.']}
+            else:
+                seen.add(pk)
+                data[index] = {**data[index], 'id': pk}
+        return instances
+
+    def validate_unique(self, items, instances, errors):
+        """ Check the model's unique fields and sets against the batch and the table """
+        model = self.child.Meta.model
+        opts = model._meta
+        unique_sets = [(f.name,) for f in opts.concrete_fields if f.unique and not f.primary_key]
+        unique_sets += [tuple(fields) for fields in opts.unique_together]
+        unique_sets += [tuple(c.fields) for c in opts.total_unique_constraints]
+
+        for fields in unique_sets:
+            keys = {}
+            for index, item in enumerate(items):
+                if item is None:
+                    continue
+                instance = instances.get(item.get('id'))
+                key = []
+                for name in fields:
+                    if name in item:
+                        value = item[name]
+                    else:
+                        # The raw column, a foreign key would load its row
+                        value = getattr(instance, opts.get_field(name).attname, None)
+                    key.append(value.pk if hasattr(value, 'pk') else value)
+                if any(v is None or isinstance(v, dict) for v in key):
+                    continue
+                key = tuple(key)
+                if key in keys:
+                    self._unique_error(errors, index, model, fields)
+                else:
+                    keys[key] = index
+
+            for chunk in bulk.chunked(keys):
+                clashes = Q()
+                for key in chunk:
+                    clashes |= Q(**dict(zip(fields, key)))
+                for row in model.objects.filter(clashes).values_list('pk', *fields):
+                    index = keys[tuple(row[1:])]
+                    if items[index].get('id') != row[0]:
+                        self._unique_error(errors, index, model, fields)
+
+    @staticmethod
+    def _unique_error(errors, index, model, fields):
+        if len(fields) == 1:
+            field = model._meta.get_field(fields[0])
+            message = field.error_messages['unique'] % {
+                'model_name': capfirst(model._meta.verbose_name),
+                'field_label': field.verbose_name,
+            }
+            errors[index].setdefault(fields[0], []).append(message)
+        else:
+            message = 'The fields {} must make a unique set.'.format(', '.join(fields))
+            errors[index].setdefault('non_field_errors', []).append(message)
+
+    def create(self, validated_data):
+        return bulk.create_objects(self.child.Meta.model, validated_data)
+
+    def update(self, instance, validated_data):
+        return bulk.update_objects(self.instances, validated_data)
+
+
+class BulkModelSerializer(serializers.ModelSerializer):
+    serializer_related_field = CachedPrimaryKeyRelatedField
+
+    class Meta:
+        list_serializer_class = BulkListSerializer
+
+
+class CompanyBulkSerializer(BulkModelSerializer):
+    class Meta(BulkModelSerializer.Meta):
+        model = Company
+        fields = CompanySerializer.Meta.fields
+
+
+class DepartmentBulkSerializer(BulkModelSerializer):
+    class Meta(BulkModelSerializer.Meta):
+        model = Department
+        fields = DepartmentSerializer.Meta.fields
+
+
+class NewUserSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = User
+        fields = ['username', 'first_name', 'last_name', 'email']
+        # Usernames are checked for the whole batch by EmployeeBulkSerializer
+        extra_kwargs = {'username': {'validators': [UnicodeUsernameValidator()]}}
+
+
+class UserOrPrimaryKeyField(CachedPrimaryKeyRelatedField):
+    """ An existing user's id, or on create a dict of fields for a user to create """
+    default_error_messages = {
+        'new_on_update': 'Only the id of an existing user may be given when updating.',
+    }
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        # Built once per field, fields of a fresh serializer are rebuilt per item
+        self.new_user = NewUserSerializer()
+
+    def to_internal_value(self, data):
+        if isinstance(data, dict):
+            # Updates save the rows as they are, users are only created with their employees
+            if self.root.instance is not None:
+                self.fail('new_on_update')
+            return self.new_user.run_validation(data)
+        return super().to_internal_value(data)
+
+
+class EmployeeBulkSerializer(BulkModelSerializer):
+    user = UserOrPrimaryKeyField(queryset=User.objects.all())
+
+    class Meta(BulkModelSerializer.Meta):
+        model = Employee
+        fields = ['id', 'user', 'department', 'designation']
+
+    def validate_batch(self, items, errors):
+        usernames = {}
+        for index, item in enumerate(items):
+            if item is not None and isinstance(item.get('user'), dict):
+                username = item['user']['username']
+                if username in usernames:
+                    errors[index]['user'] = {'username': ['Duplicate username in this batch.']}
+                usernames.setdefault(username, index)
+
+        for chunk in bulk.chunked(usernames):
+            for username in User.objects.filter(username__in=chunk).values_list('username', flat=True):
+                errors[usernames[username]]['user'] = {
+                    'username': [User._meta.get_field('username').error_messages['unique']],
+                }
+
+
+class JobSerializer(serializers.ModelSerializer):
+    progress = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Job
+        fields = [
+            'id', 'task', 'args', 'kwargs', 'priority', 'status', 'attempts', 'max_attempts', 'run_after',
+            'worker', 'created', 'started', 'finished', 'progress', 'result', 'error',
+        ]
+
+    def get_progress(self, job):
+        return {'done': job.done, 'total': job.total}
@@ -0,0 +1,100 @@
+"""
+Bump the cache generations of ``ems.cache`` whenever a served model
+changes, and the versions of employee rows whose output changed without
+a save() of the employee. Keep the ``ems.headcount`` counters in step.
+
+bulk_create(), bulk_update() and QuerySet.update() send no signals; code
+using them calls ``cache.changed()``, ``touch()`` and ``ems.headcount``
+itself.
+"""
+from django.contrib.auth.models import User
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from ems import cache, headcount
+from ems.models import Company, Department, Employee
+
+Membership = Employee.department.through
+
+# User fields that employee rows show
+EMPLOYEE_USER_FIELDS = {'first_name', 'last_name'}
+
+
+@receiver(post_save, sender=Company)
+@receiver(post_save, sender=Department)
+@receiver(post_save, sender=Employee)
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=Company)
+@receiver(post_delete, sender=Department)
+@receiver(post_delete, sender=Employee)
+@receiver(post_delete, sender=User)
+def model_changed(sender, **kwargs):
+    cache.changed(sender)
+
+
+@receiver(post_save, sender=User)
+def user_changed(sender, instance, created, update_fields=None, **kwargs):
+    # A new user has no employee yet, and logins only save last_login
+    if created or (update_fields is not None and not EMPLOYEE_USER_FIELDS & set(update_fields)):
+        return
+    Employee.touch(user_id=instance.pk)
+
+
+@receiver(m2m_changed, sender=Membership)
+def membership_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action in ('post_add', 'post_remove') and not pk_set:
+        return
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        cache.changed(Employee)
+        if not reverse:
+            Employee.touch(pk=instance.pk)
+        elif action != 'post_clear':
+            Employee.touch(pk__in=pk_set)
+    elif action == 'pre_clear' and reverse:
+        # The employees of the department are only known before clear() runs
+        Employee.touch(department=instance)
+
+
+@receiver(pre_save, sender=Employee)
+@receiver(pre_save, sender=Department)
+def recount_before_save(sender, instance, update_fields=None, **kwargs):
+    """ Take employees changing designation and departments changing company out of the headcount """
+    instance._headcount_changing = False
+    field = 'designation' if sender is Employee else 'company'
+    if instance.pk is None or (update_fields is not None and field not in update_fields):
+        return
+    old = sender.objects.filter(pk=instance.pk).values_list(field, flat=True).first()
+    if old is not None and old != getattr(instance, sender._meta.get_field(field).attname):
+        instance._headcount_changing = True
+        headcount.uncount(**_headcount_scope(instance))
+
+
+@receiver(post_save, sender=Employee)
+@receiver(post_save, sender=Department)
+def recount_after_save(sender, instance, created, **kwargs):
+    if created and sender is Employee:
+        headcount.apply({(headcount.OVERALL, None, instance.designation): 1})
+    elif getattr(instance, '_headcount_changing', False):
+        headcount.count(**_headcount_scope(instance))
+
+
+@receiver(pre_delete, sender=Employee)
+@receiver(pre_delete, sender=Department)
+def uncount_before_delete(sender, instance, **kwargs):
+    # The memberships are deleted without m2m_changed
+    headcount.uncount(**_headcount_scope(instance))
+
+
+def _headcount_scope(instance):
+    if isinstance(instance, Employee):
+        return {'employee_ids': [instance.pk]}
+    return {'department_ids': [instance.pk]}
+
+
+@receiver(m2m_changed, sender=Membership)
+def recount_memberships(sender, instance, action, reverse, pk_set, **kwargs):
+    if action in ('post_add', 'pre_remove') and pk_set:
+        pairs = [(pk, instance.pk) for pk in pk_set] if reverse else [(instance.pk, pk) for pk in pk_set]
+        headcount.count_memberships(pairs, 1 if action == 'post_add' else -1)
+    elif action == 'pre_clear':
+        scope = {'department_ids': [instance.pk]} if reverse else {'employee_ids': [instance.pk]}
+        headcount.count_memberships(headcount.memberships_of(**scope), -1)
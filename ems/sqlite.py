@@ -0,0 +1,109 @@
+"""
+SQLite connection profile and lock handling, for several workers sharing
+one database file.
+
+Every new SQLite connection gets the pragmas of
+``settings.EMS_SQLITE['PRAGMAS']``. The defaults switch to WAL, where
+readers no longer wait for a writer and a writer no longer waits for
+readers. ``synchronous=normal`` then only syncs at checkpoints. A writer
+waits up to ``busy_timeout`` milliseconds for the write lock. The other
+pragmas size the page cache, the memory map and where temporary tables go.
+
+A deferred transaction that read under an older snapshot cannot take the
+write lock once another writer committed; SQLite fails it at once with
+"database is locked", whatever the busy timeout. ``retry_on_lock()`` starts
+write transactions with BEGIN IMMEDIATE instead, so writers queue for the
+lock up front, and runs them again from the start when the lock stays
+taken, after a backoff that doubles on every attempt (``LOCK_RETRIES`` and
+``LOCK_BACKOFF``). Immediate transactions need the database backend of
+ems.backends.sqlite3 as the ENGINE.
+"""
+import random
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import OperationalError, transaction
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+DEFAULTS = {
+    'PRAGMAS': {
+        # First, so that switching to WAL waits for other connections too
+        'busy_timeout': 5000,
+        'journal_mode': 'wal',
+        'synchronous': 'normal',
+        'mmap_size': 256 * 2 ** 20,
+        # Negative sizes are in KiB
+        'cache_size': -64000,
+        'temp_store': 'memory',
+    },
+    'LOCK_RETRIES': 5,
+    # Seconds before the first retry
+    'LOCK_BACKOFF': 0.05,
+}
+
+
+def get_setting(name):
+    return getattr(settings, 'EMS_SQLITE', {}).get(name, DEFAULTS[name])
+
+
+def configure(dbapi_connection, pragmas=None):
+    """ Apply ``pragmas``, by default those of the settings, to a sqlite3 connection """
+    for name, value in (get_setting('PRAGMAS') if pragmas is None else pragmas).items():
+        dbapi_connection.execute(f'PRAGMA {name} = {value}')
+
+
+@receiver(connection_created)
+def configure_connection(sender, connection, **kwargs):
+    # On the driver's connection, so the pragmas are not logged as queries
+    if connection.vendor == 'sqlite':
+        pragmas = get_setting('PRAGMAS')
+        if 'mode=ro' in str(connection.settings_dict['NAME']):
+            # Read-only connections follow the journal mode of the primary
+            pragmas = {name: value for name, value in pragmas.items() if name != 'journal_mode'}
+        configure(connection.connection, pragmas)
+
+
+def is_locked(exc):
+    return 'database is locked' in str(exc) or 'database table is locked' in str(exc)
+
+
+@contextmanager
+def immediate(connection):
+    """ Transactions started meanwhile on ``connection`` take the write lock at BEGIN """
+    if not hasattr(connection, 'begin_immediate'):
+        raise ImproperlyConfigured(
+            f"Database '{connection.alias}' needs the 'ems.backends.sqlite3' ENGINE for immediate transactions."
+        )
+    previous, connection.begin_immediate = connection.begin_immediate, True
+    try:
+        yield
+    finally:
+        connection.begin_immediate = previous
+
+
+def retry_on_lock(func, *args, using=None, **kwargs):
+    """
+    Call ``func`` in an immediate transaction, retried from the start with backoff while
+    SQLite reports the database locked. Inside an enclosing transaction it
+    is simply called, as only the enclosing transaction could be retried.
+    """
+    connection = transaction.get_connection(using)
+    if connection.in_atomic_block:
+        return func(*args, **kwargs)
+    if connection.vendor != 'sqlite':
+        with transaction.atomic(using=using):
+            return func(*args, **kwargs)
+
+    retries, backoff = get_setting('LOCK_RETRIES'), get_setting('LOCK_BACKOFF')
+    for attempt in range(retries + 1):
+        try:
+            with immediate(connection), transaction.atomic(using=using):
+                return func(*args, **kwargs)
+        except OperationalError as exc:
+            if attempt == retries or not is_locked(exc):
+                raise
+        # Jitter keeps writers that collided from colliding again
+        time.sleep(backoff * 2 ** attempt * random.uniform(0.5, 1.5))
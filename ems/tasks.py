@@ -0,0 +1,26 @@
+"""
+The tasks of the ems background job queue, see ems.jobs.
+"""
+from django.apps import apps
+from django.core.management import call_command
+from ems import deletion, headcount, jobs
+
+
+# Commits batch by batch, and deletes the rows left when retried
+@jobs.task('ems.delete', atomic=False)
+def delete(label, pks, progress):
+    """ Delete companies, departments or employees ``pks`` set-based, see ems.deletion """
+    return deletion.DELETERS[apps.get_model(label)](pks, progress)
+
+
+@jobs.task('ems.rebuild_headcount', priority=-10)
+def rebuild_headcount(progress):
+    """ Replace the headcount counters with a count from scratch """
+    return len(headcount.rebuild())
+
+
+# Commits every batch, and resumes from its checkpoint when retried
+@jobs.task('ems.import_org', atomic=False)
+def import_org(options, progress):
+    """ ``manage.py import_org`` with ``options`` """
+    call_command('import_org', verbosity=0, **options)
@@ -0,0 +1,183 @@
+"""
+Query budgets and N+1 detection for the tests of the ems app.
+
+``QueryRecorder`` records the queries of every request made meanwhile, on
+all database connections of the thread. ``check()`` then flags
+
+* requests over the budget declared for their endpoint in
+  ``QUERY_BUDGETS``, keyed by method and URL name, and
+* requests running the same query, up to its parameters, ``N_PLUS_ONE``
+  times or more: one query per row of what an earlier query returned.
+
+With pytest the module is also a plugin (``-p ems.testing`` in
+pytest.ini): every test records its requests and fails on what ``check()``
+flags. ``@pytest.mark.query_budget(n)`` sets the budget of every request of
+one test, ``@pytest.mark.unchecked_queries(reason)`` leaves a test's
+requests unchecked. Under Django's test runner, ``QueryBudgetMixin`` gives
+TestCases ``assertQueryBudget()`` to the same effect.
+"""
+import re
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+import pytest
+from django.core.signals import request_finished, request_started
+from django.db import connections
+from django.urls import Resolver404, resolve
+
+# Queries per request, by method and URL name. Budgets hold whatever the
+# number of rows; writes and the chunked export grow with them.
+QUERY_BUDGETS = {
+    'GET company-list': 1,
+    'GET company-detail': 1,
+    'GET company-tree': 3,
+    'GET company-detail-tree': 3,
+    'GET department-list': 1,
+    'GET department-detail': 1,
+    'GET employee-list': 2,
+    'GET employee-detail': 2,
+    'GET user-list': 1,
+    'GET user-detail': 1,
+    'GET headcount': 2,
+    'GET job-list': 1,
+    'GET job-detail': 1,
+    # The session and the user, then the view's own queries. Changelists
+    # count, and past the threshold of ems/counts.py estimate, their rows
+    'GET admin:ems_company_changelist': 6,
+    'GET admin:ems_company_change': 8,
+    'GET admin:ems_department_changelist': 5,
+    'GET admin:ems_department_change': 10,
+    'GET admin:ems_employee_changelist': 6,
+    'GET admin:auth_user_changelist': 7,
+    'GET admin:ems_employee_change': 7,
+    'GET admin:ems_employee_add': 2,
+    'GET admin:ems_employee_autocomplete': 4,
+    'GET admin:ems_department_autocomplete': 4,
+}
+# Runs of the same query in one request flagged as N+1
+N_PLUS_ONE = 5
+
+_NUMBER = re.compile(r"\b\d+(\.\d+)?\b")
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_PLACEHOLDERS = re.compile(r"\(\s*\?(\s*,\s*\?)*\s*\)")
+_SAVEPOINT = re.compile(r'^\s*(SAVEPOINT|RELEASE SAVEPOINT|ROLLBACK TO SAVEPOINT|BEGIN)\b', re.IGNORECASE)
+
+
+def normalize(sql):
+    """ ``sql`` with its literals and lists of placeholders replaced, the same for every run of one query """
+    sql = _STRING.sub('?', sql).replace('%s', '?')
+    sql = _NUMBER.sub('?', sql)
+    return _PLACEHOLDERS.sub('(...)', sql)
+
+
+class RequestQueries:
+    """ The queries of one request """
+
+    def __init__(self, method, path):
+        self.method = method
+        self.path = path
+        try:
+            self.endpoint = resolve(path).view_name
+        except Resolver404:
+            self.endpoint = None
+        self.queries = []
+
+    @property
+    def key(self):
+        return f'{self.method} {self.endpoint}'
+
+    def repeated(self, times=None):
+        """ (normalized sql, runs) of the queries run ``times`` or more """
+        times = N_PLUS_ONE if times is None else times
+        counts = Counter(normalize(sql) for sql in self.queries if not _SAVEPOINT.match(sql))
+        return [(sql, count) for sql, count in counts.most_common() if count >= times]
+
+
+class QueryRecorder:
+    """ Records the queries of the requests made while it is entered """
+
+    def __init__(self):
+        self.requests = []
+        self._current = None
+
+    def __enter__(self):
+        self._stack = ExitStack()
+        for connection in connections.all():
+            self._stack.enter_context(connection.execute_wrapper(self._record))
+        request_started.connect(self._started)
+        request_finished.connect(self._finished)
+        return self
+
+    def __exit__(self, *exc_info):
+        request_started.disconnect(self._started)
+        request_finished.disconnect(self._finished)
+        self._stack.close()
+
+    def _started(self, sender, environ=None, scope=None, **kwargs):
+        if environ is not None:
+            method, path = environ['REQUEST_METHOD'], environ['PATH_INFO']
+        else:
+            method, path = scope['method'], scope['path']
+        self._current = RequestQueries(method, path)
+        self.requests.append(self._current)
+
+    def _finished(self, sender, **kwargs):
+        self._current = None
+
+    def _record(self, execute, sql, params, many, context):
+        if self._current is not None:
+            self._current.queries.append(sql)
+        return execute(sql, params, many, context)
+
+
+def check(requests, budget=None, repeats=None):
+    """
+    Messages for the requests over their budget, ``budget`` or else the one
+    declared for their endpoint, and for the requests repeating queries.
+    ``repeats`` is the number of runs flagged as N+1, None for ``N_PLUS_ONE``
+    and 0 to flag none.
+    """
+    problems = []
+    for request in requests:
+        limit = budget if budget is not None else QUERY_BUDGETS.get(request.key)
+        if limit is not None and len(request.queries) > limit:
+            problems.append(
+                f'{request.method} {request.path} ran {len(request.queries)} queries, '
+                f'over the budget of {limit}:\n' + '\n'.join(f'  {sql}' for sql in request.queries)
+            )
+        if repeats != 0:
+            for sql, count in request.repeated(repeats):
+                problems.append(f'{request.method} {request.path} ran the same query {count} times (N+1):\n  {sql}')
+    return problems
+
+
+class QueryBudgetMixin:
+    """ ``assertQueryBudget()`` for TestCases """
+
+    @contextmanager
+    def assertQueryBudget(self, budget=None, repeats=None):
+        """ Fail if a request made in the block is over its budget or repeats queries (see ``check()``) """
+        with QueryRecorder() as recorder:
+            yield recorder
+        problems = check(recorder.requests, budget, repeats)
+        if problems:
+            self.fail('\n'.join(problems))
+
+
+def pytest_configure(config):
+    config.addinivalue_line('markers', 'query_budget(n): queries allowed per request of the test')
+    config.addinivalue_line('markers', 'unchecked_queries(reason): do not check the queries of the test')
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_call(item):
+    if item.get_closest_marker('unchecked_queries'):
+        yield
+        return
+    marker = item.get_closest_marker('query_budget')
+    with QueryRecorder() as recorder:
+        yield
+    problems = check(recorder.requests, marker.args[0] if marker else None)
+    if problems:
+        pytest.fail('\n'.join(problems), pytrace=False)
+
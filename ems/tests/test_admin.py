@@ -1,7 +1,12 @@
-from django.test import TestCase
+import warnings
+from unittest import mock
+from django.core.paginator import UnorderedObjectListWarning
+from django.test import TestCase, override_settings
 from django.urls import reverse
 from django.contrib.auth.models import User
 from rest_framework import status
+from ems import counts, headcount
+from ems.admin import EmployeeAdmin, UserAdmin
 from ems.models import Company, Department, Employee
 from copy import deepcopy
 
@@ -139,6 +144,20 @@ class CompanyAdminTest(TestCase):
         self.assertEqual(company.name, 'New Company')
         self.assertEqual(response.status_code, status.HTTP_302_FOUND)
 
+    def test_company_delete_confirmation(self):
+        self.client.login(
+            username=self.username,
+            password=self.password,
+        )
+        Department.objects.create(name='Quality', company_id=self.comp_id)
+
+        response = self.client.get(reverse('admin:ems_company_delete', args=(self.comp_id,)))
+
+        # Counted, not listed one by one
+        self.assertContains(response, '<li>Departments: 1</li>', html=True)
+        self.assertNotContains(response, 'Quality (Test Company 1)')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
     def test_company_delete(self):
         self.client.login(
             username=self.username,
@@ -182,6 +201,7 @@ class EmployeeAdminTest(TestCase):
 
         comp = Company.objects.create(name='Test Company 1')
         dept1 = Department.objects.create(name='Engineering', company=comp)
+        Department.objects.create(name='Quality', company=comp)
 
         user1 = User.objects.create_user(
             username='testuser',
@@ -216,6 +236,22 @@ class EmployeeAdminTest(TestCase):
 
         self.assertContains(response, emp.user.first_name)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # Other departments are searched for, not listed
+        self.assertContains(response, 'Engineering (Test Company 1)')
+        self.assertNotContains(response, 'Quality (Test Company 1)')
+
+    def test_employee_autocomplete(self):
+        self.client.login(
+            username=self.username,
+            password=self.password,
+        )
+
+        with warnings.catch_warnings():
+            # Its pages are stable only if ordered
+            warnings.simplefilter('error', UnorderedObjectListWarning)
+            response = self.client.get(reverse('admin:ems_employee_autocomplete'), {'term': 'Test'})
+            self.client.get(reverse('admin:ems_department_autocomplete'), {'term': 'Test'})
+        self.assertEqual([result['text'] for result in response.json()['results']], ['Test User'])
 
     def test_employee_add_valid_form(self):
         self.client.login(
@@ -288,3 +324,131 @@ class EmployeeAdminTest(TestCase):
         self.assertEqual(deleted, None)
 
         self.assertEqual(response.status_code, status.HTTP_302_FOUND)
+
+class DepartmentAdminTest(TestCase):
+    '''
+    Test cases for Department Admin, which edits the memberships of a department
+    a page at a time, and for the paginated departments of a company
+    '''
+    def setUp(self):
+        (self.username, self.password) = _create_super_user()
+        self.client.login(username=self.username, password=self.password)
+
+        self.comp = Company.objects.create(name='Test Company 1')
+        self.depts = [Department.objects.create(name=f'Dept {i:02}', company=self.comp) for i in range(25)]
+        self.emps = []
+        for i in range(3):
+            emp = Employee.objects.create(designation='Jr', user=User.objects.create_user(username=f'user{i}'))
+            emp.department.add(self.depts[0])
+            self.emps.append(emp)
+
+    def _membership_payload(self, memberships, new_employee=None):
+        payload = {
+            'name': self.depts[0].name,
+            'company': self.comp.pk,
+            'Employee_department-TOTAL_FORMS': len(memberships) + 1,
+            'Employee_department-INITIAL_FORMS': len(memberships),
+            'Employee_department-MIN_NUM_FORMS': 0,
+            'Employee_department-MAX_NUM_FORMS': 1000,
+            'Employee_department-%d-department' % len(memberships): self.depts[0].pk,
+            'Employee_department-%d-employee' % len(memberships): new_employee.pk if new_employee else '',
+        }
+        for i, membership in enumerate(memberships):
+            payload[f'Employee_department-{i}-id'] = membership.pk
+            payload[f'Employee_department-{i}-department'] = self.depts[0].pk
+        return payload
+
+    def test_company_departments_paginated(self):
+        url = reverse('admin:ems_company_change', args=(self.comp.id,))
+        response = self.client.get(url)
+        self.assertContains(response, 'Dept 19')
+        self.assertNotContains(response, 'Dept 20')
+        self.assertContains(response, 'Page 1 of 2')
+        self.assertContains(response, '3 employees')
+
+        response = self.client.get(url + '?department_set-page=2')
+        self.assertContains(response, 'Dept 24')
+        self.assertNotContains(response, 'Dept 19')
+
+    def test_memberships(self):
+        response = self.client.get(reverse('admin:ems_department_change', args=(self.depts[0].id,)))
+        self.assertContains(response, str(self.emps[0]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_membership_add_and_delete(self):
+        url = reverse('admin:ems_department_change', args=(self.depts[0].id,))
+        memberships = list(Employee.department.through.objects.filter(department=self.depts[0]).order_by('pk'))
+        new_emp = Employee.objects.create(designation='Sr', user=User.objects.create_user(username='newuser'))
+
+        payload = self._membership_payload(memberships, new_emp)
+        payload['Employee_department-0-DELETE'] = 'on'
+        response = self.client.post(url, payload)
+        self.assertEqual(response.status_code, status.HTTP_302_FOUND)
+
+        members = set(self.depts[0].employee_set.values_list('pk', flat=True))
+        self.assertEqual(members, {self.emps[1].pk, self.emps[2].pk, new_emp.pk})
+        # Through the relation, so the counters follow
+        self.assertEqual(headcount.read(department_id=self.depts[0].pk)['designations']['Sr'], 1)
+        self.assertEqual(headcount.read(department_id=self.depts[0].pk)['total'], 3)
+
+@override_settings(EMS_COUNTS={'THRESHOLD': 5})
+class EstimatedCountAdminTest(TestCase):
+    '''
+    Test cases for the changelists counting up to a threshold, past which
+    they are paged by primary key
+    '''
+    def setUp(self):
+        (self.username, self.password) = _create_super_user()
+        self.client.login(username=self.username, password=self.password)
+
+        self.emps = [
+            Employee.objects.create(designation='Jr', user=User.objects.create_user(username=f'user{i}'))
+            for i in range(12)
+        ]
+
+    def test_count(self):
+        self.assertEqual(counts.count(Company.objects.all()), (0, None))
+        self.assertEqual(counts.count(Employee.objects.all()), (self.emps[-1].pk, counts.ABOUT))
+        self.assertEqual(counts.count(Employee.objects.filter(designation='Jr')), (5, counts.OVER))
+
+    @mock.patch.object(EmployeeAdmin, 'list_per_page', 5)
+    def test_keyset_pages(self):
+        url = reverse('admin:ems_employee_changelist')
+        response = self.client.get(url)
+        self.assertEqual([emp.pk for emp in response.context['cl'].result_list], [emp.pk for emp in self.emps[:-6:-1]])
+        self.assertContains(response, 'about %d employees' % self.emps[-1].pk)
+
+        seen = []
+        while url:
+            cl = self.client.get(url).context['cl']
+            seen.extend(emp.pk for emp in cl.result_list)
+            url = cl.next_page_url and reverse('admin:ems_employee_changelist') + cl.next_page_url
+        self.assertEqual(seen, [emp.pk for emp in reversed(self.emps)])
+
+        # Links by offset still work
+        response = self.client.get(reverse('admin:ems_employee_changelist'), {'p': '1'})
+        self.assertEqual([emp.pk for emp in response.context['cl'].result_list], [emp.pk for emp in self.emps[-6:-11:-1]])
+        self.assertContains(response, '?after=%d' % self.emps[2].pk)
+
+    @mock.patch.object(EmployeeAdmin, 'list_per_page', 5)
+    def test_offset_pages_for_other_orderings(self):
+        # Ordered by designation
+        response = self.client.get(reverse('admin:ems_employee_changelist'), {'o': '2', 'p': '1'})
+        cl = response.context['cl']
+        self.assertFalse(cl.keyset)
+        self.assertEqual(cl.result_count, self.emps[-1].pk)
+        self.assertEqual(len(cl.result_list), 5)
+
+    def test_invalid_key(self):
+        response = self.client.get(reverse('admin:ems_employee_changelist'), {'after': 'x'})
+        self.assertRedirects(response, reverse('admin:ems_employee_changelist') + '?e=1', fetch_redirect_response=False)
+
+    def test_user_changelist(self):
+        # Ordered by username
+        with mock.patch.object(UserAdmin, 'list_per_page', 5):
+            response = self.client.get(reverse('admin:auth_user_changelist'))
+            self.assertEqual(response.context['cl'].keyset[0].name, 'username')
+            self.assertContains(response, '?after=user11')
+            response = self.client.get(reverse('admin:auth_user_changelist'), {'after': 'user11'})
+        self.assertEqual([user.username for user in response.context['cl'].result_list],
+                         ['user2', 'user3', 'user4', 'user5', 'user6'])
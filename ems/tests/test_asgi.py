@@ -0,0 +1,136 @@
+import asyncio
+import json
+from unittest import mock
+from ems import asgi, cache, metrics
+from ems.models import Company, Department, Employee
+from django.core import signals
+from django.test import TransactionTestCase
+from django.urls import reverse
+from rest_framework import status
+from django.contrib.auth.models import User
+
+
+class ASGIHandlerTest(TransactionTestCase):
+    """ Test module for the ASGI handler of the API """
+
+    # The executor threads only see committed rows
+    def setUp(self):
+        cache.responses.clear()
+        self.company = Company.objects.create(name='Test Company 1')
+        self.dept = Department.objects.create(name='Engineering', company=self.company)
+        for i in range(3):
+            self.employee = Employee.objects.create(designation='Jr', user=User.objects.create_user(username=f'user{i}'))
+            self.employee.department.add(self.dept)
+        self.handler = asgi.ASGIHandler()
+
+    def request(self, method, path, body=b'', headers=()):
+        """ The status, headers and body of a request through the handler """
+        path, _, query = path.partition('?')
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': method,
+            'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': query.encode(),
+            'root_path': '', 'client': ('127.0.0.1', 1), 'server': ('testserver', 80),
+            'headers': [
+                (b'host', b'testserver'), (b'content-type', b'application/json'),
+                (b'content-length', str(len(body)).encode()), *headers,
+            ],
+        }
+        messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+        sent = []
+
+        async def receive():
+            if messages:
+                return messages.pop()
+            await asyncio.sleep(3600)
+
+        async def send(message):
+            sent.append(message)
+
+        asyncio.run(self.handler(scope, receive, send))
+        start = sent[0]
+        headers = {name.decode().lower(): value.decode() for name, value in start['headers']}
+        return start['status'], headers, b''.join(message.get('body', b'') for message in sent[1:])
+
+    def test_same_output(self):
+        for name in ['company-list', 'department-list', 'employee-list']:
+            url = reverse(name) + '?expand=company'
+            status_code, _, body = self.request('GET', url)
+            self.assertEqual(status_code, status.HTTP_200_OK)
+            cache.responses.clear()
+            self.assertEqual(body, self.client.get(url).content)
+
+    def test_cache_hits_stay_on_the_event_loop(self):
+        url = reverse('employee-detail', kwargs={'pk': self.employee.pk})
+        with mock.patch.object(asgi.executor, 'submit', wraps=asgi.executor.submit) as submit:
+            _, headers, body = self.request('GET', url)
+            self.assertEqual(submit.call_count, 1)
+            # A miss is looked up once
+            self.assertEqual(cache.responses.stats()['misses'], 1)
+
+            status_code, _, cached = self.request('GET', url)
+            self.assertEqual((status_code, cached), (status.HTTP_200_OK, body))
+            status_code, _, _ = self.request('GET', url, headers=[(b'if-none-match', headers['etag'].encode())])
+            self.assertEqual(status_code, status.HTTP_304_NOT_MODIFIED)
+            self.assertEqual(submit.call_count, 1)
+
+            # Requests with credentials are authenticated first
+            self.request('GET', url, headers=[(b'authorization', b'Basic eDp5')])
+            self.assertEqual(submit.call_count, 2)
+
+    def test_signals_once_without_django_thread(self):
+        sent = []
+
+        def receiver(signal, **kwargs):
+            sent.append(signal)
+        signals.request_started.connect(receiver)
+        signals.request_finished.connect(receiver)
+        self.addCleanup(signals.request_started.disconnect, receiver)
+        self.addCleanup(signals.request_finished.disconnect, receiver)
+
+        url = reverse('company-list')
+        with mock.patch.object(asgi, 'sync_to_async') as to_thread:
+            # A miss, a hit, a read that is not cached
+            for path in [url, url, reverse('headcount')]:
+                sent.clear()
+                status_code, _, _ = self.request('GET', path)
+                self.assertEqual(status_code, status.HTTP_200_OK)
+                self.assertEqual(sent, [signals.request_started, signals.request_finished])
+        to_thread.assert_not_called()
+
+    def test_streamed_responses(self):
+        status_code, _, body = self.request('GET', reverse('employee-export'))
+        self.assertEqual(status_code, status.HTTP_200_OK)
+        self.assertEqual(len(body.splitlines()), 3)
+
+        status_code, _, body = self.request('GET', reverse('company-tree') + '?format=ndjson')
+        self.assertEqual(status_code, status.HTTP_200_OK)
+        self.assertEqual(len(json.loads(body)['departments'][0]['employees']), 3)
+
+    def test_writes(self):
+        status_code, _, body = self.request('POST', reverse('company-list'), body=b'{"name": "Test Company 2"}')
+        self.assertEqual(status_code, status.HTTP_201_CREATED)
+        self.assertEqual(json.loads(body)['name'], 'Test Company 2')
+
+        status_code, _, body = self.request('GET', reverse('company-list'))
+        self.assertEqual(len(json.loads(body)['results']), 2)
+
+    def test_metrics(self):
+        # The queries of views on the executor are counted
+        status_code, headers, _ = self.request('GET', reverse('employee-detail', kwargs={'pk': self.employee.pk}))
+        self.assertEqual(status_code, status.HTTP_200_OK)
+        self.assertRegex(headers['server-timing'], r'db;dur=[\d.]+;desc="[1-9]\d* queries", serialize;')
+
+    def test_metrics_count_requests_once(self):
+        metrics.registry.reset()
+        count = 'ems_request_duration_seconds_count{route="company-list",method="GET",status="200"} %d'
+        # A miss, through the cache-only chain and then the executor
+        self.request('GET', reverse('company-list'))
+        self.assertIn(count % 1, metrics.registry.expose())
+        self.request('GET', reverse('company-list'))
+        self.assertIn(count % 2, metrics.registry.expose())
+
+    def test_errors(self):
+        status_code, _, _ = self.request('GET', reverse('employee-detail', kwargs={'pk': self.employee.pk + 1}))
+        self.assertEqual(status_code, status.HTTP_404_NOT_FOUND)
+        status_code, _, _ = self.request('GET', reverse('employee-list') + '?fields=salary')
+        self.assertEqual(status_code, status.HTTP_400_BAD_REQUEST)
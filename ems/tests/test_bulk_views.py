@@ -0,0 +1,230 @@
+from ems import headcount
+from ems.models import Company, Department, Employee
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+from rest_framework.renderers import JSONRenderer
+from django.contrib.auth.models import User
+
+
+class BulkTestCase(APITestCase):
+    def bulk(self, method, name, payload):
+        return getattr(self.client, method)(
+            reverse(f'{name}-bulk'),
+            data=JSONRenderer().render(payload),
+            content_type='application/json'
+        )
+
+
+class BulkCompanyTest(BulkTestCase):
+    """ Test module for the company bulk endpoint """
+
+    def test_bulk_create(self):
+        response = self.bulk('post', 'company', [{'name': 'Tester Inc'}, {'name': 'Other Inc'}])
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data, [
+            {'id': 1, 'name': 'Tester Inc'},
+            {'id': 2, 'name': 'Other Inc'},
+        ])
+
+    def test_bulk_create_reports_errors_per_item(self):
+        response = self.bulk('post', 'company', [{'name': 'Tester Inc'}, {'name': ''}])
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data, [{}, {'name': ['This field may not be blank.']}])
+        self.assertEqual(Company.objects.count(), 0)
+
+    def test_bulk_requires_list(self):
+        response = self.bulk('post', 'company', {'name': 'Tester Inc'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_bulk_update(self):
+        c1 = Company.objects.create(name='Test Company 1')
+        c2 = Company.objects.create(name='Test Company 2')
+        response = self.bulk('patch', 'company', [{'id': c2.pk, 'name': 'Renamed'}, {'id': c1.pk, 'name': 'Also'}])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, [{'id': c2.pk, 'name': 'Renamed'}, {'id': c1.pk, 'name': 'Also'}])
+        self.assertEqual(Company.objects.get(pk=c2.pk).name, 'Renamed')
+
+    def test_bulk_update_unknown_id(self):
+        c1 = Company.objects.create(name='Test Company 1')
+        response = self.bulk('patch', 'company', [{'id': c1.pk, 'name': 'Renamed'}, {'id': 30, 'name': 'x'}, {'name': 'y'}])
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data, [{}, {'id': ['Not found.']}, {'id': ['This field is required.']}])
+        self.assertEqual(Company.objects.get(pk=c1.pk).name, 'Test Company 1')
+
+    def test_bulk_delete(self):
+        c1 = Company.objects.create(name='Test Company 1')
+        c2 = Company.objects.create(name='Test Company 2')
+        Company.objects.create(name='Test Company 3')
+
+        response = self.bulk('delete', 'company', [c1.pk, 30])
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data[0], {})
+        self.assertEqual(Company.objects.count(), 3)
+
+        response = self.bulk('delete', 'company', [c1.pk, c2.pk])
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(list(Company.objects.values_list('name', flat=True)), ['Test Company 3'])
+
+
+class BulkEmployeeTest(BulkTestCase):
+    """ Test module for the employee bulk endpoint """
+
+    def setUp(self):
+        c1 = Company.objects.create(name='Test Company 1')
+        self.dept1 = Department.objects.create(name='Engineering', company=c1)
+        self.dept2 = Department.objects.create(name='Quality Assurance', company=c1)
+        self.user1 = User.objects.create_user(
+            username='testuser',
+            first_name='Test',
+            last_name='User'
+        )
+
+    def payload(self, count, start=0):
+        return [
+            {
+                'user': {'username': f'user{i}', 'first_name': 'New', 'last_name': f'User {i}'},
+                'department': [self.dept1.pk, self.dept2.pk],
+                'designation': 'Jr',
+            }
+            for i in range(start, start + count)
+        ]
+
+    def test_bulk_create(self):
+        payload = self.payload(1) + [{'user': self.user1.pk, 'department': [self.dept2.pk], 'designation': 'Mg'}]
+        response = self.bulk('post', 'employee', payload)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        new_user = User.objects.get(username='user0')
+        self.assertFalse(new_user.has_usable_password())
+        self.assertEqual(response.data, [
+            {
+                'id': 1, 'user': new_user.pk, 'emp_first_name': 'New', 'emp_last_name': 'User 0',
+                'department': [self.dept1.pk, self.dept2.pk], 'designation': 'Jr',
+            },
+            {
+                'id': 2, 'user': self.user1.pk, 'emp_first_name': 'Test', 'emp_last_name': 'User',
+                'department': [self.dept2.pk], 'designation': 'Mg',
+            },
+        ])
+
+    def test_bulk_create_queries_fixed(self):
+        # 11 for the batch, 6 to add it to the headcount
+        with self.assertNumQueries(17):
+            self.bulk('post', 'employee', self.payload(2))
+        with self.assertNumQueries(17):
+            response = self.bulk('post', 'employee', self.payload(40, start=2))
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Employee.department.through.objects.count(), 84)
+
+    def test_bulk_create_validates_whole_batch(self):
+        Employee.objects.create(user=self.user1, designation='Jr')
+        payload = self.payload(2) + [
+            {'user': {'username': 'user0'}, 'department': [self.dept1.pk], 'designation': 'Jr'},
+            {'user': self.user1.pk, 'department': [self.dept1.pk], 'designation': 'Jr'},
+            {'user': self.user1.pk, 'department': [30], 'designation': 'Jr'},
+            {'user': {'username': 'testuser'}, 'department': [self.dept1.pk], 'designation': 'Sr'},
+        ]
+        response = self.bulk('post', 'employee', payload)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data[:2], [{}, {}])
+        self.assertEqual(response.data[2], {'user': {'username': ['Duplicate username in this batch.']}})
+        self.assertEqual(response.data[3], {'user': ['Employee with this user already exists.']})
+        self.assertEqual(response.data[4], {'department': ['Invalid pk "30" - object does not exist.']})
+        self.assertEqual(response.data[5], {'user': {'username': ['A user with that username already exists.']}})
+        self.assertEqual(Employee.objects.count(), 1)
+        self.assertEqual(User.objects.count(), 1)
+
+    def test_bulk_update_replaces_departments(self):
+        self.bulk('post', 'employee', self.payload(2))
+        emp1, emp2 = Employee.objects.order_by('id')
+
+        response = self.bulk('patch', 'employee', [
+            {'id': emp1.pk, 'department': [self.dept2.pk]},
+            {'id': emp2.pk, 'designation': 'Sr'},
+        ])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data[0]['department'], [self.dept2.pk])
+        self.assertEqual(response.data[1]['department'], [self.dept1.pk, self.dept2.pk])
+        self.assertEqual(response.data[1]['designation'], 'Sr')
+        self.assertEqual(list(emp1.department.all()), [self.dept2])
+
+    def test_bulk_update_duplicate_id(self):
+        self.bulk('post', 'employee', self.payload(1))
+        emp = Employee.objects.get()
+
+        response = self.bulk('patch', 'employee', [
+            {'id': emp.pk, 'designation': 'Sr'},
+            {'id': emp.pk, 'user': emp.user_id, 'designation': 'Mg'},
+        ])
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data, [{}, {'id': ['Duplicate id in this batch.']}])
+        self.assertEqual(Employee.objects.get().designation, 'Jr')
+
+    def test_bulk_update_rejects_new_users(self):
+        self.bulk('post', 'employee', self.payload(2))
+        emp1, emp2 = Employee.objects.order_by('id')
+
+        response = self.bulk('patch', 'employee', [
+            {'id': emp1.pk, 'designation': 'Sr'},
+            {'id': emp2.pk, 'user': {'username': 'other'}},
+        ])
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data, [{}, {'user': ['Only the id of an existing user may be given when updating.']}])
+        self.assertFalse(User.objects.filter(username='other').exists())
+
+    def test_bulk_delete(self):
+        self.bulk('post', 'employee', self.payload(3))
+        pks = list(Employee.objects.order_by('id').values_list('pk', flat=True))
+        response = self.bulk('delete', 'employee', pks[:2])
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(list(Employee.objects.values_list('pk', flat=True)), pks[2:])
+        self.assertEqual(Employee.department.through.objects.count(), 2)
+        self.assertEqual(headcount.read(department_id=self.dept1.pk)['total'], 1)
+
+    def test_bulk_delete_queries_fixed(self):
+        self.bulk('post', 'employee', self.payload(42))
+        pks = list(Employee.objects.order_by('id').values_list('pk', flat=True))
+        with self.assertNumQueries(11):
+            self.bulk('delete', 'employee', pks[:2])
+        with self.assertNumQueries(11):
+            response = self.bulk('delete', 'employee', pks[2:])
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(headcount.read()['total'], 0)
+
+
+class BulkDepartmentTest(BulkTestCase):
+    """ Test module for the department bulk endpoint """
+
+    def test_bulk_create(self):
+        c1 = Company.objects.create(name='Test Company 1')
+        response = self.bulk('post', 'department', [
+            {'name': 'Engineering', 'company': c1.pk},
+            {'name': 'Quality Assurance', 'company': 30},
+        ])
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data, [{}, {'company': ['Invalid pk "30" - object does not exist.']}])
+
+        response = self.bulk('post', 'department', [
+            {'name': 'Engineering', 'company': c1.pk},
+            {'name': 'Quality Assurance', 'company': c1.pk},
+        ])
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(
+            list(Department.objects.values_list('name', 'company')),
+            [('Engineering', c1.pk), ('Quality Assurance', c1.pk)],
+        )
+
+    def test_bulk_update_checks_unique_names(self):
+        c1 = Company.objects.create(name='Test Company 1')
+        depts = [Department.objects.create(name=f'Dept {i}', company=c1) for i in range(20)]
+
+        # Partial items are checked with the stored company, without loading it:
+        # instances, unique check, savepoint, update, release, read back
+        with self.assertNumQueries(6):
+            response = self.bulk('patch', 'department', [{'id': dept.pk, 'name': f'New {dept.pk}'} for dept in depts])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        response = self.bulk('patch', 'department', [{'id': depts[0].pk, 'name': f'New {depts[1].pk}'}])
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data, [{'non_field_errors': ['The fields company, name must make a unique set.']}])
@@ -0,0 +1,161 @@
+import json
+import os
+from ems import cache
+from ems.cache import LRUCache
+from ems.models import Company, Department, Employee
+from django.test import SimpleTestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+from rest_framework.renderers import JSONRenderer
+from django.contrib.auth.models import User
+
+
+class LRUCacheTest(SimpleTestCase):
+    """ Test module for the bounded LRU behind the response cache """
+
+    def test_evicts_least_recently_used(self):
+        lru = LRUCache(max_entries=2, max_bytes=100)
+        lru.set('a', 1, 1)
+        lru.set('b', 2, 1)
+        self.assertEqual(lru.get('a'), 1)
+        lru.set('c', 3, 1)
+
+        self.assertIsNone(lru.get('b'))
+        self.assertEqual(lru.get('a'), 1)
+        self.assertEqual(lru.get('c'), 3)
+        self.assertEqual(lru.stats()['evictions'], 1)
+
+    def test_bounded_by_bytes(self):
+        lru = LRUCache(max_entries=10, max_bytes=10)
+        lru.set('a', 1, 6)
+        lru.set('b', 2, 6)
+        lru.set('huge', 3, 11)
+
+        self.assertIsNone(lru.get('a'))
+        self.assertIsNone(lru.get('huge'))
+        self.assertEqual(lru.stats()['bytes'], 6)
+
+    def test_stats(self):
+        lru = LRUCache(max_entries=10, max_bytes=10)
+        lru.set('a', 1, 1)
+        lru.get('a')
+        lru.get('b')
+        self.assertEqual(lru.stats(), {
+            'entries': 1, 'bytes': 1, 'max_entries': 10, 'max_bytes': 10,
+            'hits': 1, 'misses': 1, 'evictions': 0, 'hit_ratio': 0.5,
+        })
+
+
+class GenerationsTest(SimpleTestCase):
+    """ Test module for the model generations behind the response cache """
+
+    def test_shared_between_processes(self):
+        before = cache.generations([Company])
+        pid = os.fork()
+        if pid == 0:
+            cache.bump(Company)
+            os._exit(0)
+        os.waitpid(pid, 0)
+        self.assertNotEqual(cache.generations([Company]), before)
+
+
+class ResponseCacheTest(APITestCase):
+    """ Test module for cached list and detail responses """
+
+    def setUp(self):
+        cache.responses.clear()
+        self.company = Company.objects.create(name='Test Company 1')
+        self.dept = Department.objects.create(name='Engineering', company=self.company)
+        self.user = User.objects.create_user(username='user0', first_name='Test', last_name='User')
+        self.emp = Employee.objects.create(designation='Jr', user=self.user)
+        self.emp.department.add(self.dept)
+
+    def get(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return json.loads(response.content)
+
+    def test_second_request_is_served_from_cache(self):
+        url = reverse('employee-list') + '?expand=company'
+        first = self.get(url)
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertEqual(json.loads(response.content), first)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual(cache.responses.stats()['hits'], 1)
+
+    def test_detail_is_cached(self):
+        url = reverse('company-detail', kwargs={'pk': self.company.pk})
+        self.get(url)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get(url)['name'], 'Test Company 1')
+
+    def test_save_invalidates_dependent_views(self):
+        url = reverse('employee-list') + '?expand=company'
+        self.get(url)
+        self.company.name = 'Renamed'
+        self.company.save()
+        self.assertEqual(self.get(url)['results'][0]['department'][0]['company']['name'], 'Renamed')
+
+    def test_user_change_invalidates_employees(self):
+        url = reverse('employee-detail', kwargs={'pk': self.emp.pk})
+        self.get(url)
+        self.user.first_name = 'Changed'
+        self.user.save()
+        self.assertEqual(self.get(url)['emp_first_name'], 'Changed')
+
+    def test_membership_change_invalidates_employees(self):
+        url = reverse('employee-detail', kwargs={'pk': self.emp.pk})
+        self.get(url)
+        self.emp.department.clear()
+        self.assertEqual(self.get(url)['department'], [])
+
+    def test_delete_invalidates(self):
+        url = reverse('department-list')
+        self.get(url)
+        self.dept.delete()
+        self.assertEqual(self.get(url)['results'], [])
+
+    def test_bulk_write_invalidates(self):
+        url = reverse('company-list')
+        self.get(url)
+        response = self.client.post(
+            reverse('company-bulk'),
+            data=JSONRenderer().render([{'name': 'Other Inc'}]),
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(self.get(url)['results']), 2)
+
+    def test_query_string_is_part_of_key(self):
+        self.get(reverse('department-list'))
+        data = self.get(reverse('department-list') + '?expand=company')
+        self.assertEqual(data['results'][0]['company'], {'id': self.company.pk, 'name': 'Test Company 1'})
+
+    @override_settings(ALLOWED_HOSTS=['a.example', 'b.example'])
+    def test_host_and_scheme_are_part_of_key(self):
+        Company.objects.create(name='Test Company 2')
+        url = reverse('company-list') + '?page_size=1'
+        pages = [
+            self.client.get(url, HTTP_HOST=host, secure=secure)
+            for host, secure in [('a.example', False), ('b.example', False), ('b.example', True)]
+        ]
+        self.assertEqual(
+            [page.json()['next'].split('/')[:3] for page in pages],
+            [['http:', '', 'a.example'], ['http:', '', 'b.example'], ['https:', '', 'b.example']],
+        )
+        self.assertEqual(len({page['ETag'] for page in pages}), 3)
+        # Nor does the ETag of one host confirm the page of another
+        response = self.client.get(url, HTTP_HOST='b.example', HTTP_IF_NONE_MATCH=pages[0]['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_browsable_api_not_cached(self):
+        self.client.get(reverse('company-list'), HTTP_ACCEPT='text/html')
+        self.assertEqual(cache.responses.stats()['entries'], 0)
+
+    def test_stats_endpoint(self):
+        self.get(reverse('company-list'))
+        self.get(reverse('company-list'))
+        stats = self.get(reverse('cache-stats'))
+        self.assertEqual((stats['hits'], stats['misses'], stats['entries']), (1, 1, 1))
@@ -0,0 +1,135 @@
+import io
+import json
+import os
+import tempfile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from ems.models import Company, Department, Employee, Job
+from django.contrib.auth.models import User
+
+
+class ImportOrgCommandTest(TestCase):
+    """ Test module for the import_org management command """
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+        self.companies = self.write('companies.csv', 'name\nTest Company 1\nTest Company 2\nTest Company 1\n')
+        self.departments = self.write(
+            'departments.csv',
+            'company,name\n'
+            'Test Company 1,Engineering\n'
+            'Test Company 1,Quality Assurance\n'
+            'Test Company 2,Engineering\n'
+        )
+        self.employees = self.write('employees.ndjson', ''.join(
+            json.dumps(row) + '\n' for row in [
+                {'username': 'user0', 'first_name': 'Test', 'last_name': 'User', 'designation': 'Jr',
+                 'company': 'Test Company 1', 'departments': ['Engineering', 'Quality Assurance']},
+                {'username': 'user1', 'designation': 'Manager', 'company': 'Test Company 2', 'departments': ['Engineering']},
+                {'username': 'user2', 'designation': 'Sr', 'company': 'Test Company 2', 'departments': ['Payroll']},
+                {'username': 'user3', 'designation': 'As', 'company': 'Test Company 1', 'departments': ['Engineering']},
+            ]
+        ))
+
+    def write(self, name, content):
+        path = os.path.join(self.tmp.name, name)
+        with open(path, 'w') as f:
+            f.write(content)
+        return path
+
+    def call(self, **options):
+        out, err = io.StringIO(), io.StringIO()
+        call_command('import_org', stdout=out, stderr=err, **options)
+        return out.getvalue(), err.getvalue()
+
+    def test_import(self):
+        out, err = self.call(companies=self.companies, departments=self.departments, employees=self.employees)
+
+        self.assertEqual(list(Company.objects.values_list('name', flat=True)), ['Test Company 1', 'Test Company 2'])
+        self.assertEqual(Department.objects.count(), 3)
+        self.assertEqual(list(Employee.objects.values_list('user__username', 'designation')), [
+            ('user0', 'Jr'), ('user1', 'Mg'), ('user3', 'As'),
+        ])
+        user0 = Employee.objects.get(user__username='user0')
+        self.assertEqual(user0.user.first_name, 'Test')
+        self.assertEqual(sorted(user0.department.values_list('name', flat=True)), ['Engineering', 'Quality Assurance'])
+        self.assertFalse(user0.user.has_usable_password())
+
+        self.assertIn("employees: row 3: unknown department 'Payroll' of company 'Test Company 2'", err)
+        self.assertIn('employees: imported 3 rows, skipped 1 rows with errors', out)
+
+    def test_import_twice_keeps_rows(self):
+        self.call(companies=self.companies, departments=self.departments, employees=self.employees)
+        self.call(companies=self.companies, departments=self.departments, employees=self.employees)
+
+        self.assertEqual(Company.objects.count(), 2)
+        self.assertEqual(Department.objects.count(), 3)
+        self.assertEqual(Employee.objects.count(), 3)
+        self.assertEqual(Employee.department.through.objects.count(), 4)
+
+    def test_lookups_per_batch_fixed(self):
+        self.call(companies=self.companies, departments=self.departments)
+
+        def selects(start, count):
+            rows = [
+                {'username': f'user{i}', 'designation': 'Jr', 'company': 'Test Company 1', 'departments': 'Engineering'}
+                for i in range(start, start + count)
+            ]
+            employees = self.write(f'employees{start}.ndjson', ''.join(json.dumps(row) + '\n' for row in rows))
+            with CaptureQueriesContext(connection) as queries:
+                self.call(employees=employees, batch_size=1000)
+            return [q['sql'] for q in queries.captured_queries if q['sql'].startswith('SELECT')]
+
+        # Company and department maps, user and employee ids of the batch,
+        # the employees it already had, and the memberships and designations
+        # of the new ones for the headcount
+        self.assertEqual(len(selects(0, 10)), 7)
+        self.assertEqual(len(selects(10, 200)), 7)
+        self.assertEqual(Employee.objects.count(), 210)
+
+    def test_resume_from_checkpoint(self):
+        checkpoint = os.path.join(self.tmp.name, 'checkpoint.json')
+        self.call(companies=self.companies, departments=self.departments, checkpoint=checkpoint)
+
+        # A crash after the first batch of employees was committed
+        with open(checkpoint) as f:
+            state = json.load(f)
+        state['employees'] = {'path': self.employees, 'rows': 2, 'done': False}
+        with open(checkpoint, 'w') as f:
+            json.dump(state, f)
+
+        out, _ = self.call(
+            companies=self.companies, departments=self.departments,
+            employees=self.employees, checkpoint=checkpoint,
+        )
+        self.assertIn('companies: already imported, skipping', out)
+        self.assertIn('employees: resuming after row 2', out)
+        self.assertEqual(list(User.objects.values_list('username', flat=True)), ['user3'])
+
+        with open(checkpoint) as f:
+            self.assertEqual(json.load(f)['employees'], {'path': self.employees, 'rows': 4, 'done': True})
+
+    def test_checkpoint_for_other_file(self):
+        checkpoint = os.path.join(self.tmp.name, 'checkpoint.json')
+        self.call(companies=self.companies, checkpoint=checkpoint)
+        with self.assertRaises(CommandError):
+            self.call(companies=self.departments, checkpoint=checkpoint)
+        self.call(companies=self.departments, checkpoint=checkpoint, restart=True)
+
+    def test_background_restart(self):
+        checkpoint = os.path.join(self.tmp.name, 'checkpoint.json')
+        self.call(companies=self.companies, checkpoint=checkpoint)
+        self.call(companies=self.companies, checkpoint=checkpoint, restart=True, background=True)
+        # Cleared once when queued, so that retries of the job resume
+        self.assertFalse(os.path.exists(checkpoint))
+        job = Job.objects.get()
+        self.assertEqual(job.args[0], {'companies': self.companies, 'checkpoint': checkpoint, 'batch_size': 5000})
+
+    def test_nothing_to_import(self):
+        with self.assertRaises(CommandError):
+            self.call()
@@ -12,7 +12,7 @@ class GetNoCompaniesTest(APITestCase):
     def test_no_companies(self):
         response = self.client.get(reverse('company-list'))
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(response.data, [])
+        self.assertEqual(response.data['results'], [])
 
 class GetAllCompaniesTest(APITestCase):
     """ Test module for GET all companies API """
@@ -29,7 +29,7 @@ class GetAllCompaniesTest(APITestCase):
         # get data from db
         companies = Company.objects.all()
         serializer = CompanySerializer(companies, many=True)
-        self.assertEqual(response.data, serializer.data)
+        self.assertEqual(response.data['results'], serializer.data)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
 
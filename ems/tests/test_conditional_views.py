@@ -0,0 +1,66 @@
+from ems import cache
+from ems.models import Company, Department, Employee
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+from django.contrib.auth.models import User
+
+
+class ConditionalGetTest(APITestCase):
+    """ Test module for ETag, Last-Modified and 304 responses """
+
+    def setUp(self):
+        cache.responses.clear()
+        self.company = Company.objects.create(name='Test Company 1')
+        self.dept = Department.objects.create(name='Engineering', company=self.company)
+        user = User.objects.create_user(username='user0', first_name='Test', last_name='User')
+        self.emp = Employee.objects.create(designation='Jr', user=user)
+        self.emp.department.add(self.dept)
+
+    def test_validators_on_list_and_detail(self):
+        for url in [reverse('employee-list'), reverse('department-detail', kwargs={'pk': self.dept.pk})]:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertRegex(response['ETag'], r'^"[0-9a-f]{32}"$')
+            self.assertIn('Last-Modified', response)
+            self.assertEqual(response['Cache-Control'], 'no-cache')
+
+    def test_if_none_match(self):
+        url = reverse('employee-list')
+        etag = self.client.get(url)['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['ETag'], etag)
+
+    def test_change_gives_new_etag(self):
+        url = reverse('employee-list')
+        etag = self.client.get(url)['ETag']
+        self.emp.department.remove(self.dept)
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_unrelated_change_keeps_etag(self):
+        url = reverse('company-detail', kwargs={'pk': self.company.pk})
+        etag = self.client.get(url)['ETag']
+        User.objects.create_user(username='user1')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_etag_depends_on_query(self):
+        url = reverse('department-list')
+        self.assertNotEqual(self.client.get(url)['ETag'], self.client.get(url + '?expand=company')['ETag'])
+
+    def test_if_modified_since(self):
+        url = reverse('company-list')
+        last_modified = self.client.get(url)['Last-Modified']
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_not_found_has_no_etag(self):
+        response = self.client.get(reverse('company-detail', kwargs={'pk': 100}))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertNotIn('ETag', response)
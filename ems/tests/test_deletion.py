@@ -0,0 +1,127 @@
+from ems import deletion, headcount, jobs
+from ems.models import Company, Department, Employee, Headcount
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APITestCase
+
+Membership = Employee.department.through
+
+
+def _create_tree(test):
+    test.c1 = Company.objects.create(name='Test Company 1')
+    test.c2 = Company.objects.create(name='Test Company 2')
+    test.eng = Department.objects.create(name='Engineering', company=test.c1)
+    test.qa = Department.objects.create(name='Quality Assurance', company=test.c1)
+    test.ops = Department.objects.create(name='Operations', company=test.c2)
+
+    test.emps = []
+    for i, (designation, members) in enumerate([
+        ('Jr', [test.eng, test.qa]),
+        ('Sr', [test.qa, test.ops]),
+        ('Mg', [test.ops]),
+    ]):
+        emp = Employee.objects.create(designation=designation, user=User.objects.create_user(username=f'user{i}'))
+        emp.department.add(*members)
+        test.emps.append(emp)
+
+
+class DeletionTest(TestCase):
+    """ Test module for the set-based deletion of companies and departments """
+
+    def setUp(self):
+        _create_tree(self)
+
+    def assertCounted(self):
+        stored = {key: n for key, n in headcount.stored().items() if n}
+        self.assertEqual(stored, dict(headcount.compute()))
+
+    def test_delete_companies(self):
+        versions = dict(Employee.objects.values_list('pk', 'version'))
+        progress = []
+        total, deleted = deletion.delete_companies([self.c1.pk], lambda *args: progress.append(args))
+
+        self.assertFalse(Company.objects.filter(pk=self.c1.pk).exists())
+        self.assertFalse(Department.objects.filter(company_id=self.c1.pk).exists())
+        self.assertFalse(Headcount.objects.filter(company_id=self.c1.pk).exists())
+        self.assertEqual(Employee.objects.count(), 3)
+        self.assertEqual(list(self.emps[1].department.all()), [self.ops])
+        self.assertEqual(deleted['ems.Company'], 1)
+        self.assertEqual(deleted['ems.Department'], 2)
+        self.assertEqual(deleted['ems.Employee_department'], 3)
+        self.assertEqual(total, sum(deleted.values()))
+        self.assertEqual(progress, [(2, 2)])
+        self.assertCounted()
+
+        # The employees that lost departments show them no more
+        self.assertNotEqual(Employee.objects.get(pk=self.emps[0].pk).version, versions[self.emps[0].pk])
+        self.assertEqual(Employee.objects.get(pk=self.emps[2].pk).version, versions[self.emps[2].pk])
+
+    def test_delete_departments(self):
+        deletion.delete_departments([self.qa.pk])
+        self.assertEqual(list(self.emps[0].department.all()), [self.eng])
+        # Still in Test Company 1 through Engineering
+        self.assertEqual(headcount.read(company_id=self.c1.pk)['total'], 1)
+        self.assertCounted()
+
+    def test_queries_do_not_grow(self):
+        with CaptureQueriesContext(connection) as small:
+            deletion.delete_companies([self.c2.pk])
+        for i in range(20):
+            dept = Department.objects.create(name=f'Dept {i}', company=self.c1)
+            dept.employee_set.add(*self.emps)
+        with CaptureQueriesContext(connection) as large:
+            deletion.delete_companies([self.c1.pk])
+        self.assertEqual(len(large), len(small))
+        self.assertCounted()
+
+    def test_summary(self):
+        self.assertEqual(deletion.summary(Company, [self.c1.pk]), {Department: 2, Membership: 3})
+        self.assertEqual(deletion.summary(Department, [self.ops.pk]), {Membership: 2})
+
+
+class DeleteViewsTest(APITestCase):
+    """ Test module for deleting companies and departments through the API """
+
+    def setUp(self):
+        _create_tree(self)
+
+    def test_delete_company(self):
+        response = self.client.delete(reverse('company-detail', args=[self.c1.pk]))
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(list(Department.objects.all()), [self.ops])
+
+    def test_bulk_delete_departments(self):
+        response = self.client.delete(
+            reverse('department-bulk'), data=JSONRenderer().render([self.eng.pk, self.ops.pk]),
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(list(Department.objects.all()), [self.qa])
+        self.assertEqual(headcount.read(company_id=self.c2.pk)['total'], 0)
+
+
+class AsyncDeleteTest(APITestCase):
+    """ Test module for deleting companies in the background """
+
+    def setUp(self):
+        _create_tree(self)
+
+    def test_delete_company_async(self):
+        response = self.client.delete(reverse('company-detail', args=[self.c1.pk]) + '?async=true')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        job = response.json()
+        self.assertEqual((job['task'], job['args'], job['status']), ('ems.delete', ['ems.Company', [self.c1.pk]], 'queued'))
+        self.assertTrue(response['Location'].endswith(reverse('job-detail', args=[job['id']])))
+        self.assertTrue(Company.objects.filter(pk=self.c1.pk).exists())
+
+        self.assertEqual(jobs.work(burst=True), 1)
+        job = self.client.get(response['Location']).json()
+        self.assertEqual(job['status'], 'done')
+        self.assertEqual(job['progress'], {'done': 2, 'total': 2})
+        self.assertEqual(job['result'][1]['ems.Company'], 1)
+        self.assertFalse(Company.objects.filter(pk=self.c1.pk).exists())
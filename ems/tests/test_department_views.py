@@ -12,7 +12,7 @@ class GetNoDepartmentsTest(APITestCase):
     def test_no_deparments(self):
         response = self.client.get(reverse('department-list'))
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(response.data, [])
+        self.assertEqual(response.data['results'], [])
 
 class GetAllDepartmentsTest(APITestCase):
     """ Test module for GET all departments API """
@@ -32,7 +32,7 @@ class GetAllDepartmentsTest(APITestCase):
         # get data from db
         depts = Department.objects.all()
         serializer = DepartmentSerializer(depts, many=True)
-        self.assertEqual(response.data, serializer.data)
+        self.assertEqual(response.data['results'], serializer.data)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
 
@@ -92,6 +92,22 @@ class CreateNewDepartmentTest(APITestCase):
             "company": ["This field is required."]
             })
 
+    def test_create_duplicate_department(self):
+        self.client.post(
+            reverse('department-list'),
+            data=JSONRenderer().render(self.valid_payload),
+            content_type='application/json'
+        )
+        response = self.client.post(
+            reverse('department-list'),
+            data=JSONRenderer().render(self.valid_payload),
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data, {
+            "non_field_errors": ["The fields company, name must make a unique set."]
+            })
+
 class UpdateSingleDepartmentTest(APITestCase):
     """ Test module for updating an existing department record """
 
@@ -13,7 +13,7 @@ class GetNoEmployeesTest(APITestCase):
     def test_no_employees(self):
         response = self.client.get(reverse('employee-list'))
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(response.data, [])
+        self.assertEqual(response.data['results'], [])
 
 class GetAllEmployeesTest(APITestCase):
     """ Test module for GET all employees API """
@@ -57,7 +57,7 @@ class GetAllEmployeesTest(APITestCase):
         # get data from db
         employees = Employee.objects.all()
         serializer = EmployeeSerializer(employees, many=True)
-        self.assertEqual(response.data, serializer.data)
+        self.assertEqual(response.data['results'], serializer.data)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
 
@@ -0,0 +1,75 @@
+import csv
+import io
+import json
+from unittest import mock
+from ems.models import Company, Department, Employee
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+from django.contrib.auth.models import User
+
+
+class ExportEmployeesTest(APITestCase):
+    """ Test module for the streaming employee export """
+
+    def setUp(self):
+        c1 = Company.objects.create(name='Test Company 1')
+        c2 = Company.objects.create(name='Test Company 2')
+
+        self.dept1 = Department.objects.create(name='Engineering', company=c1)
+        self.dept2 = Department.objects.create(name='Quality Assurance', company=c2)
+
+        for i in range(5):
+            user = User.objects.create_user(
+                username=f'user{i}',
+                first_name='Test',
+                last_name=f'User, {i}'
+            )
+            emp = Employee.objects.create(designation='Jr', user=user)
+            emp.department.add(self.dept1)
+            if i % 2:
+                emp.department.add(self.dept2)
+
+    def read(self, response):
+        return b''.join(response.streaming_content).decode()
+
+    def test_export_ndjson(self):
+        response = self.client.get(reverse('employee-export'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson; charset=utf-8')
+
+        rows = [json.loads(line) for line in self.read(response).splitlines()]
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(rows[1], {
+            'id': 2,
+            'user': rows[1]['user'],
+            'username': 'user1',
+            'first_name': 'Test',
+            'last_name': 'User, 1',
+            'designation': 'Jr',
+            'department': [
+                {'id': self.dept1.pk, 'name': 'Engineering', 'company': {'id': self.dept1.company_id, 'name': 'Test Company 1'}},
+                {'id': self.dept2.pk, 'name': 'Quality Assurance', 'company': {'id': self.dept2.company_id, 'name': 'Test Company 2'}},
+            ],
+        })
+
+    def test_export_csv(self):
+        response = self.client.get(reverse('employee-export'), {'format': 'csv'})
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+
+        rows = list(csv.DictReader(io.StringIO(self.read(response))))
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(rows[1]['last_name'], 'User, 1')
+        self.assertEqual(rows[1]['department_ids'], f'{self.dept1.pk}|{self.dept2.pk}')
+        self.assertEqual(rows[1]['companies'], 'Test Company 1|Test Company 2')
+        self.assertEqual(rows[0]['departments'], 'Engineering')
+
+    def test_export_queries_per_chunk(self):
+        # One query for the employees and one for their departments per chunk,
+        # plus the query that finds no further employees
+        with mock.patch('ems.export.CHUNK_SIZE', 2):
+            with self.assertNumQueries(7):
+                response = self.client.get(reverse('employee-export'))
+                lines = self.read(response).splitlines()
+        self.assertEqual([json.loads(line)['id'] for line in lines], [1, 2, 3, 4, 5])
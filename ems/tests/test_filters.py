@@ -0,0 +1,94 @@
+from ems.models import Company, Department, Employee
+from django.db import connection
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+from django.contrib.auth.models import User
+
+
+class FilterEmployeesTest(APITestCase):
+    """ Test module for filtering and searching the employee list """
+
+    def setUp(self):
+        c1 = Company.objects.create(name='Test Company 1')
+        c2 = Company.objects.create(name='Test Company 2')
+
+        self.dept1 = Department.objects.create(name='Engineering', company=c1)
+        self.dept2 = Department.objects.create(name='Quality Assurance', company=c1)
+        self.dept3 = Department.objects.create(name='Engineering', company=c2)
+
+        self.employees = {}
+        for username, first_name, last_name, designation, departments in [
+            ('anna', 'Anna', 'Shah', 'Jr', [self.dept1, self.dept2]),
+            ('bob', 'Bob', 'Shahid', 'Sr', [self.dept2]),
+            ('chen', 'Wei', 'Chen', 'Mg', [self.dept3]),
+            ('dana', 'Dána', 'Annan', 'Jr', [self.dept1, self.dept3]),
+        ]:
+            user = User.objects.create_user(username=username, first_name=first_name, last_name=last_name)
+            emp = Employee.objects.create(designation=designation, user=user)
+            emp.department.add(*departments)
+            self.employees[username] = emp
+
+    def usernames(self, **params):
+        response = self.client.get(reverse('employee-list'), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [User.objects.get(pk=row['user']).username for row in response.data['results']]
+
+    def test_filter_by_company(self):
+        self.assertEqual(self.usernames(company=self.dept1.company_id), ['anna', 'bob', 'dana'])
+        self.assertEqual(self.usernames(company=self.dept3.company_id), ['chen', 'dana'])
+
+    def test_filter_by_department(self):
+        self.assertEqual(self.usernames(department=self.dept2.pk), ['anna', 'bob'])
+        self.assertEqual(self.usernames(department=f'{self.dept2.pk},{self.dept3.pk}'), ['anna', 'bob', 'chen', 'dana'])
+
+    def test_filter_by_designation(self):
+        self.assertEqual(self.usernames(designation='Jr'), ['anna', 'dana'])
+        self.assertEqual(self.usernames(designation='Sr,Mg'), ['bob', 'chen'])
+
+    def test_filter_by_user(self):
+        self.assertEqual(self.usernames(user=self.employees['chen'].user_id), ['chen'])
+
+    def test_filters_combine(self):
+        self.assertEqual(self.usernames(company=self.dept1.company_id, designation='Jr', department=self.dept2.pk), ['anna'])
+
+    def test_invalid_values(self):
+        response = self.client.get(reverse('employee-list'), {'company': 'x', 'designation': 'Xx'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data, {'company': ['"x" is not a valid id.']})
+
+        response = self.client.get(reverse('employee-list'), {'designation': 'Jr,Xx'})
+        self.assertEqual(response.data, {'designation': ['"Xx" is not a valid choice.']})
+
+        # Beyond what SQLite stores
+        response = self.client.get(reverse('employee-list'), {'user': '99999999999999999999999'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data, {'user': ['"99999999999999999999999" is not a valid id.']})
+
+    def test_search(self):
+        self.assertEqual(self.usernames(q='shah'), ['anna', 'bob'])
+        self.assertEqual(self.usernames(q='ann'), ['anna', 'dana'])
+        self.assertEqual(self.usernames(q='Anna Sh'), ['anna'])
+        self.assertEqual(self.usernames(q='dana'), ['dana'])
+        self.assertEqual(self.usernames(q='hah'), [])
+
+    def test_search_ignores_query_syntax(self):
+        self.assertEqual(self.usernames(q='"wei*(^'), ['chen'])
+        self.assertEqual(self.usernames(q='  '), ['anna', 'bob', 'chen', 'dana'])
+
+    def test_search_index_follows_users(self):
+        user = self.employees['bob'].user
+        user.last_name = 'Smith'
+        user.save()
+        self.assertEqual(self.usernames(q='smi'), ['bob'])
+        self.assertEqual(self.usernames(q='shahid'), [])
+
+        user.delete()
+        self.assertEqual(self.usernames(q='shah'), ['anna'])
+
+    def test_search_uses_index(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('FTS5 index is SQLite only')
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT rowid FROM ems_user_fts WHERE ems_user_fts MATCH 'wei'")
+            self.assertEqual(cursor.fetchall(), [(self.employees['chen'].user_id,)])
@@ -0,0 +1,167 @@
+import io
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from ems import headcount
+from ems.models import Company, Department, Employee, Headcount
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APITestCase
+from django.contrib.auth.models import User
+
+
+class HeadcountTestCase(APITestCase):
+    def setUp(self):
+        self.c1 = Company.objects.create(name='Test Company 1')
+        self.c2 = Company.objects.create(name='Test Company 2')
+        self.eng = Department.objects.create(name='Engineering', company=self.c1)
+        self.qa = Department.objects.create(name='Quality Assurance', company=self.c1)
+        self.ops = Department.objects.create(name='Operations', company=self.c2)
+
+        self.emps = []
+        for i, (designation, members) in enumerate([
+            ('Jr', [self.eng, self.qa]),
+            ('Sr', [self.qa]),
+            ('Mg', []),
+            ('Jr', [self.ops, self.eng]),
+        ]):
+            emp = Employee.objects.create(designation=designation, user=User.objects.create_user(username=f'user{i}'))
+            emp.department.add(*members)
+            self.emps.append(emp)
+
+    def assertCounted(self):
+        """ The stored counters match a count from scratch """
+        stored = {key: n for key, n in headcount.stored().items() if n}
+        self.assertEqual(stored, dict(headcount.compute()))
+
+    def bulk(self, method, name, payload):
+        return getattr(self.client, method)(
+            reverse(f'{name}-bulk'),
+            data=JSONRenderer().render(payload),
+            content_type='application/json'
+        )
+
+
+class HeadcountMaintenanceTest(HeadcountTestCase):
+    """ Test module for keeping the headcount counters in step with changes """
+
+    def test_initial_counts(self):
+        self.assertCounted()
+        self.assertEqual(headcount.read(), {'total': 4, 'designations': {'Jr': 2, 'As': 0, 'Sr': 1, 'Mg': 1}})
+        # Employee 0 is in two departments of company 1 and counts once
+        self.assertEqual(headcount.read(company_id=self.c1.pk)['designations'], {'Jr': 2, 'As': 0, 'Sr': 1, 'Mg': 0})
+        self.assertEqual(headcount.read(department_id=self.qa.pk)['total'], 2)
+
+    def test_designation_changes(self):
+        emp = self.emps[0]
+        emp.designation = 'Sr'
+        emp.save()
+        self.assertCounted()
+        emp.designation = 'Mg'
+        emp.save(update_fields=['designation'])
+        self.assertCounted()
+        self.assertEqual(headcount.read(company_id=self.c1.pk)['designations']['Mg'], 1)
+
+    def test_membership_changes(self):
+        emp = self.emps[0]
+        emp.department.remove(self.qa)
+        self.assertCounted()
+        emp.department.add(self.ops, self.qa)
+        self.assertCounted()
+        # Adding a membership twice changes nothing
+        emp.department.add(self.ops)
+        self.assertCounted()
+        emp.department.clear()
+        self.assertCounted()
+        emp.department.set([self.eng])
+        self.assertCounted()
+
+    def test_reverse_membership_changes(self):
+        self.qa.employee_set.add(self.emps[2], self.emps[3])
+        self.assertCounted()
+        self.eng.employee_set.remove(self.emps[0])
+        self.assertCounted()
+        self.qa.employee_set.clear()
+        self.assertCounted()
+        self.assertEqual(headcount.read(department_id=self.qa.pk)['total'], 0)
+
+    def test_deletes(self):
+        self.emps[3].delete()
+        self.assertCounted()
+        self.qa.delete()
+        self.assertCounted()
+        self.c2.delete()
+        self.assertCounted()
+
+    def test_department_moves(self):
+        self.ops.company = self.c1
+        self.ops.save()
+        self.assertCounted()
+        self.eng.company = self.c2
+        self.eng.save()
+        self.assertCounted()
+
+    def test_bulk_writes(self):
+        response = self.bulk('post', 'employee', [
+            {'user': {'username': 'new'}, 'department': [self.eng.pk, self.ops.pk], 'designation': 'As'},
+            {'user': {'username': 'other'}, 'department': [self.qa.pk], 'designation': 'Jr'},
+        ])
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertCounted()
+
+        response = self.bulk('patch', 'employee', [
+            {'id': self.emps[0].pk, 'designation': 'Mg'},
+            {'id': self.emps[1].pk, 'department': [self.ops.pk]},
+            {'id': self.emps[2].pk, 'designation': 'Mg'},
+        ])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertCounted()
+
+        response = self.bulk('patch', 'department', [{'id': self.qa.pk, 'company': self.c2.pk}])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertCounted()
+
+        response = self.bulk('delete', 'employee', [self.emps[3].pk])
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertCounted()
+
+    def test_command(self):
+        out = io.StringIO()
+        call_command('headcount', stdout=out)
+        self.assertIn('are right', out.getvalue())
+
+        Employee.objects.filter(pk=self.emps[1].pk).update(designation='Jr')
+        err = io.StringIO()
+        with self.assertRaisesMessage(CommandError, '6 counters are off'):
+            call_command('headcount', stdout=io.StringIO(), stderr=err)
+        self.assertIn('overall Jr: stored 2, counted 3', err.getvalue())
+
+        call_command('headcount', rebuild=True, stdout=io.StringIO())
+        self.assertCounted()
+        self.assertFalse(Headcount.objects.filter(count=0).exists())
+
+
+class HeadcountViewTest(HeadcountTestCase):
+    """ Test module for the headcount endpoint """
+
+    def test_read(self):
+        response = self.client.get(reverse('headcount'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {'total': 4, 'designations': {'Jr': 2, 'As': 0, 'Sr': 1, 'Mg': 1}})
+
+        response = self.client.get(reverse('headcount'), {'department': self.ops.pk})
+        self.assertEqual(response.data, {'total': 1, 'designations': {'Jr': 1, 'As': 0, 'Sr': 0, 'Mg': 0}})
+        response = self.client.get(reverse('headcount'), {'company': self.c1.pk})
+        self.assertEqual(response.data['total'], 3)
+
+    def test_queries(self):
+        with self.assertNumQueries(2):
+            self.client.get(reverse('headcount'), {'company': self.c1.pk})
+
+    def test_bad_scope(self):
+        response = self.client.get(reverse('headcount'), {'company': 'abc'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(reverse('headcount'), {'company': '99999999999999999999999'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(reverse('headcount'), {'department': 100})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
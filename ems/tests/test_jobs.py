@@ -0,0 +1,169 @@
+from datetime import timedelta
+from unittest import mock
+
+from ems import headcount, jobs
+from ems.models import Company, Job
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+calls = []
+
+
+@jobs.task('tests.record')
+def record(value, progress):
+    calls.append(value)
+    progress(1, 1)
+    return value
+
+
+@jobs.task('tests.fail', max_attempts=2)
+def fail(progress):
+    Company.objects.create(name='Rolled back')
+    raise RuntimeError('boom')
+
+
+@jobs.task('tests.steps', atomic=False)
+def steps(progress):
+    saved = []
+    for done in range(1, 4):
+        progress(done, 3)
+        saved.append(Job.objects.values_list('done', 'total').get(task='tests.steps'))
+    return saved
+
+
+@jobs.task('tests.urgent', priority=5)
+def urgent(progress):
+    calls.append('urgent')
+
+
+class JobQueueTest(TestCase):
+    """ Test module for the background job queue """
+
+    def setUp(self):
+        calls.clear()
+
+    def test_submit_unknown_task(self):
+        with self.assertRaises(ValueError):
+            jobs.submit('tests.unknown')
+
+    def test_run_by_priority_then_age(self):
+        jobs.submit('tests.record', 'first')
+        jobs.submit('tests.urgent')
+        jobs.submit('tests.record', 'last')
+        jobs.submit('tests.record', 'now', priority=10)
+
+        self.assertEqual(jobs.work(burst=True), 4)
+        self.assertEqual(calls, ['now', 'urgent', 'first', 'last'])
+        job = Job.objects.get(args=['first'])
+        self.assertEqual((job.status, job.result, job.attempts, (job.done, job.total)), (Job.DONE, 'first', 1, (1, 1)))
+
+    def test_progress_saved_on_the_row(self):
+        job = jobs.submit('tests.steps')
+        with override_settings(EMS_JOBS={'PROGRESS_INTERVAL': 60}):
+            jobs.work(burst=True)
+        job.refresh_from_db()
+        # The first and the last, the others in between at most once a minute
+        self.assertEqual(job.result, [[1, 3], [1, 3], [3, 3]])
+        self.assertEqual((job.done, job.total), (3, 3))
+
+    def test_retry_then_fail(self):
+        job = jobs.submit('tests.fail')
+        self.assertEqual(job.max_attempts, 2)
+
+        with self.assertLogs('ems.jobs', 'WARNING'):
+            jobs.work(burst=True)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.QUEUED, 1))
+        self.assertGreater(job.run_after, timezone.now() + timedelta(seconds=4))
+        self.assertIn('RuntimeError: boom', job.error)
+        self.assertFalse(Company.objects.filter(name='Rolled back').exists())
+        # Not ready before its backoff
+        self.assertEqual(jobs.work(burst=True), 0)
+
+        Job.objects.filter(pk=job.pk).update(run_after=timezone.now())
+        with self.assertLogs('ems.jobs', 'ERROR'):
+            jobs.work(burst=True)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.FAILED, 2))
+        self.assertIsNotNone(job.finished)
+
+    def test_reclaim_abandoned(self):
+        job = jobs.submit('tests.record', 'again')
+        self.assertEqual(jobs.claim('dead').worker, 'dead')
+        self.assertIsNone(jobs.claim('alive'))
+
+        Job.objects.filter(pk=job.pk).update(started=timezone.now() - timedelta(hours=2))
+        self.assertEqual(jobs.work('alive', burst=True), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.worker, job.attempts), (Job.DONE, 'alive', 2))
+
+    def test_fail_abandoned_after_max_attempts(self):
+        job = jobs.submit('tests.record', 'crash')
+        Job.objects.filter(pk=job.pk).update(
+            status=Job.RUNNING, attempts=job.max_attempts, started=timezone.now() - timedelta(hours=2),
+        )
+        self.assertIsNone(jobs.claim('alive'))
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertEqual(calls, [])
+
+    def test_work_until_stopped(self):
+        jobs.submit('tests.record', 'one')
+        stop = mock.Mock(side_effect=[False, False, True])
+        with override_settings(EMS_JOBS={'POLL_INTERVAL': 0}):
+            self.assertEqual(jobs.work(stop=stop), 1)
+        self.assertEqual(calls, ['one'])
+
+
+class RunWorkersCommandTest(TestCase):
+    """ Test module for the run_workers management command """
+
+    def setUp(self):
+        calls.clear()
+
+    def test_burst(self):
+        jobs.submit('tests.record', 'one')
+        jobs.submit('tests.record', 'two')
+        call_command('run_workers', processes=1, burst=True, stdout=mock.MagicMock())
+        self.assertEqual(calls, ['one', 'two'])
+        self.assertFalse(Job.objects.exclude(status=Job.DONE).exists())
+
+    def test_headcount_background(self):
+        call_command('headcount', rebuild=True, background=True, stdout=mock.MagicMock())
+        job = Job.objects.get()
+        self.assertEqual((job.task, job.priority), ('ems.rebuild_headcount', -10))
+
+        with mock.patch.object(headcount, 'rebuild', return_value=[]) as rebuild:
+            call_command('run_workers', processes=1, burst=True, stdout=mock.MagicMock())
+        rebuild.assert_called_once_with()
+
+
+class JobViewSetTest(APITestCase):
+    """ Test module for the job status API """
+
+    def setUp(self):
+        self.done = jobs.submit('tests.record', 'done')
+        jobs.work(burst=True)
+        self.queued = jobs.submit('tests.record', 'queued')
+
+    def test_list(self):
+        response = self.client.get(reverse('job-list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([job['id'] for job in response.json()['results']], [self.queued.pk, self.done.pk])
+
+        response = self.client.get(reverse('job-list'), {'status': Job.QUEUED})
+        self.assertEqual([job['id'] for job in response.json()['results']], [self.queued.pk])
+
+    def test_detail(self):
+        response = self.client.get(reverse('job-detail', args=[self.done.pk]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        job = response.json()
+        self.assertEqual((job['status'], job['result'], job['progress']), ('done', 'done', {'done': 1, 'total': 1}))
+
+    def test_read_only(self):
+        response = self.client.delete(reverse('job-detail', args=[self.done.pk]))
+        self.assertEqual(response.status_code, status.HTTP_405_METHOD_NOT_ALLOWED)
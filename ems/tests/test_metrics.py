@@ -0,0 +1,99 @@
+import re
+from ems import cache, metrics
+from ems.models import Company, Department, Employee
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+
+def server_timing(response):
+    """ The durations and descriptions of the ``Server-Timing`` header, by metric name """
+    timings = {}
+    for metric in response['Server-Timing'].split(', '):
+        name, *params = metric.split(';')
+        timings[name] = dict(param.split('=', 1) for param in params)
+    return timings
+
+
+class TimedTest(TestCase):
+    """ Test module for the timed spans of a request """
+
+    def test_outside_requests(self):
+        with metrics.timed('serialize'):
+            Company.objects.count()
+
+    def test_nested_spans_without_queries(self):
+        request = metrics.RequestMetrics()
+        token = metrics._current.set(request)
+        try:
+            with metrics.timed('serialize'), metrics.timed('serialize'):
+                Company.objects.count()
+        finally:
+            metrics._current.reset(token)
+        self.assertEqual(request.queries, 1)
+        self.assertEqual(list(request.spans), ['serialize'])
+        self.assertLess(request.spans['serialize'], request.db_time + 0.01)
+
+
+class MetricsMiddlewareTest(APITestCase):
+    """ Test module for the request metrics middleware and endpoint """
+
+    def setUp(self):
+        cache.responses.clear()
+        metrics.registry.reset()
+        company = Company.objects.create(name='Test Company 1')
+        dept = Department.objects.create(name='Engineering', company=company)
+        for i in range(3):
+            emp = Employee.objects.create(designation='Jr', user=User.objects.create_user(username=f'user{i}'))
+            emp.department.add(dept)
+
+    def test_server_timing(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('employee-list') + '?expand=company')
+        timings = server_timing(response)
+        self.assertEqual(timings['db']['desc'], f'"{len(queries)} queries"')
+        self.assertIn('serialize', timings)
+        self.assertGreaterEqual(float(timings['total']['dur']), float(timings['db']['dur']))
+
+        # Cache hits run no query
+        timings = server_timing(self.client.get(reverse('employee-list') + '?expand=company'))
+        self.assertEqual(timings['db'], {'dur': '0.0', 'desc': '"0 queries"'})
+
+    @override_settings(EMS_METRICS={'SERVER_TIMING': False})
+    def test_server_timing_off(self):
+        self.assertNotIn('Server-Timing', self.client.get(reverse('company-list')))
+
+    def test_exposition(self):
+        self.client.get(reverse('company-list'))
+        self.client.get(reverse('company-list'))
+        self.client.get('/api/unknown/')
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        text = response.content.decode()
+
+        self.assertIn('# TYPE ems_request_duration_seconds histogram', text)
+        labels = 'route="company-list",method="GET",status="200"'
+        self.assertIn(f'ems_request_duration_seconds_bucket{{{labels},le="+Inf"}} 2', text)
+        self.assertIn(f'ems_request_queries_count{{{labels}}} 2', text)
+        self.assertIn('ems_request_duration_seconds_count{route="unmatched",method="GET",status="404"} 1', text)
+        # Buckets are cumulative
+        counts = [int(count) for count in re.findall(
+            rf'ems_request_queries_bucket{{{re.escape(labels)},le="[^"]+"}} (\d+)', text,
+        )]
+        self.assertEqual(counts, sorted(counts))
+
+    def test_other_methods_share_a_label(self):
+        for method in ['X0', 'X1', 'X2']:
+            self.client.generic(method, reverse('company-list'))
+        text = self.client.get(reverse('metrics')).content.decode()
+        self.assertIn('ems_request_duration_seconds_count{route="company-list",method="other",status="405"} 3', text)
+        self.assertNotIn('method="X0"', text)
+
+    def test_internal_only(self):
+        response = self.client.get(reverse('metrics'), REMOTE_ADDR='10.0.0.1')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
@@ -1,3 +1,4 @@
+from django.db import IntegrityError, connection
 from django.test import TestCase
 from ems.models import Company, Department, Employee
 from django.contrib.auth import get_user_model
@@ -53,6 +54,12 @@ class DepartmentModelTest(TestCase):
         expected_object_name = f'{dept.name} ({dept.company.name})'
         self.assertEqual(expected_object_name, str(dept))
 
+    def test_name_unique_per_company(self):
+        dept = Department.objects.get(id=1)
+        Department.objects.create(name=dept.name, company=Company.objects.create(name='Other Company'))
+        with self.assertRaises(IntegrityError):
+            Department.objects.create(name=dept.name, company=dept.company)
+
 
 class EmployeeModelTest(TestCase):
     @classmethod
@@ -104,3 +111,25 @@ class EmployeeModelTest(TestCase):
         emp = Employee.objects.get(id=1)
         expected_object_name = f'{emp.user.first_name} {emp.user.last_name}'
         self.assertEqual(expected_object_name, str(emp))
+
+
+class IndexTest(TestCase):
+    """ Test module for the indexes behind the API's lookups """
+
+    def indexed_columns(self, table):
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(cursor, table)
+        return {tuple(c['columns']) for c in constraints.values() if c['index']}
+
+    def test_indexes(self):
+        self.assertIn(('name', 'id'), self.indexed_columns('ems_company'))
+        self.assertIn(('company_id', 'name'), self.indexed_columns('ems_department'))
+        self.assertIn(('designation', 'id'), self.indexed_columns('ems_employee'))
+        self.assertIn(('department_id', 'employee_id'), self.indexed_columns('ems_employee_department'))
+
+    def test_employees_of_department_use_covering_index(self):
+        sql, params = Employee.department.through.objects.filter(department_id=1).values_list('employee_id').query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            plan = ' '.join(row[-1] for row in cursor.fetchall())
+        self.assertIn('COVERING INDEX ems_employee_department_dept_emp_idx', plan)
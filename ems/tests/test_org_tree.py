@@ -0,0 +1,85 @@
+import json
+from ems.models import Company, Department, Employee
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+from django.contrib.auth.models import User
+
+
+class OrgTreeTest(APITestCase):
+    """ Test module for the company -> departments -> employees tree """
+
+    def setUp(self):
+        self.c1 = Company.objects.create(name='Test Company 1')
+        self.c2 = Company.objects.create(name='Test Company 2')
+        self.empty = Company.objects.create(name='No Departments')
+
+        # Department ids interleave between the companies
+        self.eng = Department.objects.create(name='Engineering', company=self.c1)
+        self.ops = Department.objects.create(name='Operations', company=self.c2)
+        self.qa = Department.objects.create(name='Quality Assurance', company=self.c1)
+        self.hr = Department.objects.create(name='HR', company=self.c2)
+
+        self.employees = []
+        for i, departments in enumerate([[self.qa, self.ops], [self.eng], [self.qa], [self.ops]]):
+            user = User.objects.create_user(username=f'user{i}', first_name='Test', last_name=f'User {i}')
+            emp = Employee.objects.create(designation='Jr', user=user)
+            emp.department.add(*departments)
+            self.employees.append(emp)
+
+    def employee(self, index):
+        emp = self.employees[index]
+        return {
+            'id': emp.pk, 'user': emp.user_id, 'emp_first_name': 'Test',
+            'emp_last_name': f'User {index}', 'designation': 'Jr',
+        }
+
+    def test_tree(self):
+        response = self.client.get(reverse('company-tree'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json(), [
+            {'id': self.c1.pk, 'name': 'Test Company 1', 'departments': [
+                {'id': self.eng.pk, 'name': 'Engineering', 'employees': [self.employee(1)]},
+                {'id': self.qa.pk, 'name': 'Quality Assurance', 'employees': [self.employee(0), self.employee(2)]},
+            ]},
+            {'id': self.c2.pk, 'name': 'Test Company 2', 'departments': [
+                {'id': self.ops.pk, 'name': 'Operations', 'employees': [self.employee(0), self.employee(3)]},
+                {'id': self.hr.pk, 'name': 'HR', 'employees': []},
+            ]},
+            {'id': self.empty.pk, 'name': 'No Departments', 'departments': []},
+        ])
+
+    def test_company_tree(self):
+        response = self.client.get(reverse('company-detail-tree', kwargs={'pk': self.c2.pk}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json(), {'id': self.c2.pk, 'name': 'Test Company 2', 'departments': [
+            {'id': self.ops.pk, 'name': 'Operations', 'employees': [self.employee(0), self.employee(3)]},
+            {'id': self.hr.pk, 'name': 'HR', 'employees': []},
+        ]})
+
+        for pk in [100, 'abc']:
+            response = self.client.get(reverse('company-detail-tree', kwargs={'pk': pk}))
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_streamed_tree(self):
+        response = self.client.get(reverse('company-tree'), {'format': 'ndjson'})
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson; charset=utf-8')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(line) for line in lines], self.client.get(reverse('company-tree')).json())
+
+    def test_queries_do_not_grow(self):
+        with self.assertNumQueries(3):
+            self.client.get(reverse('company-tree'))
+        with self.assertNumQueries(3):
+            self.client.get(reverse('company-detail-tree', kwargs={'pk': self.c1.pk}))
+
+        for i in range(10):
+            dept = Department.objects.create(name=f'Department {i}', company=self.empty)
+            user = User.objects.create_user(username=f'new{i}')
+            Employee.objects.create(designation='Sr', user=user).department.add(dept, self.eng)
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('company-tree'))
+        self.assertEqual(len(response.json()[2]['departments']), 10)
+        with self.assertNumQueries(3):
+            b''.join(self.client.get(reverse('company-tree'), {'format': 'ndjson'}).streaming_content)
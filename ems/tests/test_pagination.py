@@ -0,0 +1,70 @@
+from unittest import mock
+from urllib.parse import parse_qs, urlparse
+from ems.models import Company
+from ems.views import UserViewSet
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+from django.contrib.auth.models import User
+
+
+class CursorPaginationTest(APITestCase):
+    """ Test module for keyset (cursor) pagination of list endpoints """
+
+    def setUp(self):
+        # Duplicate names make sure the id tie-breaker is used
+        for i in range(7):
+            Company.objects.create(name=f'Test Company {i % 3}')
+
+    def walk(self, url, params):
+        ids = []
+        response = self.client.get(url, params)
+        while True:
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            ids.extend(row['id'] for row in response.data['results'])
+            if response.data['next'] is None:
+                return ids, response
+            response = self.client.get(response.data['next'])
+
+    def test_walk_by_id(self):
+        ids, _ = self.walk(reverse('company-list'), {'page_size': 2})
+        self.assertEqual(ids, list(Company.objects.order_by('id').values_list('id', flat=True)))
+
+    def test_walk_by_sort_key(self):
+        for ordering in ('name', '-name'):
+            ids, _ = self.walk(reverse('company-list'), {'page_size': 2, 'ordering': ordering})
+            expected = Company.objects.order_by(ordering, ordering.replace('name', 'id'))
+            self.assertEqual(ids, list(expected.values_list('id', flat=True)))
+
+    def test_walk_backwards(self):
+        ids, response = self.walk(reverse('company-list'), {'page_size': 3})
+        previous = []
+        while response.data['previous'] is not None:
+            response = self.client.get(response.data['previous'])
+            previous = [row['id'] for row in response.data['results']] + previous
+        self.assertEqual(previous, ids[:len(previous)])
+        self.assertEqual(len(previous), 6)
+
+    def test_page_size_is_capped(self):
+        for i in range(3):
+            User.objects.create_user(username=f'user{i}')
+
+        response = self.client.get(reverse('user-list'), {'page_size': 2})
+        self.assertEqual(len(response.data['results']), 2)
+
+        with mock.patch.object(UserViewSet, 'max_page_size', 1):
+            response = self.client.get(reverse('user-list'), {'page_size': 3})
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertIsNotNone(response.data['next'])
+
+    def test_cursor_bound_to_ordering(self):
+        response = self.client.get(reverse('company-list'), {'page_size': 2})
+        cursor = parse_qs(urlparse(response.data['next']).query)['cursor'][0]
+        response = self.client.get(reverse('company-list'), {'cursor': cursor})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.get(reverse('company-list'), {'cursor': cursor, 'ordering': 'name'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse('company-list'), {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
@@ -0,0 +1,99 @@
+from ems.models import Company, Department, Employee
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+from django.contrib.auth.models import User
+
+
+def _create_employees(count, departments):
+    for i in range(count):
+        user = User.objects.create_user(
+            username=f'user{Employee.objects.count()}',
+            first_name='Test',
+            last_name=f'User {i}',
+        )
+        emp = Employee.objects.create(designation='Jr', user=user)
+        emp.department.add(*departments)
+
+
+class EmployeeListQueriesTest(APITestCase):
+    """ Test module for the number of queries run by the employee read paths """
+
+    def setUp(self):
+        c1 = Company.objects.create(name='Test Company 1')
+        c2 = Company.objects.create(name='Test Company 2')
+
+        self.dept1 = Department.objects.create(name='Engineering', company=c1)
+        self.dept2 = Department.objects.create(name='Quality Assurance', company=c2)
+
+    def assertListQueriesFixed(self, url, queries):
+        _create_employees(2, [self.dept1, self.dept2])
+        with self.assertNumQueries(queries):
+            response = self.client.get(url)
+        self.assertEqual(len(response.data['results']), 2)
+
+        _create_employees(20, [self.dept1, self.dept2])
+        with self.assertNumQueries(queries):
+            response = self.client.get(url)
+        self.assertEqual(len(response.data['results']), 22)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_list_queries_fixed(self):
+        # employees joined with users, then one prefetch for departments
+        self.assertListQueriesFixed(reverse('employee-list'), 2)
+
+    def test_expanded_list_queries_fixed(self):
+        self.assertListQueriesFixed(reverse('employee-list') + '?expand=department,company', 2)
+
+    def test_retrieve_queries(self):
+        _create_employees(1, [self.dept1, self.dept2])
+        emp = Employee.objects.get()
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('employee-detail', kwargs={'pk': emp.pk}))
+        self.assertEqual(response.data['department'], [self.dept1.pk, self.dept2.pk])
+
+    def test_expand_department(self):
+        _create_employees(1, [self.dept1])
+        response = self.client.get(reverse('employee-list') + '?expand=department')
+        self.assertEqual(response.data['results'][0]['department'], [
+            {'id': self.dept1.pk, 'name': 'Engineering', 'company': self.dept1.company_id},
+        ])
+
+    def test_expand_company_implies_department(self):
+        _create_employees(1, [self.dept2])
+        response = self.client.get(reverse('employee-list') + '?expand=company')
+        self.assertEqual(response.data['results'][0]['department'], [
+            {
+                'id': self.dept2.pk,
+                'name': 'Quality Assurance',
+                'company': {'id': self.dept2.company_id, 'name': 'Test Company 2'},
+            },
+        ])
+
+
+class DepartmentListQueriesTest(APITestCase):
+    """ Test module for the number of queries run by the department read paths """
+
+    def test_list_queries_fixed(self):
+        company = Company.objects.create(name='Test Company 1')
+        for expand in ('', 'company'):
+            Department.objects.all().delete()
+            Department.objects.create(name='Test Dept 1', company=company)
+            with self.assertNumQueries(1):
+                self.client.get(reverse('department-list'), {'expand': expand})
+
+            for i in range(20):
+                Department.objects.create(name=f'Test Dept {i + 2}', company=company)
+            with self.assertNumQueries(1):
+                response = self.client.get(reverse('department-list'), {'expand': expand})
+            self.assertEqual(len(response.data['results']), 21)
+
+    def test_expand_company(self):
+        company = Company.objects.create(name='Test Company 1')
+        dept = Department.objects.create(name='Test Dept 1', company=company)
+        response = self.client.get(reverse('department-detail', kwargs={'pk': dept.pk}), {'expand': 'company'})
+        self.assertEqual(response.data, {
+            'id': dept.pk,
+            'name': 'Test Dept 1',
+            'company': {'id': company.pk, 'name': 'Test Company 1'},
+        })
@@ -0,0 +1,121 @@
+import pytest
+from unittest import mock
+from ems import cache, testing
+from ems.admin import EmployeeAdmin
+from ems.models import Company, Department, Employee
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+
+
+def _request(key, queries):
+    method, endpoint = key.split(' ')
+    request = testing.RequestQueries(method, '/')
+    request.endpoint = endpoint
+    request.queries = queries
+    return request
+
+
+class CheckTest(SimpleTestCase):
+    """ Test module for the query budgets and N+1 detection of ems.testing """
+
+    def test_normalize(self):
+        self.assertEqual(
+            testing.normalize('SELECT * FROM "ems_employee" WHERE "id" IN (%s, %s, %s) LIMIT 21'),
+            testing.normalize('SELECT * FROM "ems_employee" WHERE "id" IN (%s) LIMIT 1'),
+        )
+        self.assertEqual(
+            testing.normalize("SELECT 'a', 2.5"), testing.normalize("SELECT 'it''s', 3"),
+        )
+
+    def test_budgets(self):
+        self.assertEqual(testing.check([_request('GET employee-list', ['SELECT 1', 'SELECT 2'])]), [])
+        problems = testing.check([_request('GET employee-list', ['SELECT 1', 'SELECT 2', 'SELECT 3'])])
+        self.assertEqual(len(problems), 1)
+        self.assertIn('ran 3 queries, over the budget of 2', problems[0])
+
+        # No budget, or the budget of the test
+        self.assertEqual(testing.check([_request('POST employee-list', ['SELECT 1'] * 3)]), [])
+        self.assertEqual(len(testing.check([_request('POST employee-list', ['SELECT 1'])], budget=0)), 1)
+
+    def test_repeated_queries(self):
+        query = 'SELECT * FROM "auth_user" WHERE "id" = %s LIMIT 21'
+        self.assertEqual(testing.check([_request('POST employee-list', [query] * 4)]), [])
+        problems = testing.check([_request('POST employee-list', [query] * 5)])
+        self.assertEqual(len(problems), 1)
+        self.assertIn('ran the same query 5 times (N+1)', problems[0])
+
+        savepoints = ['SAVEPOINT "s1_x1"', 'RELEASE SAVEPOINT "s1_x1"'] * 5
+        self.assertEqual(testing.check([_request('POST employee-list', savepoints)]), [])
+
+
+class QueryRecorderTest(testing.QueryBudgetMixin, TestCase):
+    """ Test module for recording the queries of requests """
+
+    def setUp(self):
+        cache.responses.clear()
+        company = Company.objects.create(name='Test Company 1')
+        dept = Department.objects.create(name='Engineering', company=company)
+        for i in range(10):
+            emp = Employee.objects.create(designation='Jr', user=User.objects.create_user(username=f'user{i}'))
+            emp.department.add(dept)
+
+    def test_per_request(self):
+        with testing.QueryRecorder() as recorder:
+            Company.objects.count()
+            self.client.get(reverse('company-list'))
+            self.client.get(reverse('employee-list'))
+        self.assertEqual([request.key for request in recorder.requests], ['GET company-list', 'GET employee-list'])
+        self.assertEqual([len(request.queries) for request in recorder.requests], [1, 2])
+
+    @pytest.mark.unchecked_queries('Makes N+1 requests on purpose')
+    def test_assert_query_budget(self):
+        with self.assertQueryBudget():
+            self.client.get(reverse('employee-list'))
+        with self.assertRaisesMessage(AssertionError, 'over the budget of 0'):
+            with self.assertQueryBudget(0):
+                self.client.get(reverse('employee-list') + '?ordering=-id')
+        # One user per row, without the admin's select_related
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@admin.com', 'admin'))
+        with mock.patch.object(EmployeeAdmin, 'get_queryset', admin.ModelAdmin.get_queryset):
+            with self.assertRaisesRegex(AssertionError, r'ran the same query \d+ times \(N\+1\)'):
+                with self.assertQueryBudget(repeats=5):
+                    self.client.get(reverse('admin:ems_employee_changelist'))
+
+
+class AdminQueryBudgetTest(testing.QueryBudgetMixin, TestCase):
+    """ Test module for the query budgets of the admin views """
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@admin.com', 'admin'))
+        self.company = Company.objects.create(name='Test Company 1')
+        dept = Department.objects.create(name='Engineering', company=self.company)
+        for i in range(20):
+            self.emp = Employee.objects.create(
+                designation='Jr', user=User.objects.create_user(username=f'user{i}'),
+            )
+            self.emp.department.add(dept)
+
+    def test_company_changelist(self):
+        with self.assertQueryBudget():
+            self.client.get(reverse('admin:ems_company_changelist'))
+
+    def test_company_change(self):
+        with self.assertQueryBudget():
+            self.client.get(reverse('admin:ems_company_change', args=[self.company.pk]))
+
+    def test_employee_changelist(self):
+        with self.assertQueryBudget():
+            self.client.get(reverse('admin:ems_employee_changelist'))
+
+    def test_employee_change(self):
+        for i in range(10):
+            self.emp.department.add(Department.objects.create(name=f'Dept {i}', company=self.company))
+        with self.assertQueryBudget():
+            self.client.get(reverse('admin:ems_employee_change', args=[self.emp.pk]))
+
+    def test_autocomplete(self):
+        with self.assertQueryBudget():
+            self.client.get(reverse('admin:ems_employee_autocomplete') + '?term=user')
+            self.client.get(reverse('admin:ems_department_autocomplete') + '?term=Eng')
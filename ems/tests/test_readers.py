@@ -0,0 +1,206 @@
+from contextlib import ExitStack
+from unittest import mock
+from urllib.parse import urlencode
+from ems import cache, readers, serializers, views
+from ems.models import Company, Department, Employee
+from django.urls import reverse
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APITestCase
+from django.contrib.auth.models import User
+
+SERIALIZERS = [
+    serializers.CompanySerializer, serializers.DepartmentSerializer,
+    serializers.EmployeeSerializer, serializers.UserSerializer,
+]
+
+
+class ReaderDataMixin:
+    def setUp(self):
+        c1 = Company.objects.create(name='Test Company 1')
+        c2 = Company.objects.create(name='Société Générale "SG"')
+
+        depts = [
+            Department.objects.create(name='Engineering', company=c1),
+            Department.objects.create(name='Quality Assurance', company=c1),
+            Department.objects.create(name='Ingénierie', company=c2),
+        ]
+
+        for i, (designation, members) in enumerate([
+            ('Jr', [depts[2], depts[0]]),
+            ('Sr', [depts[1]]),
+            ('Mg', []),
+            ('Jr', depts),
+            ('As', [depts[2]]),
+        ]):
+            user = User.objects.create_user(
+                username=f'user{i}',
+                first_name=['Test', 'Zoë', '', 'Anil', '名'][i],
+                last_name=f'User {i}',
+            )
+            emp = Employee.objects.create(designation=designation, user=user)
+            emp.department.add(*members)
+        self.depts = depts
+
+    def get(self, url):
+        cache.responses.clear()
+        return self.client.get(url)
+
+    def assertSameOutput(self, url):
+        # The serializers must not run on the reader path
+        with ExitStack() as stack:
+            for serializer_class in SERIALIZERS:
+                stack.enter_context(mock.patch.object(serializer_class, 'to_representation', side_effect=AssertionError))
+            fast = self.get(url)
+
+        with mock.patch.object(views.ReaderMixin, 'get_reader', return_value=None):
+            slow = self.get(url)
+
+        self.assertEqual(fast.status_code, slow.status_code, url)
+        self.assertEqual(fast.content, slow.content, url)
+        return fast
+
+
+class ReaderOutputTest(ReaderDataMixin, APITestCase):
+    """ Test module for the reader path rendering the same bytes as the serializers """
+
+    def test_lists(self):
+        for name in ['company', 'department', 'employee', 'user']:
+            for params in [{}, {'ordering': '-id'}, {'page_size': 2}]:
+                self.assertSameOutput(reverse(f'{name}-list') + '?' + urlencode(params))
+
+    def test_expanded_lists(self):
+        for params in [
+            {'expand': 'company'},
+            {'expand': 'department'},
+            {'expand': 'department,company'},
+            {'expand': 'company', 'ordering': '-designation'},
+            {'expand': 'department', 'company': self.depts[2].company_id},
+            {'q': 'user'},
+            {'fields': 'designation,id'},
+            {'fields': 'id,department', 'expand': 'company'},
+            {'fields': 'emp_last_name', 'expand': 'department'},
+        ]:
+            self.assertSameOutput(reverse('employee-list') + '?' + urlencode(params))
+        self.assertSameOutput(reverse('department-list') + '?expand=company')
+        self.assertSameOutput(reverse('department-list') + '?ordering=-name')
+        self.assertSameOutput(reverse('department-list') + '?expand=company&fields=name')
+
+    def test_following_pages(self):
+        for name, ordering in [('employee', 'designation'), ('user', '-last_name'), ('company', 'name')]:
+            response = self.assertSameOutput(reverse(f'{name}-list') + f'?ordering={ordering}&page_size=2')
+            next_url = response.json()['next']
+            while next_url:
+                response = self.assertSameOutput(next_url)
+                next_url = response.json()['next']
+
+    def test_details(self):
+        for name, pk in [('company', 2), ('department', 3), ('employee', 1), ('employee', 3), ('user', 2)]:
+            url = reverse(f'{name}-detail', kwargs={'pk': pk})
+            self.assertSameOutput(url)
+            self.assertSameOutput(url + '?expand=company')
+            self.assertSameOutput(url + '?expand=department')
+
+    def test_missing_details(self):
+        for pk in [100, 'abc']:
+            response = self.assertSameOutput(reverse('employee-detail', kwargs={'pk': pk}))
+            self.assertEqual(response.status_code, 404)
+
+    def test_queries(self):
+        # One query for the rows, one for the departments of the page
+        with self.assertNumQueries(2):
+            self.get(reverse('employee-list') + '?expand=company')
+        with self.assertNumQueries(1):
+            self.get(reverse('department-list') + '?expand=company')
+
+
+class FragmentCacheTest(ReaderDataMixin, APITestCase):
+    """ Test module for list pages assembled from cached row fragments """
+
+    def setUp(self):
+        super().setUp()
+        cache.fragments.clear()
+
+    def encoded(self, url):
+        """ Number of rows encoded for ``url``, whose output must match the serializers """
+        misses = cache.fragments.stats()['misses']
+        self.assertSameOutput(url)
+        return cache.fragments.stats()['misses'] - misses
+
+    def test_rows_are_reused(self):
+        url = reverse('employee-list') + '?expand=company'
+        self.assertEqual(self.encoded(url), 5)
+        self.assertEqual(self.encoded(url), 0)
+        # Only the rows of the page are read, not their departments
+        with self.assertNumQueries(1):
+            self.get(url)
+        # Fragments are shared between pages and orderings
+        self.assertEqual(self.encoded(url + '&ordering=-designation&page_size=2'), 0)
+
+    def test_fallback_without_fragments(self):
+        url = reverse('employee-list')
+        with mock.patch.object(readers.Reader, 'render', side_effect=AssertionError):
+            response = self.client.get(url, HTTP_ACCEPT='application/json; indent=4')
+            self.assertEqual(response.status_code, 200)
+            self.get(reverse('user-list'))
+
+    def test_results_not_closing_the_page(self):
+        response = readers.FragmentResponse({'results': [], 'next': None}, [b'{"id":1}', b'{"id":2}'])
+        response.accepted_renderer = JSONRenderer()
+        response.accepted_media_type = 'application/json'
+        response.renderer_context = {}
+        response.render()
+        self.assertEqual(response.data, {'results': [{'id': 1}, {'id': 2}], 'next': None})
+
+    def test_saved_rows_are_encoded_again(self):
+        url = reverse('employee-list')
+        self.encoded(url)
+        emp = Employee.objects.get(pk=2)
+        emp.designation = 'Mg'
+        emp.save(update_fields=['designation'])
+        self.assertEqual(self.encoded(url), 1)
+
+        # The names shown come from the user
+        emp.user.last_name = 'Renamed'
+        emp.user.save()
+        self.assertEqual(self.encoded(url), 1)
+        emp.user.save(update_fields=['last_login'])
+        self.assertEqual(self.encoded(url), 0)
+
+    def test_membership_changes(self):
+        url = reverse('employee-list')
+        self.encoded(url)
+        Employee.objects.get(pk=3).department.add(self.depts[0])
+        self.assertEqual(self.encoded(url), 1)
+        self.depts[2].employee_set.remove(Employee.objects.get(pk=1))
+        self.assertEqual(self.encoded(url), 1)
+        # Employees 1 and 4, and 3 added above
+        self.depts[0].employee_set.clear()
+        self.assertEqual(self.encoded(url), 3)
+
+    def test_related_changes(self):
+        url = reverse('employee-list') + '?expand=company'
+        self.encoded(url)
+        # Department and company names are not versioned per employee
+        Company.objects.filter(pk=self.depts[2].company_id).update(name='Renamed')
+        cache.changed(Company)
+        self.assertEqual(self.encoded(url), 5)
+        self.assertEqual(self.encoded(reverse('employee-list')), 5)
+
+        self.depts[1].delete()
+        self.assertEqual(self.encoded(reverse('employee-list')), 5)
+
+    def test_bulk_writes(self):
+        url = reverse('department-list')
+        self.encoded(url)
+        response = self.client.patch(
+            reverse('department-bulk'), [{'id': self.depts[1].pk, 'name': 'QA'}], format='json',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.encoded(url), 1)
+
+        self.encoded(reverse('employee-list'))
+        response = self.client.patch(
+            reverse('employee-bulk'), [{'id': 3, 'department': [self.depts[1].pk]}], format='json',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.encoded(reverse('employee-list')), 1)
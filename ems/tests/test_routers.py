@@ -0,0 +1,108 @@
+from ems import cache, routers
+from ems.models import Company, Department, Employee
+from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.db import connections
+from django.test import SimpleTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITransactionTestCase
+
+ROUTER = {'READ_DATABASES': ['replica'], 'VIEWSETS': ['EmployeeViewSet'], 'STICKY_SECONDS': 5}
+
+
+class ReadWriteRouterTest(SimpleTestCase):
+    """ Test module for the database router """
+
+    router = routers.ReadWriteRouter()
+
+    def test_primary_by_default(self):
+        self.assertEqual(self.router.db_for_read(Employee), 'default')
+        self.assertEqual(self.router.db_for_write(Employee), 'default')
+
+    def test_reading_from(self):
+        with routers.reading_from('replica'):
+            self.assertEqual(self.router.db_for_read(Employee), 'replica')
+            self.assertEqual(self.router.db_for_read(User), 'replica')
+            self.assertIsNone(self.router.db_for_read(Session))
+        self.assertEqual(self.router.db_for_read(Employee), 'default')
+
+    def test_reads_after_a_write(self):
+        with routers.reading_from('replica'):
+            self.router.db_for_write(Employee)
+            self.assertEqual(self.router.db_for_read(Department), 'default')
+        with routers.reading_from('replica'):
+            self.assertEqual(self.router.db_for_read(Department), 'replica')
+
+    @override_settings(EMS_ROUTER=ROUTER)
+    def test_no_migrations_on_replicas(self):
+        self.assertFalse(self.router.allow_migrate('replica', 'ems'))
+        self.assertIsNone(self.router.allow_migrate('default', 'ems'))
+
+
+@override_settings(EMS_ROUTER=ROUTER)
+class ReplicaReadRequestTest(APITransactionTestCase):
+    """ Test module for the reads of viewsets routed to a replica """
+
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        cache.responses.clear()
+        self.company = Company.objects.create(name='Test Company 1')
+        self.dept = Department.objects.create(name='Engineering', company=self.company)
+        for i in range(3):
+            emp = Employee.objects.create(designation='Jr', user=User.objects.create_user(username=f'user{i}'))
+            emp.department.add(self.dept)
+        self.url = reverse('employee-detail', kwargs={'pk': emp.pk})
+
+    def get(self, url):
+        """ The response to a GET of ``url``, its body and the number of queries it made on each database """
+        with CaptureQueriesContext(connections['default']) as primary, \
+                CaptureQueriesContext(connections['replica']) as replica:
+            response = self.client.get(url)
+            body = b''.join(response.streaming_content) if response.streaming else response.content
+        return response, body, len(primary), len(replica)
+
+    def test_listed_viewsets(self):
+        response, _, primary, replica = self.get(reverse('employee-list') + '?expand=company')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['results']), 3)
+        self.assertEqual(primary, 0)
+        self.assertGreater(replica, 0)
+
+        _, _, primary, replica = self.get(reverse('company-list'))
+        self.assertGreater(primary, 0)
+        self.assertEqual(replica, 0)
+
+    def test_streamed_responses(self):
+        _, body, primary, replica = self.get(reverse('employee-export'))
+        self.assertEqual(len(body.splitlines()), 3)
+        self.assertEqual(primary, 0)
+        self.assertGreater(replica, 0)
+
+    def test_sticky_after_writes(self):
+        response = self.client.patch(self.url, {'designation': 'Sr'}, format='json')
+        self.assertEqual(response.cookies[routers.STICKY_COOKIE]['max-age'], 5)
+        _, _, primary, replica = self.get(self.url)
+        self.assertGreater(primary, 0)
+        self.assertEqual(replica, 0)
+
+        # Failed writes change nothing to read
+        self.client.cookies.clear()
+        response = self.client.patch(self.url, {'designation': 'XX'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertNotIn(routers.STICKY_COOKIE, response.cookies)
+
+        # Nor do writes to viewsets read from the primary anyway
+        response = self.client.patch(
+            reverse('company-detail', kwargs={'pk': self.company.pk}), {'name': 'Renamed'}, format='json',
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn(routers.STICKY_COOKIE, response.cookies)
+
+    @override_settings(EMS_ROUTER={**ROUTER, 'REPLICAS_LAG': True})
+    def test_lagging_replicas(self):
+        response, _, _, _ = self.get(self.url)
+        self.assertNotIn('ETag', response)
+        self.assertEqual(cache.responses.stats()['entries'], 0)
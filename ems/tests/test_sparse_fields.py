@@ -0,0 +1,79 @@
+from unittest import mock
+from ems import cache, views
+from ems.models import Company, Department, Employee
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+from django.contrib.auth.models import User
+
+
+class SparseFieldsTest(APITestCase):
+    """ Test module for selecting response fields with ?fields= """
+
+    def setUp(self):
+        self.company = Company.objects.create(name='Test Company')
+        self.dept = Department.objects.create(name='Engineering', company=self.company)
+        for i in range(3):
+            user = User.objects.create_user(username=f'user{i}', first_name='Test', last_name=f'User {i}')
+            emp = Employee.objects.create(designation='Jr', user=user)
+            emp.department.add(self.dept)
+
+    def get(self, url, params):
+        cache.responses.clear()
+        cache.fragments.clear()
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.json()
+
+    def test_list_fields(self):
+        # Fields keep their usual order
+        results = self.get(reverse('employee-list'), {'fields': 'designation,id'})['results']
+        self.assertEqual(results[0], {'id': 1, 'designation': 'Jr'})
+
+        results = self.get(reverse('department-list'), {'fields': 'name'})['results']
+        self.assertEqual(results, [{'name': 'Engineering'}])
+
+    def test_detail_fields(self):
+        url = reverse('company-detail', kwargs={'pk': self.company.pk})
+        self.assertEqual(self.get(url, {'fields': 'name'}), {'name': 'Test Company'})
+        url = reverse('user-detail', kwargs={'pk': 2})
+        self.assertEqual(self.get(url, {'fields': 'username, last_name'}), {'username': 'user1', 'last_name': 'User 1'})
+
+    def test_expanded_objects_stay_whole(self):
+        results = self.get(reverse('employee-list'), {'fields': 'department', 'expand': 'company'})['results']
+        self.assertEqual(results[0], {'department': [
+            {'id': self.dept.pk, 'name': 'Engineering', 'company': {'id': self.company.pk, 'name': 'Test Company'}},
+        ]})
+
+    def test_unknown_field(self):
+        response = self.client.get(reverse('employee-list'), {'fields': 'id,salary'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.json(), {'fields': ['"salary" is not a valid field.']})
+
+    def test_writes_return_all_fields(self):
+        response = self.client.patch(
+            reverse('company-detail', kwargs={'pk': self.company.pk}) + '?fields=id', {'name': 'Renamed'},
+        )
+        self.assertEqual(response.json(), {'id': self.company.pk, 'name': 'Renamed'})
+
+    def assertQueries(self, params, count, joined):
+        with CaptureQueriesContext(connection) as queries:
+            self.get(reverse('employee-list'), params)
+        self.assertEqual(len(queries), count, params)
+        sql = ' '.join(query['sql'] for query in queries)
+        self.assertEqual('"auth_user"' in sql, joined, params)
+
+    def test_queries_follow_fields(self):
+        # Without the names nor the departments, only the employee table is read
+        self.assertQueries({'fields': 'id,designation'}, 1, joined=False)
+        self.assertQueries({'fields': 'id,emp_last_name'}, 1, joined=True)
+        self.assertQueries({'fields': 'id,department'}, 2, joined=False)
+        self.assertQueries({}, 2, joined=True)
+
+    def test_serializer_queries_follow_fields(self):
+        with mock.patch.object(views.ReaderMixin, 'get_reader', return_value=None):
+            self.assertQueries({'fields': 'id,designation'}, 1, joined=False)
+            self.assertQueries({'fields': 'user,department'}, 2, joined=False)
+            self.assertQueries({}, 2, joined=True)
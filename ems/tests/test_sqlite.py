@@ -0,0 +1,124 @@
+import os
+import sqlite3
+import tempfile
+from unittest import mock
+from ems import serializers, sqlite
+from ems.models import Company
+from django.core.exceptions import ImproperlyConfigured
+from django.db import OperationalError, connection, transaction
+from django.test import SimpleTestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITransactionTestCase
+
+
+class ConnectionProfileTest(SimpleTestCase):
+    """ Test module for the pragmas of SQLite connections """
+
+    databases = {'default'}
+
+    def test_configure(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            db = sqlite3.connect(os.path.join(tmp, 'test.sqlite3'))
+            try:
+                sqlite.configure(db)
+                pragmas = {
+                    name: db.execute(f'PRAGMA {name}').fetchone()[0]
+                    for name in ['journal_mode', 'busy_timeout', 'synchronous', 'cache_size', 'temp_store']
+                }
+            finally:
+                db.close()
+        self.assertEqual(pragmas, {
+            'journal_mode': 'wal', 'busy_timeout': 5000, 'synchronous': 1, 'cache_size': -64000, 'temp_store': 2,
+        })
+
+    def test_new_connections(self):
+        connection.ensure_connection()
+        self.assertEqual(connection.connection.execute('PRAGMA busy_timeout').fetchone()[0], 5000)
+        self.assertEqual(connection.connection.execute('PRAGMA temp_store').fetchone()[0], 2)
+
+
+@mock.patch('ems.sqlite.time.sleep')
+class RetryOnLockTest(TransactionTestCase):
+    """ Test module for retrying write transactions on lock errors """
+
+    def failing(self, *errors):
+        """ A function raising ``errors`` in turn, then creating a company """
+        errors = list(errors)
+
+        def func():
+            if errors:
+                raise OperationalError(errors.pop(0))
+            return Company.objects.create(name='Test Company 1')
+        return mock.Mock(side_effect=func)
+
+    def test_retries_with_backoff(self, sleep):
+        func = self.failing('database is locked', 'database is locked')
+        sqlite.retry_on_lock(func)
+        self.assertEqual(func.call_count, 3)
+        self.assertEqual(Company.objects.count(), 1)
+        first, second = (call.args[0] for call in sleep.call_args_list)
+        self.assertTrue(0.025 <= first <= 0.075 and 0.05 <= second <= 0.15)
+
+    def test_immediate_transaction(self, sleep):
+        with CaptureQueriesContext(connection) as queries:
+            sqlite.retry_on_lock(self.failing())
+        self.assertEqual(queries[0]['sql'], 'BEGIN IMMEDIATE')
+        # Later transactions are deferred again
+        with CaptureQueriesContext(connection) as queries, transaction.atomic():
+            Company.objects.count()
+        self.assertEqual(queries[0]['sql'], 'BEGIN')
+
+    def test_needs_ems_backend(self, sleep):
+        with self.assertRaises(ImproperlyConfigured), sqlite.immediate(mock.Mock(spec=['alias'], alias='other')):
+            pass
+
+    def test_gives_up(self, sleep):
+        func = self.failing(*['database is locked'] * 6)
+        with self.assertRaisesMessage(OperationalError, 'database is locked'):
+            sqlite.retry_on_lock(func)
+        self.assertEqual(func.call_count, 6)
+
+    def test_other_errors(self, sleep):
+        func = self.failing('no such table: ems_company')
+        with self.assertRaises(OperationalError):
+            sqlite.retry_on_lock(func)
+        self.assertEqual(func.call_count, 1)
+
+    def test_enclosing_transaction(self, sleep):
+        func = self.failing('database is locked')
+        with self.assertRaises(OperationalError), transaction.atomic():
+            sqlite.retry_on_lock(func)
+        self.assertEqual(func.call_count, 1)
+
+    def test_rolled_back_before_retry(self, sleep):
+        def func():
+            Company.objects.create(name=f'Test Company {Company.objects.count() + 1}')
+            if func.calls < 1:
+                func.calls += 1
+                raise OperationalError('database is locked')
+        func.calls = 0
+        sqlite.retry_on_lock(func)
+        self.assertEqual(list(Company.objects.values_list('name', flat=True)), ['Test Company 1'])
+
+
+class LockedWriteRequestTest(APITransactionTestCase):
+    """ Test module for write requests retried on lock errors """
+
+    def test_create_retried(self):
+        create = serializers.CompanySerializer.create
+        calls = []
+
+        def locked_once(serializer, validated_data):
+            calls.append(validated_data)
+            if len(calls) == 1:
+                raise OperationalError('database is locked')
+            return create(serializer, validated_data)
+
+        with mock.patch.object(serializers.CompanySerializer, 'create', locked_once), \
+                mock.patch('ems.sqlite.time.sleep'):
+            response = self.client.post(reverse('company-list'), {'name': 'Test Company 1'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(Company.objects.count(), 1)
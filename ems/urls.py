@@ -7,7 +7,11 @@ router.register(r'company', views.CompanyViewSet)
 router.register(r'department', views.DepartmentViewSet)
 router.register(r'employee', views.EmployeeViewSet)
 router.register(r'user', views.UserViewSet)
+router.register(r'jobs', views.JobViewSet)
 
 urlpatterns = [
+    path('cache/', views.cache_stats, name='cache-stats'),
+    path('headcount/', views.headcount_stats, name='headcount'),
+    path('metrics/', views.request_metrics, name='metrics'),
     path('', include(router.urls)),
 ]
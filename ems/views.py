@@ -1,23 +1,525 @@
+import hashlib
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Prefetch
+from django.http import Http404, HttpResponse, StreamingHttpResponse
 from django.shortcuts import render
-from rest_framework.viewsets import ModelViewSet
-from ems.models import Department, Employee, User, Company
-from ems import serializers
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+from rest_framework import status
+from rest_framework.compat import SHORT_SEPARATORS
+from rest_framework.decorators import action, api_view
+from rest_framework.exceptions import APIException, NotFound, ValidationError
+from rest_framework.filters import OrderingFilter
+from rest_framework.generics import get_object_or_404
+from rest_framework.permissions import SAFE_METHODS, BasePermission
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+from rest_framework.reverse import reverse
+from rest_framework.viewsets import ModelViewSet, ReadOnlyModelViewSet
+from ems.models import Department, Employee, Job, User, Company
+from ems import bulk, cache, deletion, export, filters, headcount, jobs, metrics, orgtree, readers, routers, serializers, sqlite
+
+
+class Conflict(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'The batch conflicts with concurrent changes, nothing was saved.'
+    default_code = 'conflict'
+
+
+class LockRetryMixin:
+    """
+    Runs each write request in one transaction, retried with backoff when
+    SQLite reports the database locked (see ems.sqlite).
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method in SAFE_METHODS:
+            return super().dispatch(request, *args, **kwargs)
+        # Keeps the body, so that a retry can parse it again
+        request.body
+        return sqlite.retry_on_lock(super().dispatch, request, *args, **kwargs)
+
+
+class ReplicaReadMixin:
+    """
+    Reads safe requests from a read database when the viewset is listed in
+    ``settings.EMS_ROUTER['VIEWSETS']``. Successful writes to it keep the
+    client on the primary for a while (see ems.routers).
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        database = routers.read_database(self, request)
+        with routers.reading_from(database):
+            response = super().dispatch(request, *args, **kwargs)
+        if database is not None and response.streaming:
+            # Streamed responses query as they are sent, after dispatch
+            response.streaming_content = routers.iterate_from(database, response.streaming_content)
+        if request.method not in SAFE_METHODS and response.status_code < 400:
+            routers.stick(self, response)
+        return response
+
+
+class ExpandMixin:
+    """
+    Reads the comma separated ``?expand=`` query parameter on safe requests
+    and hands it to the serializer context. Writes never expand.
+    """
+    expand_implies = {}
+
+    def get_expand(self):
+        request = getattr(self, 'request', None)
+        if request is None or request.method not in SAFE_METHODS:
+            return frozenset()
+        expand = {name.strip() for name in request.query_params.get('expand', '').split(',')}
+        for name, implied in self.expand_implies.items():
+            if name in expand:
+                expand.update(implied)
+        expand.discard('')
+        return frozenset(expand)
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['expand'] = self.get_expand()
+        return context
+
+
+class SparseFieldsMixin:
+    """
+    Reads the comma separated ``?fields=`` query parameter on safe requests
+    and hands it to the serializer context and the reader. Responses then
+    hold only those fields, and ``get_queryset()`` can leave out the joins
+    and prefetches of the others. Writes always return every field.
+    """
+
+    def get_sparse_fields(self):
+        """ The requested field names, or None for all of them """
+        request = getattr(self, 'request', None)
+        if request is None or request.method not in SAFE_METHODS:
+            return None
+        names = {name.strip() for name in request.query_params.get('fields', '').split(',')}
+        names.discard('')
+        if not names:
+            return None
+        allowed = self.get_serializer_class().Meta.fields
+        for name in sorted(names):
+            if name not in allowed:
+                raise ValidationError({'fields': [f'"{name}" is not a valid field.']})
+        return frozenset(names)
+
+    def wants_field(self, name):
+        fields = self.get_sparse_fields()
+        return fields is None or name in fields
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['fields'] = self.get_sparse_fields()
+        return context
+
+
+class ReaderMixin:
+    """
+    Answers GET list and retrieve with ``reader_class`` (see ems.readers)
+    instead of the serializer. Retrieve keeps the serializer when a
+    permission checks objects, since readers have no instances to check.
+    Compact JSON list pages are assembled from cached row fragments.
+    """
+    reader_class = None
+
+    def get_reader(self):
+        if self.reader_class is None or self.request.method not in ('GET', 'HEAD'):
+            return None
+        expand = self.get_expand() if hasattr(self, 'get_expand') else frozenset()
+        fields = self.get_sparse_fields() if hasattr(self, 'get_sparse_fields') else None
+        return self.reader_class(expand=expand, fields=fields)
+
+    def get_reader_queryset(self, reader):
+        # Keyset pagination reads its positions from the ordering columns
+        return reader.queryset(self.filter_queryset(self.get_queryset()), columns=self.ordering_fields)
+
+    def list(self, request, *args, **kwargs):
+        reader = self.get_reader()
+        if reader is None:
+            return super().list(request, *args, **kwargs)
+
+        queryset = self.get_reader_queryset(reader)
+        page = self.paginate_queryset(queryset)
+        if page is None:
+            return Response(reader.read(queryset))
+
+        encode = self.get_fragment_encoder(reader)
+        if encode is None:
+            return self.get_paginated_response(reader.read(page))
+        page_data = self.get_paginated_response([]).data
+        return readers.FragmentResponse(page_data, reader.render(page, encode))
+
+    def get_fragment_encoder(self, reader):
+        """
+        Encodes one row exactly as the response's JSONRenderer would, or is
+        None when the rendered rows could not be joined into a page.
+        """
+        renderer = self.request.accepted_renderer
+        if (
+            not reader.cache_fragments
+            or not isinstance(renderer, JSONRenderer)
+            or not renderer.compact
+            or renderer.get_indent(self.request.accepted_media_type, self.get_renderer_context()) is not None
+        ):
+            return None
+
+        encoder = renderer.encoder_class(
+            ensure_ascii=renderer.ensure_ascii, allow_nan=not renderer.strict, separators=SHORT_SEPARATORS,
+        )
+
+        def encode(data):
+            # JSONRenderer escapes these two, they are not valid in JavaScript strings
+            return encoder.encode(data).replace('\u2028', '\\u2028').replace('\u2029', '\\u2029').encode()
+        return encode
+
+    def retrieve(self, request, *args, **kwargs):
+        reader = self.get_reader()
+        if reader is None or any(
+            type(permission).has_object_permission is not BasePermission.has_object_permission
+            for permission in self.get_permissions()
+        ):
+            return super().retrieve(request, *args, **kwargs)
+
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        row = get_object_or_404(
+            self.get_reader_queryset(reader), **{self.lookup_field: self.kwargs[lookup_url_kwarg]},
+        )
+        return Response(reader.read([row])[0])
+
+
+class CacheMiss(Exception):
+    """ Raised by a cache-only dispatch that the response cache cannot answer """
+
+
+class CachedResponseMixin:
+    """
+    Serves list and retrieve responses from ``ems.cache.responses``. Entries
+    are keyed by the full path, the media type and the generations of
+    ``cache_models``, the models a response is built from. Only JSON is
+    cached, the browsable API renders per user.
+
+    The same key gives the responses a strong ``ETag`` and the newest
+    generation their ``Last-Modified``, so a conditional GET of an unchanged
+    resource is answered with 304 before any query or serialization.
+
+    A request flagged ``ems_cache_only`` (see ems.asgi) is dispatched without
+    authentication and raises ``CacheMiss`` instead of building a response,
+    leaving its lookup on the request for the dispatch that builds it.
+    """
+    cache_models = ()
+    response_cache_key = None
+    response_validators = None
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if getattr(request._request, 'ems_cache_only', False) and (
+            self.action not in ('list', 'retrieve') or request.accepted_renderer.format != 'json'
+        ):
+            raise CacheMiss()
 
-class CompanyViewSet(ModelViewSet):
+    def perform_authentication(self, request):
+        # Only views that let anyone read are dispatched cache-only
+        if not getattr(request._request, 'ems_cache_only', False):
+            super().perform_authentication(request)
+
+    def list(self, request, *args, **kwargs):
+        return self.cached(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached(super().retrieve, request, *args, **kwargs)
+
+    def cached(self, handler, request, *args, **kwargs):
+        if request.accepted_renderer.format != 'json':
+            return handler(request, *args, **kwargs)
+
+        missed = getattr(request._request, 'ems_cache_miss', None)
+        if missed is not None:
+            self.response_cache_key, self.response_validators = missed
+            return handler(request, *args, **kwargs)
+
+        # Generations are read before the rows, so a concurrent write can
+        # only leave an entry under generations that are already stale
+        generations = cache.generations(self.cache_models)
+        # Absolute, as the links of the pages are
+        key = (request.build_absolute_uri(), request.accepted_media_type, generations)
+
+        etag = quote_etag(hashlib.blake2b(repr(key).encode(), digest_size=16).hexdigest())
+        last_modified = max(generations) // 10 ** 9
+        self.response_validators = (etag, last_modified)
+        not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if not_modified is not None:
+            return not_modified
+
+        hit = cache.responses.get(key)
+        if hit is not None:
+            content, content_type = hit
+            return HttpResponse(content, content_type=content_type)
+        if getattr(request._request, 'ems_cache_only', False):
+            request._request.ems_cache_miss = (key, self.response_validators)
+            raise CacheMiss()
+        self.response_cache_key = key
+        return handler(request, *args, **kwargs)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if routers.lagging_read():
+            self.response_cache_key = self.response_validators = None
+        if self.response_cache_key is not None and response.status_code == status.HTTP_200_OK:
+            with metrics.timed('serialize'):
+                response.render()
+            cache.responses.set(
+                self.response_cache_key,
+                (response.content, response['Content-Type']),
+                len(response.content),
+            )
+        if self.response_validators and response.status_code in (status.HTTP_200_OK, status.HTTP_304_NOT_MODIFIED):
+            etag, last_modified = self.response_validators
+            response['ETag'] = etag
+            response['Last-Modified'] = http_date(last_modified)
+            # Stored copies must be revalidated, which is a cheap 304
+            patch_cache_control(response, no_cache=True)
+        return response
+
+
+class BulkMixin:
+    """
+    Adds ``<resource>/bulk/``. POST a list of objects to create them, PATCH a
+    list of partial objects with their ``id`` to update them, or DELETE a list
+    of ids. The whole batch is validated before anything is written and the
+    writes share one transaction, so a batch is saved completely or not at
+    all. Validation errors come back as a list aligned with the payload.
+    """
+    bulk_serializer_class = None
+    bulk_max_items = 10000
+
+    def get_bulk_serializer(self, *args, **kwargs):
+        kwargs['context'] = self.get_serializer_context()
+        return self.bulk_serializer_class(*args, many=True, **kwargs)
+
+    def validate_bulk_payload(self, data):
+        if not isinstance(data, list):
+            raise ValidationError({'non_field_errors': ['Expected a list of items.']})
+        if len(data) > self.bulk_max_items:
+            raise ValidationError({
+                'non_field_errors': [f'A batch may hold at most {self.bulk_max_items} items.'],
+            })
+
+    def perform_bulk(self, func, *args):
+        try:
+            with transaction.atomic():
+                return func(*args)
+        except IntegrityError:
+            raise Conflict()
+
+    def get_bulk_response(self, objs, status_code):
+        # Read the rows back so the response is built with the prefetches of the list view
+        found = bulk.in_bulk(self.get_queryset(), [obj.pk for obj in objs])
+        serializer = self.get_serializer([found[obj.pk] for obj in objs], many=True)
+        return Response(serializer.data, status=status_code)
+
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        self.validate_bulk_payload(request.data)
+        serializer = self.get_bulk_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        objs = self.perform_bulk(serializer.save)
+        return self.get_bulk_response(objs, status.HTTP_201_CREATED)
+
+    @bulk.mapping.patch
+    def bulk_update(self, request):
+        self.validate_bulk_payload(request.data)
+        serializer = self.get_bulk_serializer(self.get_queryset(), data=request.data, partial=True)
+        serializer.is_valid(raise_exception=True)
+        objs = self.perform_bulk(serializer.save)
+        return self.get_bulk_response(objs, status.HTTP_200_OK)
+
+    @bulk.mapping.delete
+    def bulk_destroy(self, request):
+        self.validate_bulk_payload(request.data)
+        child = serializers.CachedPrimaryKeyRelatedField(queryset=self.get_queryset().model.objects.all())
+        serializer = serializers.BulkListSerializer(
+            child=child, data=request.data, context=self.get_serializer_context(),
+        )
+        serializer.is_valid(raise_exception=True)
+        pks = [obj.pk for obj in serializer.validated_data]
+        self.perform_bulk(deletion.delete_objects, child.queryset.model, pks)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class CascadeDeleteMixin:
+    """
+    Deletes with ``ems.deletion``, in a few statements per batch of rows
+    below the object, rather than loading them all. With ``?async=true``
+    the deletion is queued as a background job instead: the response is
+    202 Accepted with the job, which ``jobs/<id>/`` reports on.
+    """
+
+    def destroy(self, request, *args, **kwargs):
+        instance = self.get_object()
+        if request.query_params.get('async') in ('1', 'true'):
+            job = jobs.submit('ems.delete', instance._meta.label, [instance.pk])
+            url = reverse('job-detail', args=[job.pk], request=request)
+            return Response(serializers.JobSerializer(job).data, status=status.HTTP_202_ACCEPTED, headers={'Location': url})
+        deletion.DELETERS[type(instance)]([instance.pk])
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class CompanyViewSet(ReplicaReadMixin, LockRetryMixin, CachedResponseMixin, ReaderMixin, BulkMixin, CascadeDeleteMixin, SparseFieldsMixin, ModelViewSet):
     queryset = Company.objects.all()
+    reader_class = readers.CompanyReader
+    cache_models = [Company]
     serializer_class = serializers.CompanySerializer
+    bulk_serializer_class = serializers.CompanyBulkSerializer
+    ordering_fields = ['id', 'name']
+    ordering = ['id']
+
+    @action(detail=False, renderer_classes=[JSONRenderer, export.NDJSONRenderer])
+    def tree(self, request):
+        """
+        Every company with its departments and their employees, in three
+        queries. ``?format=ndjson`` streams one company per line.
+        """
+        tree = orgtree.iter_tree()
+        renderer = request.accepted_renderer
+        if renderer.format == 'ndjson':
+            return StreamingHttpResponse(
+                export.ndjson_lines(tree), content_type=f'{renderer.media_type}; charset={renderer.charset}',
+            )
+        return Response(list(tree))
+
+    @action(detail=True, url_path='tree', url_name='detail-tree')
+    def company_tree(self, request, pk=None):
+        """ One company with its departments and their employees """
+        try:
+            company_id = int(pk)
+        except ValueError:
+            raise NotFound()
+        company = next(orgtree.iter_tree([company_id]), None)
+        if company is None:
+            raise NotFound()
+        return Response(company)
 
 
-class DepartmentViewSet(ModelViewSet):
+class DepartmentViewSet(ReplicaReadMixin, LockRetryMixin, CachedResponseMixin, ReaderMixin, BulkMixin, CascadeDeleteMixin, ExpandMixin, SparseFieldsMixin, ModelViewSet):
     queryset = Department.objects.all()
+    reader_class = readers.DepartmentReader
+    cache_models = [Department, Company]
     serializer_class = serializers.DepartmentSerializer
+    bulk_serializer_class = serializers.DepartmentBulkSerializer
+    ordering_fields = ['id', 'name']
+    ordering = ['id']
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if 'company' in self.get_expand() and self.wants_field('company'):
+            queryset = queryset.select_related('company')
+        return queryset
 
-class EmployeeViewSet(ModelViewSet):
+
+class EmployeeViewSet(ReplicaReadMixin, LockRetryMixin, CachedResponseMixin, ReaderMixin, BulkMixin, ExpandMixin, SparseFieldsMixin, ModelViewSet):
     queryset = Employee.objects.all()
+    reader_class = readers.EmployeeReader
+    cache_models = [Employee, User, Department, Company]
     serializer_class = serializers.EmployeeSerializer
+    bulk_serializer_class = serializers.EmployeeBulkSerializer
+    filter_backends = [filters.EmployeeFilterBackend, OrderingFilter]
+    ordering_fields = ['id', 'designation']
+    ordering = ['id']
+    page_size = 100
+    max_page_size = 1000
+    # Companies are reached through departments, so expanding one expands both
+    expand_implies = {'company': {'department'}}
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.wants_field('emp_first_name') or self.wants_field('emp_last_name'):
+            queryset = queryset.select_related('user')
+        if not self.wants_field('department'):
+            return queryset
+
+        expand = self.get_expand()
+        departments = Department.objects.order_by('id')
+        if 'company' in expand:
+            departments = departments.select_related('company')
+        elif 'department' not in expand:
+            departments = departments.only('id')
+        return queryset.prefetch_related(Prefetch('department', queryset=departments))
+
+    @action(detail=False, renderer_classes=[export.NDJSONRenderer, export.CSVRenderer])
+    def export(self, request):
+        """
+        Stream the whole directory, one line per employee, as NDJSON or as
+        CSV with ``?format=csv`` (or the matching Accept header).
+        """
+        renderer = request.accepted_renderer
+        lines = export.csv_lines if renderer.format == 'csv' else export.ndjson_lines
+        response = StreamingHttpResponse(
+            lines(export.iter_employees()),
+            content_type=f'{renderer.media_type}; charset={renderer.charset}',
+        )
+        response['Content-Disposition'] = f'attachment; filename="employees.{renderer.format}"'
+        return response
 
 
-class UserViewSet(ModelViewSet):
+class UserViewSet(ReplicaReadMixin, LockRetryMixin, CachedResponseMixin, ReaderMixin, SparseFieldsMixin, ModelViewSet):
     queryset = User.objects.all()
+    reader_class = readers.UserReader
+    cache_models = [User]
     serializer_class = serializers.UserSerializer
+    ordering_fields = ['id', 'username', 'last_name']
+    ordering = ['id']
+    page_size = 100
+    max_page_size = 1000
+
+
+@api_view(['GET'])
+def cache_stats(request):
+    """ Hit, miss and size counters of this process's response cache """
+    return Response(cache.responses.stats())
+
+
+def request_metrics(request):
+    """ The request histograms of this process in the Prometheus text format, only to ``INTERNAL_IPS`` """
+    if request.META.get('REMOTE_ADDR') not in settings.INTERNAL_IPS:
+        raise Http404()
+    return HttpResponse(metrics.registry.expose(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@api_view(['GET'])
+def headcount_stats(request):
+    """ Employees per designation overall, or of ``?company=`` or ``?department=`` """
+    scope = {}
+    for param, model in [('company', Company), ('department', Department)]:
+        value = request.query_params.get(param)
+        if value is None:
+            continue
+        try:
+            pk = int(value)
+        except ValueError:
+            pk = None
+        # Past what SQLite stores, the lookup would fail rather than find nothing
+        if pk is None or abs(pk) > filters.MAX_ID:
+            raise ValidationError({param: ['A valid integer is required.']})
+        if not model.objects.filter(pk=pk).exists():
+            raise NotFound()
+        scope[f'{param}_id'] = pk
+    return Response(headcount.read(**scope))
+
+
+class JobViewSet(ReadOnlyModelViewSet):
+    """ Background jobs, newest first, with their progress; ``?status=`` keeps those of one status """
+    queryset = Job.objects.all()
+    serializer_class = serializers.JobSerializer
+    ordering_fields = ['id', 'priority']
+    ordering = ['-id']
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if 'status' in self.request.query_params:
+            queryset = queryset.filter(status=self.request.query_params['status'])
+        return queryset